@@ -0,0 +1,270 @@
+from __future__ import annotations
+import os, time, asyncio, argparse, logging, threading
+import multiprocessing as mp
+from typing import Any, AsyncIterator, Callable, Coroutine, Optional
+
+from metrics import REGISTRY
+
+# "1": el LLM y el grafo ReAct de cada agente se construyen en segundo plano y el
+# servidor escucha de inmediato (`GET /ready` informa el estado); "0": en __init__.
+A2A_LAZY_START = os.getenv("A2A_LAZY_START", "1") != "0"
+
+log = logging.getLogger("A2ARuntime")
+
+
+class LoopWorker:
+    """
+    Event loop persistente en un hilo daemon. Los servidores A2A atienden cada
+    request en un hilo síncrono; en vez de crear un loop (y un hilo) por mensaje,
+    todas las corrutinas se envían a este loop, así los clientes httpx de
+    ChatOpenAI y el grafo de LangGraph reutilizan conexiones entre requests.
+    """
+
+    def __init__(self, name: str = "a2a-loop"):
+        self._name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    ready = threading.Event()
+
+                    def _run():
+                        asyncio.set_event_loop(loop)
+                        loop.call_soon(ready.set)
+                        loop.run_forever()
+
+                    self._thread = threading.Thread(target=_run, name=self._name, daemon=True)
+                    self._thread.start()
+                    ready.wait()
+                    self._loop = loop
+        return self._loop
+
+    def submit(self, coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+        """Ejecuta `coro` en el loop persistente y bloquea hasta su resultado."""
+        loop = self.loop
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("submit() llamado desde el propio loop worker; usa 'await' directamente")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+    async def relay(self, agen: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """
+        Itera `agen` en el loop persistente y reenvía cada elemento al loop que
+        consume (p. ej. el del handler de streaming del servidor), para que los
+        clientes ligados al loop worker no se usen desde otro loop.
+        """
+        loop = self.loop
+        consumer = asyncio.get_running_loop()
+        if consumer is loop:
+            async for item in agen:
+                yield item
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def _pump():
+            try:
+                async for item in agen:
+                    consumer.call_soon_threadsafe(queue.put_nowait, (item, None))
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                consumer.call_soon_threadsafe(queue.put_nowait, (done, e))
+            else:
+                consumer.call_soon_threadsafe(queue.put_nowait, (done, None))
+
+        fut = asyncio.run_coroutine_threadsafe(_pump(), loop)
+        try:
+            while True:
+                item, err = await queue.get()
+                if item is done:
+                    if err is not None:
+                        raise err
+                    break
+                yield item
+        finally:
+            fut.cancel()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                if self._thread is not None:
+                    self._thread.join(timeout=5)
+                self._loop, self._thread = None, None
+
+
+_worker = LoopWorker()
+
+
+def run_async(coro: Coroutine[Any, Any, Any]) -> Any:
+    """Puente sync -> async de los agentes: delega en el loop persistente del proceso."""
+    return _worker.submit(coro)
+
+
+def relay_async(agen: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """Itera un generador asíncrono en el loop persistente desde cualquier otro loop."""
+    return _worker.relay(agen)
+
+
+class Warmup:
+    """
+    Construcción diferida de lo pesado de un agente (imports, LLM, grafo ReAct).
+    `start()` la lanza en un hilo; `wait()` bloquea hasta que termine (y la corre
+    en el hilo actual si nadie la había lanzado). Si falla, el siguiente `wait()`
+    la reintenta.
+    """
+
+    def __init__(self, build: Callable[[], None], name: str = "agent"):
+        self._build = build
+        self.name = name
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.ms: Optional[float] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def _claim(self) -> bool:
+        with self._lock:
+            if self.state not in ("pending", "error"):
+                return False
+            self.state = "warming"
+            self._done.clear()
+            return True
+
+    def _run(self) -> None:
+        t0 = time.perf_counter()
+        try:
+            self._build()
+            self.state, self.error = "ready", None
+        except Exception as e:
+            log.exception("warm-up de %s falló", self.name)
+            self.state, self.error = "error", f"{type(e).__name__}: {e}"
+        finally:
+            self.ms = round((time.perf_counter() - t0) * 1000, 1)
+            REGISTRY.set_gauge("a2a_warmup_seconds", self.ms / 1000, agent=self.name)
+            self._done.set()
+
+    def start(self) -> "Warmup":
+        if self._claim():
+            threading.Thread(target=self._run, name=f"warmup-{self.name}", daemon=True).start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        if self._claim():
+            self._run()
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self.name}: warm-up sin terminar tras {timeout}s")
+        if self.state == "error":
+            raise RuntimeError(f"{self.name}: warm-up falló ({self.error})")
+
+    async def wait_async(self) -> None:
+        if self.state != "ready":
+            await asyncio.get_running_loop().run_in_executor(None, self.wait)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def status(self) -> dict:
+        return {"ready": self.ready, "state": self.state, "warmup_ms": self.ms, "error": self.error}
+
+
+class A2AMetricsMixin:
+    """
+    Mixin para servidores A2A: mide cada request (`a2a_request_seconds`) y agrega
+    `GET /metrics` (formato Prometheus) a la app Flask que arma python_a2a.
+    `metrics_snapshot()` aporta gauges propios del agente (cachés, memoria).
+    Con `start_warmup(build)` lo pesado se construye fuera del camino crítico:
+    `GET /ready` responde 503 hasta que termina y los requests que llegan antes
+    esperan a que esté listo.
+    """
+
+    metrics_agent = "agent"
+    _warmup: Optional[Warmup] = None
+
+    def start_warmup(self, build: Callable[[], None]) -> None:
+        self._warmup = Warmup(build, self.metrics_agent)
+        if A2A_LAZY_START:
+            self._warmup.start()
+        else:
+            self._warmup.wait()
+
+    async def ensure_ready(self) -> None:
+        if self._warmup is not None:
+            await self._warmup.wait_async()
+
+    def metrics_snapshot(self) -> dict[str, float]:
+        return {}
+
+    async def _handle_timed(self, message):
+        with REGISTRY.timer("a2a_request_seconds", agent=self.metrics_agent):
+            await self.ensure_ready()
+            return await self._handle_async(message)
+
+    def setup_routes(self, app) -> None:
+        parent = getattr(super(), "setup_routes", None)
+        if callable(parent):
+            parent(app)
+        from flask import Response, jsonify
+
+        @app.route("/metrics", methods=["GET"])
+        def a2a_metrics():
+            body = REGISTRY.render(self.metrics_snapshot())
+            return Response(body, mimetype="text/plain; version=0.0.4")
+
+        @app.route("/ready", methods=["GET"])
+        def a2a_ready():
+            status = self._warmup.status() if self._warmup is not None else {"ready": True, "state": "ready"}
+            return jsonify(status), 200 if status["ready"] else 503
+
+
+def _serve_one(factory: Callable[..., Any], host: str, port: int) -> None:
+    from python_a2a import run_server
+    run_server(factory(host=host, port=port), host=host, port=port)
+
+
+def serve_agent(factory: Callable[..., Any], name: str, default_port: int) -> None:
+    """
+    `__main__` común de los agentes: `--workers N` levanta N procesos (spawn), uno
+    por puerto consecutivo desde `--port`, para listarlos en `A2A_*_URL` separados por comas.
+    """
+    parser = argparse.ArgumentParser(description=f"Servidor A2A: {name}")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=default_port)
+    parser.add_argument("--workers", type=int, default=1, help="réplicas en puertos consecutivos")
+    args = parser.parse_args()
+
+    urls = [f"http://{args.host}:{args.port + i}" for i in range(max(args.workers, 1))]
+    print(f"🚀 {name} escuchando en {','.join(urls)}")
+    if args.workers <= 1:
+        _serve_one(factory, args.host, args.port)
+        return
+
+    ctx = mp.get_context("spawn")
+    procs = [ctx.Process(target=_serve_one, args=(factory, args.host, args.port + i), name=f"{name}-{i}")
+             for i in range(args.workers)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join(timeout=5)
+
+
+REGISTRY.describe("a2a_warmup_seconds", "Duración del warm-up diferido (LLM, grafo ReAct) de cada agente")
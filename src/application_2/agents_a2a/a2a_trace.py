@@ -0,0 +1,79 @@
+"""
+Grabación de tráfico del orquestador hacia los agentes: con A2A_TRACE_PATH cada
+POST de `_post_a2a_envelope` / `_apost_a2a_envelope` agrega una línea JSON
+compacta al archivo (solo append, seguro entre hilos) con el instante, el rol,
+la URL, el texto enviado, el status, la latencia y, opcionalmente, la respuesta.
+`replay.py` vuelve a disparar esas trazas contra cualquier agente.
+"""
+from __future__ import annotations
+import os, json, time, random, threading, contextlib
+from typing import Iterator, Optional
+
+A2A_TRACE_PATH      = os.getenv("A2A_TRACE_PATH") or None
+A2A_TRACE_SAMPLE    = float(os.getenv("A2A_TRACE_SAMPLE", "1.0"))
+A2A_TRACE_RESPONSES = os.getenv("A2A_TRACE_RESPONSES", "1") != "0"
+
+
+class TraceRecorder:
+    """Escritor JSONL de trazas; una línea por request (`ts` = inicio en epoch)."""
+
+    def __init__(self, path: str, sample: float = A2A_TRACE_SAMPLE, responses: bool = A2A_TRACE_RESPONSES):
+        self.path, self.sample, self.responses = path, sample, responses
+        self._lock = threading.Lock()
+        self._file = None
+        self.written = 0
+
+    def _write(self, rec: dict) -> None:
+        line = json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+            self._file.write(line)
+            self.written += 1
+
+    @contextlib.contextmanager
+    def span(self, role: str, url: str, text: str, conversation_id: Optional[str] = None) -> Iterator[dict]:
+        """
+        Mide el bloque y escribe la traza al salir. Quien llama completa `status`
+        y `resp` en el dict; una excepción queda registrada en `err`.
+        """
+        rec = {"ts": round(time.time(), 4), "role": role, "url": url, "conv": conversation_id, "req": text}
+        if self.sample < 1.0 and random.random() >= self.sample:
+            yield rec
+            return
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        except BaseException as e:
+            rec["err"] = type(e).__name__
+            raise
+        finally:
+            rec["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            if not self.responses:
+                rec.pop("resp", None)
+            self._write(rec)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_trace(path: str, roles: Optional[set[str]] = None, limit: Optional[int] = None) -> list[dict]:
+    """Trazas ordenadas por `ts`, opcionalmente filtradas por rol."""
+    out = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            if roles and rec.get("role") not in roles:
+                continue
+            out.append(rec)
+    out.sort(key=lambda r: r["ts"])
+    return out[:limit] if limit else out
+
+
+TRACE: Optional[TraceRecorder] = TraceRecorder(A2A_TRACE_PATH) if A2A_TRACE_PATH else None
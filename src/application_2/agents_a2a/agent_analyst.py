@@ -1,64 +1,80 @@
 
 from __future__ import annotations
-import asyncio, json, traceback, os
+import asyncio, itertools, json, traceback, os, logging, weakref
+from typing import Optional
 from python_a2a import (
     A2AServer, Message, TextContent, MessageRole,
-    run_server, AgentCard, AgentSkill
+    AgentCard, AgentSkill
 )
-from langgraph.checkpoint.memory import InMemorySaver
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
-from langgraph.prebuilt import create_react_agent
 
+from a2a_runtime import A2AMetricsMixin, run_async, serve_agent
+from llm_registry import get_chat_model, registry_stats, scheduler_stats
+from metrics import REGISTRY, MetricsCallback, flatten_stats, log_sampled
+from result_cache import make_cache, make_key
 
-def run_async(coro):
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        return asyncio.run(coro)
-    else:
-        import threading
-        box = {}
-        def _runner():
-            nl = asyncio.new_event_loop()
-            asyncio.set_event_loop(nl)
-            try:
-                box["res"] = nl.run_until_complete(coro)
-            finally:
-                nl.close()
-        t = threading.Thread(target=_runner, daemon=True)
-        t.start(); t.join()
-        return box.get("res")
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+log = logging.getLogger("AgentAnalysis")
 
+# "direct": heurística + a lo sumo una clasificación LLM (con memo); "react": agente ReAct con la tool.
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "direct").strip().lower()
 
-@tool
-def check_sufficiency(response_internet: str, query: str) -> str:
-    """
-    Evalúa si 'response_internet' es suficiente para responder 'query'.
-    Devuelve EXACTAMENTE 'si' o 'no' (minúsculas).
-    Regla rápida + verificación LLM para robustez.
-    """
- 
-    txt = (response_internet or "").strip()
-    q   = (query or "").strip()
+# Micro-batching de clasificaciones de suficiencia (modo direct): junta hasta
+# ANALYSIS_BATCH_MAX pares o espera ANALYSIS_BATCH_WINDOW_MS y los clasifica en una llamada.
+ANALYSIS_BATCH           = os.getenv("ANALYSIS_BATCH", "0") != "0"
+ANALYSIS_BATCH_WINDOW_MS = float(os.getenv("ANALYSIS_BATCH_WINDOW_MS", "5"))
+ANALYSIS_BATCH_MAX       = int(os.getenv("ANALYSIS_BATCH_MAX", "16"))
+
+_VERDICT_CACHE = make_cache(
+    maxsize=int(os.getenv("ANALYSIS_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("ANALYSIS_CACHE_TTL_SEC", "3600")),
+    path=os.getenv("ANALYSIS_CACHE_PATH") or None,
+    table="sufficiency",
+)
+
+_SIGNALS = ["por", "porque", "definición", "consiste", "fue", "es", "incluye"]
+
+# Tools del fast-path de search cuyo resultado correcto ya responde la consulta.
+_DETERMINISTIC_TOOLS = {"math_solve", "unit_convert", "date_arith", "date_arith_bulk", "philosophy_snippet"}
+
+
+def _deterministic_result(path: str, txt: str) -> bool:
+    """True si `txt` viene de una tool determinista del fast-path (`path='fast:<tool>'`) y no trae errores."""
+    kind, _, tool_name = (path or "").partition(":")
+    return kind == "fast" and tool_name in _DETERMINISTIC_TOOLS and bool(txt) and "error:" not in txt
+
+
+def _heuristic_verdict(txt: str, q: str) -> Optional[str]:
+    """Regla rápida: 'no' si el texto se descarta sin LLM, None si hace falta clasificarlo."""
     if not q or not txt:
         return "no"
-
     if len(txt) < 40:
         return "no"
-  
-    signals = sum(s in txt.lower() for s in ["por", "porque", "definición", "consiste", "fue", "es", "incluye"])
+    signals = sum(s in txt.lower() for s in _SIGNALS)
     if signals >= 1 and len(txt) >= 80:
-       
-        pass
-    else:
-       
-        return "no"
+        return None
+    return "no"
 
-    try:
-        model_id = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-        llm = ChatOpenAI(model=model_id, temperature=0)
-        prompt = f"""
+
+def _insufficiency_reason(verdict: str, stage: str, txt: str, q: str) -> str:
+    """Motivo breve de un 'no', para que la siguiente búsqueda sepa qué completar."""
+    if verdict == "si":
+        return ""
+    if stage == "error":
+        return "no se pudo evaluar el texto (fallo del modelo)"
+    if stage in ("llm", "batch", "cache"):
+        return "el texto no responde con claridad la pregunta; falta información específica"
+    if not txt:
+        return "el texto de búsqueda llegó vacío"
+    if txt.startswith("[search_error]") or txt.lower().startswith("error"):
+        return "la búsqueda devolvió un error"
+    if len(txt) < 40:
+        return "el texto es demasiado corto"
+    return "el texto trae datos sueltos pero no una explicación"
+
+
+def _sufficiency_prompt(q: str, txt: str) -> str:
+    return f"""
 Pregunta: {q}
 
 Texto disponible:
@@ -67,17 +83,144 @@ Texto disponible:
 ¿El texto es suficiente para responder con claridad?
 Responde exactamente "si" o "no", en minúsculas, sin explicación.
 """
-        resp = llm.invoke(prompt)
-        verdict = (resp.content or "").strip().lower()
-        if verdict in ("si", "sí"):
-            return "si"
-        return "no"
-    except Exception:
 
-        return "no"
 
+def _parse_verdict(content: Optional[str]) -> str:
+    return "si" if (content or "").strip().lower() in ("si", "sí") else "no"
+
+
+def _batch_prompt(items: list[tuple[str, str]]) -> str:
+    blocks = "\n\n".join(f"### {i}\nPregunta: {q}\nTexto disponible:\n{txt}" for i, (q, txt) in enumerate(items))
+    return f"""
+Para cada caso numerado, decide si el texto es suficiente para responder con claridad su pregunta.
+
+{blocks}
+
+Responde SOLO un objeto JSON {{"verdicts": [{{"id": <número>, "sufficient": "si" | "no"}}, ...]}} con un elemento por caso.
+"""
+
+
+def _parse_batch(content: Optional[str], n: int) -> list[Optional[str]]:
+    """Veredictos por posición; None donde la respuesta no trae el caso."""
+    out: list[Optional[str]] = [None] * n
+    try:
+        data = json.loads(content or "")
+    except (TypeError, ValueError):
+        return out
+    for item in (data.get("verdicts") if isinstance(data, dict) else None) or []:
+        idx = item.get("id") if isinstance(item, dict) else None
+        if isinstance(idx, int) and 0 <= idx < n:
+            out[idx] = _parse_verdict(str(item.get("sufficient", "")))
+    return out
+
+
+class SufficiencyBatcher:
+    """
+    Junta las clasificaciones pendientes de un mismo loop durante `window_ms` (o
+    hasta `max_items`) y las resuelve con una sola llamada en modo JSON; cada
+    llamador recibe su veredicto y su parte del costo del lote (más el de su
+    clasificación individual si la respuesta no cubrió su caso).
+    """
+
+    def __init__(self, llm, window_ms: float = ANALYSIS_BATCH_WINDOW_MS, max_items: int = ANALYSIS_BATCH_MAX):
+        self._llm = llm
+        self._json_llm = llm.bind(response_format={"type": "json_object"})
+        self.window = window_ms / 1000
+        self.max_items = max(max_items, 1)
+        self._pending: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, list]" = weakref.WeakKeyDictionary()
+        self._timers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.TimerHandle]" = \
+            weakref.WeakKeyDictionary()
+        self.batches = self.items = 0
+
+    async def classify(self, query: str, internet_text: str) -> tuple[str, int, dict]:
+        """Devuelve (veredicto, tamaño del lote en que se resolvió, costo atribuido)."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        pending = self._pending.setdefault(loop, [])
+        pending.append((query, internet_text, fut))
+        if len(pending) >= self.max_items:
+            self._flush(loop)
+        elif loop not in self._timers:
+            self._timers[loop] = loop.call_later(self.window, self._flush, loop)
+        return await fut
+
+    def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        timer = self._timers.pop(loop, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(loop, [])
+        if batch:
+            loop.create_task(self._run(batch))
+
+    async def _run(self, batch: list) -> None:
+        n = len(batch)
+        self.batches += 1
+        self.items += n
+        REGISTRY.observe("a2a_analysis_batch_size", n, buckets=(1, 2, 4, 8, 16, 32, 64))
+        REGISTRY.observe("a2a_analysis_batch_fill", n / self.max_items, buckets=(0.1, 0.25, 0.5, 0.75, 1.0))
+        cb = MetricsCallback("analysis")
+        try:
+            if n == 1:
+                q, txt, _ = batch[0]
+                resp = await self._llm.ainvoke(_sufficiency_prompt(q, txt), config={"callbacks": [cb]})
+                verdicts, costs = [_parse_verdict(resp.content)], [cb.cost()]
+            else:
+                resp = await self._json_llm.ainvoke(_batch_prompt([(q, txt) for q, txt, _ in batch]),
+                                                    config={"callbacks": [cb]})
+                verdicts = _parse_batch(resp.content, n)
+                # El costo del lote se reparte en partes iguales entre sus casos.
+                costs = [{k: round(v / n, 4) for k, v in cb.cost().items()} for _ in batch]
+                missing = [i for i, v in enumerate(verdicts) if v is None]
+                if missing:
+                    REGISTRY.inc("a2a_analysis_batch_missing_total", len(missing))
+                    cbs = {i: MetricsCallback("analysis") for i in missing}
+                    singles = await asyncio.gather(*(self._llm.ainvoke(_sufficiency_prompt(*batch[i][:2]),
+                                                                       config={"callbacks": [cbs[i]]})
+                                                     for i in missing))
+                    for i, resp in zip(missing, singles):
+                        verdicts[i] = _parse_verdict(resp.content)
+                        costs[i] = {k: round(v + costs[i].get(k, 0), 4) for k, v in cbs[i].cost().items()}
+        except Exception as e:
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, _, fut), verdict, cost in zip(batch, verdicts, costs):
+            if not fut.done():
+                fut.set_result((verdict, n, cost))
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "items": self.items, "max_items": self.max_items,
+                "avg_batch": round(self.items / self.batches, 3) if self.batches else 0.0}
+
+
+@tool
+def check_sufficiency(response_internet: str, query: str) -> str:
+    """
+    Evalúa si 'response_internet' es suficiente para responder 'query'.
+    Devuelve EXACTAMENTE 'si' o 'no' (minúsculas), o 'error: ...' si el modelo no
+    pudo clasificar. Regla rápida + verificación LLM para robustez.
+    """
+ 
+    txt = (response_internet or "").strip()
+    q   = (query or "").strip()
+    verdict = _heuristic_verdict(txt, q)
+    if verdict is not None:
+        return verdict
+
+    try:
+        llm = get_chat_model(temperature=0, role="analysis")
+        resp = llm.invoke(_sufficiency_prompt(q, txt))
+        return _parse_verdict(resp.content)
+    except Exception as e:
+        # Sin veredicto del LLM (p. ej. SchedulerBusy o 429 agotado): no es un 'no', es un fallo.
+        log.warning("check_sufficiency sin veredicto LLM (%s: %s)", type(e).__name__, e)
+        return f"error: sin veredicto del modelo ({type(e).__name__})"
+
+
+class AnalysisA2A(A2AMetricsMixin, A2AServer):
+    metrics_agent = "analysis"
 
-class AnalysisA2A(A2AServer):
     def __init__(self, host="127.0.0.1", port=8002):
         card = AgentCard(
             name="Agent Analysis (ReAct)",
@@ -86,7 +229,7 @@ class AnalysisA2A(A2AServer):
                 "Usa la herramienta 'check_sufficiency(response_internet, query)' y devuelve 'si' o 'no'."
             ),
             url=f"http://{host}:{port}",
-            version="1.1.0",
+            version="1.2.0",
             skills=[
                 AgentSkill(
                     id="check_sufficiency",
@@ -98,19 +241,10 @@ class AnalysisA2A(A2AServer):
         )
         super().__init__(agent_card=card)
 
-        self._memory = InMemorySaver()
-
-        model_id = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-        self._llm = ChatOpenAI(model=model_id, temperature=0)
-
-        self._agent = create_react_agent(
-            self._llm,
-            tools=[check_sufficiency],
-            name="AgentAnalysisReAct",
-            checkpointer=self._memory,
-        )
-        
-
+        self._memory = None
+        self._mode = ANALYSIS_MODE
+        self._llm = self._agent = self._batcher = None
+        self.start_warmup(self._build)
 
         self._system = (
             "Eres un analista que DEBE usar la herramienta "
@@ -118,26 +252,97 @@ class AnalysisA2A(A2AServer):
             "Tu salida final (último mensaje) debe ser EXACTAMENTE 'si' o 'no' en minúsculas, sin explicación."
         )
 
+    def _build(self) -> None:
+        """LLM, micro-batcher y (en modo react) el grafo ReAct; ver `start_warmup`."""
+        self._llm = get_chat_model(temperature=0, role="analysis")
+        if ANALYSIS_BATCH and self._mode != "react":
+            self._batcher = SufficiencyBatcher(self._llm)
+        if self._mode == "react":
+            from langgraph.prebuilt import create_react_agent
+            from bounded_memory import BoundedMemorySaver, make_history_trimmer
+            self._memory = BoundedMemorySaver()
+            self._agent = create_react_agent(
+                self._llm,
+                tools=[check_sufficiency],
+                name="AgentAnalysisReAct",
+                checkpointer=self._memory,
+                pre_model_hook=make_history_trimmer(),
+            )
+
     @staticmethod
-    def _parse_incoming(message: Message) -> tuple[str, str]:
-        """Soporta entrada JSON {'query','internet_text'} o texto plano."""
+    def _parse_incoming(message: Message) -> tuple[str, str, str]:
+        """Soporta entrada JSON {'query','internet_text','path'} o texto plano."""
+        path = ""
         try:
             parsed = json.loads(message.content.text or "{}")
             query = (parsed.get("query") or "").strip()
             internet_text = (parsed.get("internet_text") or "").strip()
+            path = str(parsed.get("path") or "")
             if not query and isinstance(parsed, str):  
                 query = parsed
         except Exception:
  
             query = (message.content.text or "").strip()
             internet_text = ""
-        return query, internet_text
+        return query, internet_text, path
+
+    async def evaluate_sufficiency(self, query: str, internet_text: str, callbacks: Optional[list] = None,
+                                   path: str = "") -> tuple[str, str]:
+        """
+        Evaluación directa, sin ReAct. Devuelve (veredicto, etapa) donde la etapa es
+        'fast' (resultado de una tool determinista del fast-path de search),
+        'heuristic' (descartado por reglas), 'cache' (veredicto memorizado por hash de
+        query+texto), 'llm' (una sola clasificación), 'batch' (clasificado junto a otros
+        pedidos concurrentes) o 'error' (fallo del modelo).
+        """
+        q, txt = (query or "").strip(), (internet_text or "").strip()
+        if q and _deterministic_result(path, txt):
+            return "si", "fast"
+        verdict = _heuristic_verdict(txt, q)
+        if verdict is not None:
+            return verdict, "heuristic"
+
+        key = make_key("sufficiency", q, txt)
+        if _VERDICT_CACHE is not None:
+            cached = _VERDICT_CACHE.get(key)
+            if cached is not None:
+                return cached, "cache"
+        try:
+            if self._batcher is not None:
+                verdict, size, cost = await self._batcher.classify(q, txt)
+                stage = "batch" if size > 1 else "llm"
+                for cb in callbacks or []:
+                    if isinstance(cb, MetricsCallback):
+                        cb.add_cost(cost)
+            else:
+                resp = await self._llm.ainvoke(_sufficiency_prompt(q, txt), config={"callbacks": callbacks or []})
+                verdict, stage = _parse_verdict(resp.content), "llm"
+        except Exception as e:
+            log.warning(f"[analysis] fallo clasificando suficiencia: {e}")
+            return "no", "error"
+        if _VERDICT_CACHE is not None:
+            _VERDICT_CACHE.set(key, verdict)
+        return verdict, stage
 
     async def _handle_async(self, message: Message) -> Message:
         try:
-            query, internet_text = self._parse_incoming(message)
+            query, internet_text, path = self._parse_incoming(message)
+
+            cb = MetricsCallback("analysis")
+            if self._mode != "react" or _deterministic_result(path, internet_text):
+                verdict, stage = await self.evaluate_sufficiency(query, internet_text, callbacks=[cb], path=path)
+                REGISTRY.inc("a2a_analysis_stage_total", stage=stage, verdict=verdict)
+                reason = _insufficiency_reason(verdict, stage, (internet_text or "").strip(), query)
+                out = json.dumps({"sufficient": verdict, "stage": stage, "reason": reason, "cost": cb.cost()},
+                                 ensure_ascii=False)
+                log_sampled(log, "payload: %s", out)
+                return Message(
+                    content=TextContent(text=out),
+                    role=MessageRole.AGENT,
+                    parent_message_id=message.message_id,
+                    conversation_id=message.conversation_id
+                )
 
-            
             user_msg = (
                 "Evalúa si el texto disponible alcanza para responder con claridad la pregunta dada. "
                 "Debes llamar a la herramienta `check_sufficiency(response_internet, query)` y, "
@@ -145,20 +350,28 @@ class AnalysisA2A(A2AServer):
                 f"Pregunta: {query}\n\nTexto disponible:\n{internet_text}"
             )
 
-            result = await self._agent.ainvoke(
-                {
-                    "messages": [
-                        {"role": "system", "content": self._system},
-                        {"role": "user", "content": user_msg},
-                    ]
-                },
-                {"configurable": {"thread_id": message.conversation_id or "analysis-default"}},
-            )
+            with REGISTRY.timer("a2a_react_seconds", agent="analysis"):
+                result = await self._agent.ainvoke(
+                    {
+                        "messages": [
+                            {"role": "system", "content": self._system},
+                            {"role": "user", "content": user_msg},
+                        ]
+                    },
+                    {"configurable": {"thread_id": message.conversation_id or f"analysis-{message.message_id}"},
+                     "callbacks": [cb]},
+                )
 
          
             verdict = None
+            stage = "react"
             if isinstance(result, dict) and "messages" in result:
                 msgs = result["messages"]
+                # El thread guarda turnos anteriores: sólo cuentan las tools posteriores al último pedido.
+                turn = list(itertools.takewhile(lambda m: getattr(m, "type", None) != "human", reversed(msgs)))
+                if any(getattr(m, "name", None) == "check_sufficiency" and str(m.content).startswith("error")
+                       for m in turn):
+                    stage = "error"
                 if msgs:
                     last = msgs[-1]
                     content = getattr(last, "content", None) if hasattr(last, "content") else last.get("content")
@@ -168,10 +381,14 @@ class AnalysisA2A(A2AServer):
                 verdict = (str(result) or "").strip().lower()
 
      
-            verdict = "si" if verdict in ("si", "sí") else "no"
+            verdict = "si" if verdict in ("si", "sí") and stage != "error" else "no"
 
-            out = json.dumps({"sufficient": verdict}, ensure_ascii=False)
-            print(f"############## payload ##############\n{out}")
+            REGISTRY.inc("a2a_analysis_stage_total", stage=stage, verdict=verdict)
+            reason = _insufficiency_reason(verdict, "llm" if stage == "react" else stage,
+                                           (internet_text or "").strip(), query)
+            out = json.dumps({"sufficient": verdict, "stage": stage, "reason": reason, "cost": cb.cost()},
+                             ensure_ascii=False)
+            log_sampled(log, "payload: %s", out)
             return Message(
                 content=TextContent(text=out),
                 role=MessageRole.AGENT,
@@ -188,12 +405,19 @@ class AnalysisA2A(A2AServer):
                 conversation_id=message.conversation_id
             )
 
+    def memory_stats(self) -> dict:
+        return self._memory.stats() if self._memory is not None else {}
+
+    def metrics_snapshot(self) -> dict[str, float]:
+        cache = _VERDICT_CACHE.stats() if _VERDICT_CACHE is not None else {}
+        return {**flatten_stats("a2a_verdict_cache", cache), **flatten_stats("a2a_memory", self.memory_stats()),
+                **flatten_stats("a2a_analysis_batch", self._batcher.stats() if self._batcher is not None else {}),
+                **flatten_stats("a2a_llm_pool", registry_stats()),
+                **flatten_stats("a2a_llm_sched", scheduler_stats())}
+
     def handle_message(self, message: Message) -> Message:
-        return run_async(self._handle_async(message))
+        return run_async(self._handle_timed(message))
 
 
 if __name__ == "__main__":
-    host, port = "127.0.0.1", 8002
-    print(f"🚀 Agent A2A Analysis (ReAct) escuchando en http://{host}:{port}")
-    run_server(AnalysisA2A(host=host, port=port), host=host, port=port)
-
+    serve_agent(AnalysisA2A, "Agent A2A Analysis (ReAct)", 8002)
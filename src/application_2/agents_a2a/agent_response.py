@@ -1,33 +1,20 @@
 
 from __future__ import annotations
-import asyncio, json, traceback
-from python_a2a import A2AServer, Message, TextContent, MessageRole, run_server, AgentCard, AgentSkill
-from langgraph.checkpoint.memory import InMemorySaver
-from langchain_openai import ChatOpenAI
-
-
-def run_async(coro):
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        return asyncio.run(coro)
-    else:
-        import threading
-        box = {}
-        def _runner():
-            nl = asyncio.new_event_loop()
-            asyncio.set_event_loop(nl)
-            try:
-                box["res"] = nl.run_until_complete(coro)
-            finally:
-                nl.close()
-        t = threading.Thread(target=_runner, daemon=True)
-        t.start()
-        t.join()
-        return box.get("res")
-
-
-class ResponseA2A(A2AServer):
+import json, traceback, logging
+from typing import AsyncIterator
+from python_a2a import A2AServer, Message, TextContent, MessageRole, AgentCard, AgentSkill
+
+from a2a_runtime import A2AMetricsMixin, run_async, serve_agent, relay_async
+from llm_registry import get_chat_model, registry_stats, scheduler_stats
+from metrics import MetricsCallback, flatten_stats, log_sampled
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+log = logging.getLogger("AgentResponse")
+
+
+class ResponseA2A(A2AMetricsMixin, A2AServer):
+    metrics_agent = "response"
+
     def __init__(self, host="127.0.0.1", port=8003):
         card = AgentCard(
             name="Agent Response",
@@ -37,20 +24,23 @@ class ResponseA2A(A2AServer):
             authentication=None
         )
         super().__init__(agent_card=card)
-        self._memory = InMemorySaver()
-        self._llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.2)
+        self._llm = None
+        self.start_warmup(self._build)
 
-    async def _handle_async(self, message: Message) -> Message:
+    def _build(self) -> None:
+        self._llm = get_chat_model(temperature=0.2, role="response")
+
+    @staticmethod
+    def _build_prompt(message: Message) -> str:
         try:
-            try:
-                parsed = json.loads(message.content.text or "{}")
-            except Exception:
-                parsed = {}
+            parsed = json.loads(message.content.text or "{}")
+        except Exception:
+            parsed = {}
 
-            query = (parsed.get("query") or "").strip()
-            internet_text = (parsed.get("internet_text") or "").strip()
+        query = (parsed.get("query") or "").strip()
+        internet_text = (parsed.get("internet_text") or "").strip()
 
-            prompt = f"""
+        return f"""
 Responde en español, breve y claro.
 
 Pregunta: {query}
@@ -61,11 +51,35 @@ Contexto disponible (puede estar vacío):
 - Si el contexto alcanza, responde directo.
 - Si no alcanza, da la mejor respuesta general y di qué faltaría para ser más preciso.
 """
-            resp = await self._llm.ainvoke(prompt)
+
+    async def _stream_tokens(self, prompt: str) -> AsyncIterator[str | dict]:
+        cb = MetricsCallback("response")
+        async for chunk in self._llm.astream(prompt, config={"callbacks": [cb]}):
+            text = chunk.content if isinstance(chunk.content, str) else ""
+            if text:
+                yield text
+        yield {"cost": cb.cost()}
+
+    async def stream_response(self, message: Message) -> AsyncIterator[str | dict]:
+        """
+        Variante streaming (endpoint `/stream` de python_a2a, SSE): emite los tokens
+        de la respuesta a medida que el modelo los genera. El LLM corre en el loop
+        persistente del agente y los fragmentos se reenvían al loop del servidor.
+        El último evento es `{"cost": ...}`, el mismo costo que informa el POST.
+        """
+        await self.ensure_ready()
+        async for text in relay_async(self._stream_tokens(self._build_prompt(message))):
+            yield text
+
+    async def _handle_async(self, message: Message) -> Message:
+        try:
+            prompt = self._build_prompt(message)
+            cb = MetricsCallback("response")
+            resp = await self._llm.ainvoke(prompt, config={"callbacks": [cb]})
             final_answer = (resp.content or "").strip() or "No fue posible formular la respuesta."
 
-            out = json.dumps({"final_answer": final_answer}, ensure_ascii=False)
-            print(f"############## payload ##############\n{out}")
+            out = json.dumps({"final_answer": final_answer, "cost": cb.cost()}, ensure_ascii=False)
+            log_sampled(log, "payload: %s", out)
             return Message(
                 content=TextContent(text=out),
                 role=MessageRole.AGENT,
@@ -76,8 +90,12 @@ Contexto disponible (puede estar vacío):
             err = {"error": str(e), "trace": traceback.format_exc()}
             return Message(content=TextContent(text=json.dumps(err, ensure_ascii=False)), role=MessageRole.AGENT)
 
+    def metrics_snapshot(self) -> dict[str, float]:
+        return {**flatten_stats("a2a_llm_pool", registry_stats()),
+                **flatten_stats("a2a_llm_sched", scheduler_stats())}
+
     def handle_message(self, message: Message) -> Message:
-        return run_async(self._handle_async(message))
+        return run_async(self._handle_timed(message))
 
 if __name__ == "__main__":
-    run_server(ResponseA2A(), host="127.0.0.1", port=8003)
+    serve_agent(ResponseA2A, "Agent A2A Response", 8003)
@@ -1,52 +1,85 @@
 from __future__ import annotations
 import asyncio, json, traceback, os, logging, re
-from datetime import datetime, timedelta
-from typing import Optional
+from contextvars import ContextVar
+from typing import Any, Callable, Optional, Union
 
 from python_a2a import (
     A2AServer, Message, TextContent, MessageRole,
-    run_server, AgentCard, AgentSkill
+    AgentCard, AgentSkill
 )
-from langgraph.checkpoint.memory import InMemorySaver
-from langchain_openai import ChatOpenAI
-from langchain_core.tools import tool
-from langgraph.prebuilt import create_react_agent
+from langchain_core.tools import BaseTool, StructuredTool, tool
+
+from a2a_runtime import A2AMetricsMixin, run_async, serve_agent
+from llm_registry import OPENAI_MODEL, get_chat_model, registry_stats, scheduler_stats
+from math_pool import MATH_POOL
+from metrics import REGISTRY, MetricsCallback, flatten_stats, log_sampled
+from philo_kb import load_kb
+from bm25_index import BM25Index
+from result_cache import LRUTTLCache, make_cache, make_key, normalize_text
+import dates, units
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger("AgentSearchReAct")
 
+SEARCH_FAST_PATH = os.getenv("SEARCH_FAST_PATH", "1") != "0"
 
-def run_async(coro):
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        return asyncio.run(coro)
-    else:
-        import threading
-        box = {}
-        def _runner():
-            nl = asyncio.new_event_loop()
-            asyncio.set_event_loop(nl)
-            try:
-                box["res"] = nl.run_until_complete(coro)
-            finally:
-                nl.close()
-        t = threading.Thread(target=_runner, daemon=True); t.start(); t.join()
-        return box.get("res")
+# Caché de resultados de las tools (memoria o SQLite compartido si SEARCH_CACHE_PATH está definido).
+_SEARCH_CACHE = make_cache(
+    maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL_SEC", "3600")),
+    path=os.getenv("SEARCH_CACHE_PATH") or None,
+    table="search_tools",
+)
 
 
+def search_cache_stats() -> dict:
+    return _SEARCH_CACHE.stats() if _SEARCH_CACHE is not None else {"backend": "disabled"}
 
 
-_sympy = None
-def _get_sympy():
-    global _sympy
-    if _sympy is None:
-        try:
-            import sympy as sp
-            _sympy = sp
-        except Exception as e:
-            _sympy = e  
-    return _sympy
+# Memo de tools por conversación: en una re-búsqueda el agente ReAct reutiliza lo
+# que ya calculó para ese conversation_id y sólo llama de verdad lo que falta.
+_TOOL_MEMO = LRUTTLCache(maxsize=int(os.getenv("SEARCH_MEMO_SIZE", "4096")),
+                         ttl=float(os.getenv("SEARCH_MEMO_TTL_SEC", "900")))
+_MEMO_SCOPE: ContextVar[Optional[str]] = ContextVar("search_memo_scope", default=None)
+
+
+def _memoized(t: BaseTool) -> BaseTool:
+    """Copia de `t` que consulta el memo de la conversación activa; los 'error: ...' no se guardan."""
+    def run(**kwargs) -> str:
+        scope = _MEMO_SCOPE.get()
+        if scope is None:
+            return t.invoke(kwargs)
+        key = make_key(scope, t.name, kwargs)
+        hit = _TOOL_MEMO.get(key)
+        REGISTRY.inc("a2a_search_memo_total", tool=t.name, result="hit" if hit is not None else "miss")
+        if hit is not None:
+            return hit
+        result = str(t.invoke(kwargs))
+        if not result.startswith("error"):
+            _TOOL_MEMO.set(key, result)
+        return result
+
+    return StructuredTool.from_function(func=run, name=t.name, description=t.description, args_schema=t.args_schema)
+
+
+# Corpus local (índice BM25, ver bm25_index.py): se consulta antes del resumen con LLM.
+SEARCH_INDEX_PATH      = os.getenv("SEARCH_INDEX_PATH") or None
+SEARCH_LOCAL_TOP_K     = int(os.getenv("SEARCH_LOCAL_TOP_K", "3"))
+SEARCH_LOCAL_MIN_SCORE = float(os.getenv("SEARCH_LOCAL_MIN_SCORE", "2.0"))
+LOCAL_INDEX = BM25Index(SEARCH_INDEX_PATH) if SEARCH_INDEX_PATH else None
+
+
+def _local_passages(query: str) -> Optional[str]:
+    """Pasajes top-k del corpus local si el mejor supera SEARCH_LOCAL_MIN_SCORE; si no, None."""
+    if LOCAL_INDEX is None:
+        return None
+    hits = LOCAL_INDEX.search(query, SEARCH_LOCAL_TOP_K)
+    if not hits or hits[0][0] < SEARCH_LOCAL_MIN_SCORE:
+        REGISTRY.inc("a2a_local_search_total", result="miss")
+        return None
+    REGISTRY.inc("a2a_local_search_total", result="hit")
+    return "\n".join(f"[{doc_id}] {text}" for score, doc_id, text in hits if score >= SEARCH_LOCAL_MIN_SCORE)
+
 
 _ALLOWED_EXPR = re.compile(r"^[0-9\.\+\-\*\/\^\(\)\s xX=]*$")
 
@@ -55,7 +88,8 @@ def math_solve(expression: str) -> str:
     """
     Resuelve una expresión/ecuación simple en 'x'. Soporta +,-,*,/,^, paréntesis,
     '=' para ecuaciones y funciones básicas de sympy (si están presentes).
-    Devuelve resultado exacto/aprox o 'error: ...' si no puede.
+    Devuelve resultado exacto/aprox o 'error: ...' si no puede. Se evalúa en un
+    pool de procesos con límites de CPU/memoria/tiempo y caché por expresión.
     """
     log.info(f"[TOOL] Invocada con math_solve: {expression}")
     expr = (expression or "").strip()
@@ -65,30 +99,20 @@ def math_solve(expression: str) -> str:
     if not _ALLOWED_EXPR.match(expr.replace("^","**")) and not any(k in expr for k in ("sin","cos","tan","pi","exp","log")):
         return "error: caracteres no permitidos"
 
-    sp = _get_sympy()
-    if isinstance(sp, Exception):
-        return f"error: sympy no está disponible ({sp})"
-
-    try:
-        expr_norm = expr.replace("^", "**")
-        x = sp.symbols('x')
-        if "=" in expr_norm:
-            lhs, rhs = expr_norm.split("=", 1)
-            sol = sp.solve(sp.Eq(sp.sympify(lhs), sp.sympify(rhs)), x)
-            return f"solución: {sol}"
-        val = sp.sympify(expr_norm)
-        exacto = sp.simplify(val)
-        aprox = exacto.evalf()
-        return f"resultado: {exacto} ; aproximado: {aprox}"
-    except Exception as e:
-        return f"error: no se pudo interpretar la expresión ({e})"
-
-_PHILO = {
-    "platón": "Platón (427–347 a. C.) defendió el mundo de las Formas: realidades inmutables que fundamentan lo sensible.",
-    "aristóteles": "Aristóteles (384–322 a. C.) propuso una metafísica de sustancias, causa final y ética de la virtud.",
-    "kant": "Immanuel Kant (1724–1804) distingue fenómeno y noúmeno, y fundamenta la moral en el imperativo categórico.",
-    "nietzsche": "Friedrich Nietzsche (1844–1900) critica la moral tradicional y proclama la transvaloración de todos los valores."
-}
+    return MATH_POOL.solve(expr.replace("^", "**"))
+
+# Semilla curada; con PHILO_KB_PATH se usa el corpus completo (ver philo_kb.py).
+_PHILO_SEED = [
+    {"name": "Platón", "aliases": ["platon", "plato", "teoría de las formas", "mundo de las ideas"],
+     "text": "Platón (427–347 a. C.) defendió el mundo de las Formas: realidades inmutables que fundamentan lo sensible."},
+    {"name": "Aristóteles", "aliases": ["aristoteles", "el estagirita", "ética de la virtud"],
+     "text": "Aristóteles (384–322 a. C.) propuso una metafísica de sustancias, causa final y ética de la virtud."},
+    {"name": "Kant", "aliases": ["immanuel kant", "imperativo categórico", "noúmeno"],
+     "text": "Immanuel Kant (1724–1804) distingue fenómeno y noúmeno, y fundamenta la moral en el imperativo categórico."},
+    {"name": "Nietzsche", "aliases": ["friedrich nietzsche", "superhombre", "transvaloración de los valores"],
+     "text": "Friedrich Nietzsche (1844–1900) critica la moral tradicional y proclama la transvaloración de todos los valores."},
+]
+PHILO_KB = load_kb(_PHILO_SEED)
 
 @tool
 def philosophy_snippet(topic: str) -> str:
@@ -97,84 +121,197 @@ def philosophy_snippet(topic: str) -> str:
     Si no hay entrada exacta, sugiere cómo precisar la consulta.
     """
     log.info(f"[TOOL] Invocada con philosophy_snippet: {topic}")
-    key = (topic or "").strip().lower()
-    for k, v in _PHILO.items():
-        if k in key:
-            return v
-    return "No tengo un snippet curado para ese tema. Di el nombre del filósofo (p. ej., 'Kant') o el concepto central."
-
+    hits = PHILO_KB.search(topic or "")
+    if not hits:
+        return "No tengo un snippet curado para ese tema. Di el nombre del filósofo (p. ej., 'Kant') o el concepto central."
+    text = PHILO_KB.entry(hits[0][0])[1]
+    related = [PHILO_KB.entry(idx)[0] for idx, _ in hits[1:]]
+    return f"{text} (Relacionado: {', '.join(related)})" if related else text
 
-_FACTORS = {
-    ("km","m"): 1000.0, ("m","km"): 1/1000.0,
-    ("mi","km"): 1.60934, ("km","mi"): 1/1.60934,
-    ("lb","kg"): 0.453592, ("kg","lb"): 1/0.453592,
-}
-def _celsius_to_f(v): return (v - 32) * 5/9
-def _f_to_c(v): return v * 9/5 + 32
 
 @tool
-def unit_convert(value: float, from_unit: str, to_unit: str) -> str:
+def unit_convert(value: Union[float, list[float]], from_unit: str, to_unit: str) -> str:
     """
-    Convierte entre unidades comunes: km<->m, km<->mi, kg<->lb, °C<->°F.
-    Ej: unit_convert(10, "km", "mi")
+    Convierte entre unidades de la misma dimensión (longitud, masa, temperatura,
+    volumen, tiempo, velocidad): km, m, cm, mi, ft, in, kg, lb, oz, °C, °F, K, l, gal, h...
+    Acepta un valor o una lista de valores (se convierten todos en una llamada).
+    Ej: unit_convert(10, "km", "mi") ; unit_convert([1, 2.5, 7], "lb", "kg")
     """
     log.info(f"[TOOL] Invocada con unit_convert: {value}{from_unit}{to_unit}")
-    fu, tu = (from_unit or "").strip().lower(), (to_unit or "").strip().lower()
     try:
-        if (fu, tu) in _FACTORS:
-            return f"{value * _FACTORS[(fu, tu)]:.6g} {tu}"
-        if fu in ("c","°c","celsius") and tu in ("f","°f","fahrenheit"):
-            return f"{_f_to_c(value):.6g} °F"
-        if fu in ("f","°f","fahrenheit") and tu in ("c","°c","celsius"):
-            return f"{_celsius_to_f(value):.6g} °C"
+        out = units.convert(value, from_unit, to_unit)
+    except ValueError:
         return "error: conversión no soportada"
     except Exception as e:
         return f"error: {e}"
+    unit = units.label(units.canonical(to_unit))
+    if isinstance(out, list):
+        return "[" + ", ".join(f"{v:.6g}" for v in out) + f"] {unit}"
+    return f"{out:.6g} {unit}"
 
 
-_DATE_RX = re.compile(r"^\s*(\d{4}-\d{2}-\d{2})\s*([+\-])\s*(\d+)\s*d(ías|ias)?\s*$", re.I)
-
 @tool
 def date_arith(expression: str) -> str:
     """
-    Suma/resta días: 'YYYY-MM-DD + 10 d' o '2025-08-17 - 3 dias'.
+    Aritmética de fechas: 'YYYY-MM-DD + 10 d', '2025-08-17 - 3 dias', '+ 2 semanas',
+    '+ 1 mes', '+ 5 hábiles' o la diferencia '2025-12-25 - 2025-10-17' (días entre ambas).
     """
     log.info(f"[TOOL] Invocada con date_arith: {expression}")
-    s = (expression or "").strip()
-    m = _DATE_RX.match(s)
-    if not m:
-        return "error: formato esperado 'YYYY-MM-DD +/- N d'"
-    ds, sign, n, _ = m.groups()
+    return dates.evaluate([(expression or "").strip()])[0]
+
+
+@tool
+def date_arith_bulk(expressions: Optional[list[str]] = None, base: Optional[str] = None,
+                    offsets: Optional[list[int]] = None, unit: str = "d") -> str:
+    """
+    Muchas operaciones de fechas en una sola llamada: una lista de expresiones con
+    el formato de `date_arith`, o una fecha `base` con una lista de `offsets` en
+    la unidad `unit` (d, w, m, b=hábiles). Devuelve una línea por resultado.
+    """
+    log.info(f"[TOOL] Invocada con date_arith_bulk: {len(expressions or offsets or [])} operaciones")
     try:
-        base = datetime.strptime(ds, "%Y-%m-%d")
-        delta = timedelta(days=int(n))
-        res = base + (delta if sign == "+" else -delta)
-        return f"{res.strftime('%Y-%m-%d')}"
+        if expressions:
+            return "\n".join(f"{e} => {r}" for e, r in zip(expressions, dates.evaluate(expressions)))
+        if base and offsets:
+            u = dates.offset_unit(unit)
+            if u is None:
+                return f"error: unidad no soportada ({unit})"
+            out = dates.shift([base] * len(offsets), offsets, u)
+            return "\n".join(f"{base} {'+' if n >= 0 else '-'} {abs(n)} {u} => {r}" for n, r in zip(offsets, out))
+        return "error: indica 'expressions' o 'base' + 'offsets'"
     except Exception as e:
         return f"error: {e}"
 
 
+@tool
+def local_search(query: str) -> str:
+    """
+    Busca en la documentación interna (corpus local indexado) y devuelve los
+    pasajes más relevantes, o 'error: ...' si no hay coincidencias suficientes.
+    """
+    log.info(f"[TOOL] Invocada con local_search: {query}")
+    return _local_passages(query) or "error: sin pasajes relevantes en el corpus local"
+
+
 @tool
 def general_search_summary(query: str) -> str:
     """
     Genera un resumen breve (3–6 líneas) informativo sobre la consulta.
-    Usa OpenAI internamente. Úsalo como fallback cuando no aplique otra tool.
+    Primero consulta el corpus local; sólo si no hay coincidencias usa OpenAI.
+    Úsalo como fallback cuando no aplique otra tool.
     """
     log.info(f"[TOOL] Invocada con general_search_summary: {query}")
-    model_id = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    llm = ChatOpenAI(model=model_id, temperature=0.1)
+    local = _local_passages(query)
+    if local is not None:
+        return local
+    temperature = 0.1
+    key = make_key("general_search_summary", normalize_text(query), OPENAI_MODEL, temperature)
+    if _SEARCH_CACHE is not None:
+        cached = _SEARCH_CACHE.get(key)
+        if cached is not None:
+            log.info("[TOOL] general_search_summary: hit de caché")
+            return cached
+    llm = get_chat_model(temperature=temperature, role="search")
     system = ("Eres un asistente que redacta un resumen estilo 'resultado de búsqueda'. "
               "Sé conciso (3–6 líneas), neutral y útil. No inventes enlaces ni datos dudosos.")
     user = f"Tema/Pregunta:\n{query}\n\nEscribe un resumen breve y práctico (3–6 líneas)."
     try:
         resp = llm.invoke([{"role":"system","content":system},{"role":"user","content":user}])
-        return (resp.content or "").strip() or "No se encontraron elementos claros para resumir."
+        text = (resp.content or "").strip()
+        if not text:
+            return "No se encontraron elementos claros para resumir."
+        if _SEARCH_CACHE is not None:
+            _SEARCH_CACHE.set(key, text)
+        return text
     except Exception as e:
         return f"[search_error] fallo en OpenAI: {e}"
 
 
-class SearchA2A(A2AServer):
-    def __init__(self, host: str = "127.0.0.1", port: int = 8001):
+# ---------------------------------------------------------------------------
+# Fast-path: reglas deterministas que resuelven consultas obvias sin el ReAct.
+# Una regla recibe la consulta y devuelve (tool, args) o None si no aplica.
+# ---------------------------------------------------------------------------
+FastRule = Callable[[str], Optional[tuple[BaseTool, dict[str, Any]]]]
+
+_ISO_DATE_RX = re.compile(r"\d{4}-\d{2}-\d{2}")
+_NUM = r"-?\d+(?:[.,]\d+)?"
+_UNIT_RX = re.compile(rf"^\s*({_NUM}(?:\s*;\s*{_NUM})*)\s*([a-záéíóú°/0-9]+)\s+(?:to|a|en|->)\s+([a-záéíóú°/0-9]+)\s*\??\s*$", re.I)
+_MATH_VERB_RX = re.compile(r"^(?:calcul[ae]r?|resuelve|resolver|eval[uú]a|simplifica|cu[aá]nto\s+(?:es|da)"
+                           r"|solve|calculate|compute)\s*:?\s+", re.I)
+_MATH_SIGNAL_RX = re.compile(r"[\dxX)]\s*[+*/^]\s*[\dxX(]|\s-\s|[=xX]")
+_DASHED_NUMBER_RX = re.compile(r"^\+?\d+(?:[-\s]\d+)+$")   # rangos '1990-2000' y teléfonos '555-1234'
+_PHILO_LEAD_RX = re.compile(r"^(?:qui[eé]n\s+(?:fue|es|era)|h[aá]blame\s+(?:de|sobre)|qu[eé]\s+(?:pens[oó]|propuso|dijo)"
+                            r"|qu[eé]\s+es)\s+(?:(?:el|la|los|las)\s+)?", re.I)
+
+
+def _rule_date(query: str):
+    parts = [p.strip() for p in query.strip().rstrip("?").split(";") if p.strip()]
+    if not parts or not all(dates.is_date_expression(p) for p in parts):
+        return None
+    if len(parts) == 1:
+        return date_arith, {"expression": parts[0]}
+    return date_arith_bulk, {"expressions": parts}
+
+def _rule_units(query: str):
+    m = _UNIT_RX.match(query)
+    if not m:
+        return None
+    raw, fu, tu = m.groups()
+    if units.factor(fu, tu) is None:
+        return None
+    values = [float(v.replace(",", ".")) for v in raw.split(";")]
+    return unit_convert, {"value": values if len(values) > 1 else values[0], "from_unit": fu, "to_unit": tu}
+
+def _math_expression(query: str) -> Optional[str]:
+    """
+    Expresión aritmética explícita de la consulta, o None. Además de un operador
+    exige una señal clara: verbo de cálculo, variable x, '=', un operador entre
+    operandos o un '-' con espacios. Un número con guiones se toma como rango o
+    teléfono, no como resta.
+
+    >>> [_math_expression(q) for q in ("2+2", "3 - 1", "x^2 = 4", "calcula 10-3", "¿cuánto es 7*6?")]
+    ['2+2', '3 - 1', 'x^2 = 4', '10-3', '7*6']
+    >>> [_math_expression(q) for q in ("555-1234", "1990-2000", "555-123-4567", "+54 11 5555-1234", "10-3", "2025")]
+    [None, None, None, None, None, None]
+    """
+    text = query.strip().strip("¿?¡! ")
+    verb = _MATH_VERB_RX.match(text)
+    expr = text[verb.end():].strip() if verb else text
+    if not expr or _ISO_DATE_RX.search(expr) or not any(c.isdigit() for c in expr):
+        return None
+    if not _ALLOWED_EXPR.match(expr.replace("^", "**")):
+        return None
+    if not any(op in expr for op in "+-*/^="):
+        return None
+    if not verb and (_DASHED_NUMBER_RX.match(expr) or not _MATH_SIGNAL_RX.search(expr)):
+        return None
+    return expr
+
+def _rule_math(query: str):
+    expr = _math_expression(query)
+    return (math_solve, {"expression": expr}) if expr else None
+
+def _rule_local(query: str):
+    return (local_search, {"query": query}) if LOCAL_INDEX is not None else None
+
+def _rule_philosophy(query: str):
+    topic = _PHILO_LEAD_RX.sub("", query.strip().strip("¿?¡!. ")).strip()
+    return (philosophy_snippet, {"topic": topic}) if PHILO_KB.exact(topic) is not None else None
+
+
+DEFAULT_FAST_RULES: list[FastRule] = [_rule_date, _rule_units, _rule_math, _rule_philosophy, _rule_local]
+
+
+def _fast_internet_text(tool_name: str, query: str, result: str) -> str:
+    if tool_name in ("philosophy_snippet", "local_search"):
+        return result
+    return f"Resultado de la herramienta {tool_name} para «{query}»: {result}"
+
+
+class SearchA2A(A2AMetricsMixin, A2AServer):
+    metrics_agent = "search"
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8001, fast_rules: Optional[list[FastRule]] = None):
         card = AgentCard(
             name="Agent Search (ReAct)",
             description=(
@@ -186,60 +323,104 @@ class SearchA2A(A2AServer):
             skills=[
                 AgentSkill(id="general_search_summary", name="general_search_summary",
                            description="Genera un 'internet_text' breve y útil (3–6 líneas)"),
+                AgentSkill(id="local_search", name="local_search",
+                           description="Pasajes relevantes de la documentación interna (BM25 local)"),
                 AgentSkill(id="math_solve", name="math_solve",
                            description="Resolver expresiones/ecuaciones simples"),
                 AgentSkill(id="philosophy_snippet", name="philosophy_snippet",
                            description="Snippet filosófico curado (2–4 líneas)"),
                 AgentSkill(id="unit_convert", name="unit_convert",
-                           description="Conversión básica de unidades"),
+                           description="Conversión de unidades (un valor o una lista de valores)"),
                 AgentSkill(id="date_arith", name="date_arith",
-                           description="Suma/resta de días en fechas"),
+                           description="Suma/resta de días, semanas, meses o días hábiles y diferencia entre fechas"),
+                AgentSkill(id="date_arith_bulk", name="date_arith_bulk",
+                           description="Muchas operaciones de fechas en una sola llamada"),
             ],
             authentication=None
         )
         super().__init__(agent_card=card)
+        MATH_POOL.warm_in_background()
 
-        model_id = "gpt-4o-mini"
         if not os.getenv("OPENAI_API_KEY"):
             log.warning("OPENAI_API_KEY no está definida; el agente podría fallar.")
-        self._llm = ChatOpenAI(model=model_id, temperature=0)
-
+        self._memory = None
+        self._llm = self._agent = None
+        self.start_warmup(self._build)
 
-        self._memory = InMemorySaver()
-
-        self._agent = create_react_agent(
-            self._llm,
-            tools=[math_solve, philosophy_snippet, unit_convert, date_arith, general_search_summary],
-            name="AgentSearchReAct",
-            checkpointer=self._memory
-        )
+        self._fast_rules: list[FastRule] = [*DEFAULT_FAST_RULES, *(fast_rules or [])]
 
         self._system = (
             "Eres un buscador inteligente. Debes producir un único 'internet_text' breve (3–6 líneas), en español, "
             "con la mejor información práctica. Decide si usar una herramienta temática:\n"
             "- Matemática: usa `math_solve(expression)` cuando la consulta sea un cálculo/ecuación.\n"
-            "- Filosofía: usa `philosophy_snippet(topic)` para filósofos/ideas canónicas.\n"
+            "- Filosofía: usa `philosophy_snippet(topic)` para filósofos/ideas canónicas (antes que el resumen general).\n"
             "- Unidades: usa `unit_convert(value, from_unit, to_unit)` si piden convertir.\n"
-            "- Fechas: usa `date_arith('YYYY-MM-DD +/- N d')` para sumar/restar días.\n"
+            "- Fechas: usa `date_arith('YYYY-MM-DD +/- N d|w|m|b')` para sumar/restar días, semanas, meses o "
+            "días hábiles, o `date_arith('YYYY-MM-DD - YYYY-MM-DD')` para contar días entre fechas; "
+            "si son varias, usa `date_arith_bulk(expressions)` en una sola llamada.\n"
+            "- Documentación interna: usa `local_search(query)` para buscar en el corpus local.\n"
             "Si ninguna aplica, usa `general_search_summary(query)` como fallback.\n"
             "Tu ÚLTIMO mensaje debe ser SOLO el texto final del 'internet_text' (sin prefijos ni JSON)."
         )
 
+    def _build(self) -> None:
+        """LLM y grafo ReAct (lo pesado del arranque); ver `start_warmup`."""
+        from langgraph.prebuilt import create_react_agent
+        from bounded_memory import BoundedMemorySaver, make_history_trimmer
+        self._memory = BoundedMemorySaver()
+        self._llm = get_chat_model(temperature=0, role="search")
+        self._agent = create_react_agent(
+            self._llm,
+            tools=[_memoized(t) for t in (math_solve, philosophy_snippet, unit_convert, date_arith, date_arith_bulk,
+                                          local_search, general_search_summary)],
+            name="AgentSearchReAct",
+            checkpointer=self._memory,
+            pre_model_hook=make_history_trimmer(),
+        )
+
     @staticmethod
-    def _pick_query(text: str) -> str:
-       
+    def _pick_query(text: str) -> tuple[str, str, str]:
+        """(query, internet_text previo, motivo de la insuficiencia); los dos últimos sólo en re-búsquedas."""
         try:
             obj = json.loads(text or "")
             if isinstance(obj, dict) and obj.get("query"):
-                return str(obj["query"])
+                return (str(obj["query"]), str(obj.get("previous_internet_text") or ""),
+                        str(obj.get("reason") or ""))
         except Exception:
             pass
-        return text or ""
+        return text or "", "", ""
+
+    def add_fast_rule(self, rule: FastRule) -> None:
+        """Registra una regla extra del fast-path (se evalúa después de las anteriores)."""
+        self._fast_rules.append(rule)
+
+    async def _try_fast_path(self, query: str, callbacks: Optional[list] = None) -> Optional[tuple[str, str]]:
+        """
+        Evalúa las reglas en orden y llama la tool directamente, sin LLM.
+        Devuelve (path, internet_text) o None si ninguna regla aplica o la tool
+        responde 'error: ...' (en ese caso se cae al agente ReAct).
+        """
+        for rule in self._fast_rules:
+            try:
+                hit = rule(query)
+            except Exception:
+                log.exception(f"[FAST] regla {getattr(rule, '__name__', rule)} falló")
+                continue
+            if not hit:
+                continue
+            t, args = hit
+            result = str(await t.ainvoke(args, config={"callbacks": callbacks or []})).strip()
+            if result.startswith("error"):
+                log.info(f"[FAST] {t.name} no resolvió ({result}); se continúa")
+                continue
+            return f"fast:{t.name}", _fast_internet_text(t.name, query, result)
+        return None
 
     async def _handle_async(self, message: Message) -> Message:
         try:
             raw_in = message.content.text or ""
-            query = self._pick_query(raw_in).strip()
+            query, previous, reason = self._pick_query(raw_in)
+            query = query.strip()
             if not query:
                 out = {"internet_text": "[search_error] la consulta llegó vacía al agente search."}
                 return Message(
@@ -249,26 +430,52 @@ class SearchA2A(A2AServer):
                     conversation_id=message.conversation_id
                 )
 
+            cb = MetricsCallback("search")
+            # En una re-búsqueda el fast-path devolvería lo mismo que ya fue insuficiente.
+            if SEARCH_FAST_PATH and not previous:
+                fast = await self._try_fast_path(query, callbacks=[cb])
+                if fast is not None:
+                    path, internet_text = fast
+                    REGISTRY.inc("a2a_search_path_total", path=path)
+                    payload = json.dumps({"internet_text": internet_text, "path": path, "cost": cb.cost()},
+                                         ensure_ascii=False)
+                    log_sampled(log, "payload: %s", payload)
+                    return Message(
+                        content=TextContent(text=payload),
+                        role=MessageRole.AGENT,
+                        parent_message_id=message.message_id,
+                        conversation_id=message.conversation_id
+                    )
+
             user_msg = (
                 "Genera un 'internet_text' breve (3–6 líneas) que responda o resuma con utilidad:\n"
                 f"{query}\n\n"
                 "Elige herramienta temática si corresponde; si no, usa el fallback de resumen general."
             )
+            if previous:
+                user_msg += (
+                    f"\n\nUn intento anterior produjo este internet_text:\n{previous}\n"
+                    f"Se consideró insuficiente{f' ({reason})' if reason else ''}. Conserva lo útil, "
+                    "no repitas búsquedas ya hechas y completa sólo lo que falta."
+                )
 
-            
-            conv_id = message.conversation_id or "search-default"
-            cfg = {"configurable": {"thread_id": conv_id}}
-
-            result = await asyncio.wait_for(
-                self._agent.ainvoke(
-                    {"messages": [
-                        {"role": "system", "content": self._system},
-                        {"role": "user", "content": user_msg},
-                    ]},
-                    cfg
-                ),
-                timeout=120
-            )
+            conv_id = message.conversation_id or f"search-{message.message_id}"
+            cfg = {"configurable": {"thread_id": conv_id}, "callbacks": [cb]}
+            scope = _MEMO_SCOPE.set(conv_id)
+            try:
+                with REGISTRY.timer("a2a_react_seconds", agent="search"):
+                    result = await asyncio.wait_for(
+                        self._agent.ainvoke(
+                            {"messages": [
+                                {"role": "system", "content": self._system},
+                                {"role": "user", "content": user_msg},
+                            ]},
+                            cfg
+                        ),
+                        timeout=120
+                    )
+            finally:
+                _MEMO_SCOPE.reset(scope)
 
             final_text: Optional[str] = None
             if isinstance(result, dict) and "messages" in result and result["messages"]:
@@ -277,8 +484,10 @@ class SearchA2A(A2AServer):
             if not final_text:
                 final_text = "No se encontraron resultados útiles."
 
-            payload = json.dumps({"internet_text": final_text.strip()}, ensure_ascii=False)
-            print(f"############## payload ##############\n{payload}")
+            REGISTRY.inc("a2a_search_path_total", path="react")
+            payload = json.dumps({"internet_text": final_text.strip(), "path": "react", "cost": cb.cost()},
+                                 ensure_ascii=False)
+            log_sampled(log, "payload: %s", payload)
             return Message(
                 content=TextContent(text=payload),
                 role=MessageRole.AGENT,
@@ -299,10 +508,21 @@ class SearchA2A(A2AServer):
                 conversation_id=message.conversation_id
             )
 
+    def memory_stats(self) -> dict:
+        return self._memory.stats() if self._memory is not None else {}
+
+    def metrics_snapshot(self) -> dict[str, float]:
+        return {**flatten_stats("a2a_search_cache", search_cache_stats()),
+                **flatten_stats("a2a_search_memo", _TOOL_MEMO.stats()),
+                **flatten_stats("a2a_memory", self.memory_stats()),
+                **flatten_stats("a2a_math", MATH_POOL.stats()),
+                **flatten_stats("a2a_philo_kb", PHILO_KB.stats()),
+                **flatten_stats("a2a_local_index", LOCAL_INDEX.stats() if LOCAL_INDEX is not None else {}),
+                **flatten_stats("a2a_llm_pool", registry_stats()),
+                **flatten_stats("a2a_llm_sched", scheduler_stats())}
+
     def handle_message(self, message: Message) -> Message:
-        return run_async(self._handle_async(message))
+        return run_async(self._handle_timed(message))
 
 if __name__ == "__main__":
-    host, port = "127.0.0.1", 8001
-    print(f"🚀 Agent A2A Search (ReAct, multi-tools) escuchando en http://{host}:{port}")
-    run_server(SearchA2A(host=host, port=port), host=host, port=port)
+    serve_agent(SearchA2A, "Agent A2A Search (ReAct, multi-tools)", 8001)
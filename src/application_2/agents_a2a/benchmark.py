@@ -0,0 +1,174 @@
+"""
+Benchmark offline del pipeline A2A: levanta los tres agentes en localhost con un
+LLM stub determinista (sin OpenAI) y maneja `build_app()` con concurrencia
+configurable. Emite un JSON con throughput, p50/p95/p99 por nodo y end-to-end,
+y RSS pico, para comparar entre commits (`--compare bench_anterior.json`).
+
+    python benchmark.py --queries 500 --concurrency 32 --llm-latency-ms 50 --out bench.json
+"""
+from __future__ import annotations
+import os, io, json, time, asyncio, argparse, contextlib, logging, resource, socket, subprocess, threading
+from typing import Optional
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-stub")
+
+import orchestrator
+import llm_registry
+import agent_search, agent_analyst, agent_response
+from python_a2a import run_server
+from stub_llm import stub_chat_factory
+
+DEFAULT_QUERIES = [
+    "2025-08-17 + 10 d",
+    "10 km to mi",
+    "¿Quién fue Kant?",
+    "¿Qué es la fotosíntesis?",
+    "Resume la historia de la imprenta",
+    "¿Cómo funciona una vacuna de ARN mensajero?",
+]
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    vs = sorted(values)
+
+    def _pct(p: float) -> float:
+        return round(vs[min(len(vs) - 1, max(0, int(round(p / 100 * len(vs))) - 1))], 2)
+
+    return {"count": len(vs), "mean": round(sum(vs) / len(vs), 2), "p50": _pct(50), "p95": _pct(95),
+            "p99": _pct(99), "max": round(vs[-1], 2)}
+
+
+def _wait_port(host: str, port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with contextlib.suppress(OSError), socket.create_connection((host, port), timeout=0.5):
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"el agente en {host}:{port} no respondió en {timeout}s")
+
+
+def _start_agents(host: str, base_port: int, latency: float, tokens: int) -> dict[str, str]:
+    """Levanta los tres A2AServer con el LLM stub, cada uno en un hilo daemon."""
+    llm_registry.set_chat_factory(stub_chat_factory(latency=latency, tokens=tokens))
+
+    agents = {
+        "search": agent_search.SearchA2A(host=host, port=base_port),
+        "analysis": agent_analyst.AnalysisA2A(host=host, port=base_port + 1),
+        "response": agent_response.ResponseA2A(host=host, port=base_port + 2),
+    }
+    urls = {}
+    for i, (role, agent) in enumerate(agents.items()):
+        port = base_port + i
+        threading.Thread(target=run_server, args=(agent,), kwargs={"host": host, "port": port},
+                         name=f"bench-{role}", daemon=True).start()
+        urls[role] = f"http://{host}:{port}"
+    for i in range(len(agents)):
+        _wait_port(host, base_port + i)
+    return urls
+
+
+def _instrument_nodes(urls: dict[str, str]) -> dict[str, list[float]]:
+    """Envuelve el POST async del orquestador para medir latencia por nodo (ms)."""
+    by_url = {url: role for role, url in urls.items()}
+    samples: dict[str, list[float]] = {role: [] for role in urls}
+    original = orchestrator._apost_a2a_envelope
+
+    async def _timed(url: str, user_text: str, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await original(url, user_text, *args, **kwargs)
+        finally:
+            samples[by_url.get(url, url)].append((time.perf_counter() - t0) * 1000)
+
+    orchestrator._apost_a2a_envelope = _timed
+    return samples
+
+
+async def _drive(queries: list[str], concurrency: int) -> tuple[list[dict], dict]:
+    sink = io.StringIO()
+    items = ({"id": i, "query": q} for i, q in enumerate(queries))
+    summary = await orchestrator.run_batch(items, sink, concurrency)
+    results = [json.loads(line) for line in sink.getvalue().splitlines() if line.strip()]
+    return results, summary
+
+
+def _git_commit() -> Optional[str]:
+    with contextlib.suppress(Exception):
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    return None
+
+
+def run_benchmark(n_queries: int, concurrency: int, latency_ms: float, tokens: int,
+                  host: str = "127.0.0.1", base_port: int = 18001, queries: Optional[list[str]] = None,
+                  coalesce: bool = False) -> dict:
+    logging.getLogger().setLevel(logging.WARNING)
+    orchestrator.SINGLEFLIGHT_ENABLED = coalesce
+    urls = _start_agents(host, base_port, latency_ms / 1000, tokens)
+    orchestrator.SEARCH_URL, orchestrator.ANALYSIS_URL, orchestrator.RESPONSE_URL = (
+        urls["search"], urls["analysis"], urls["response"])
+    samples = _instrument_nodes(urls)
+
+    pool = queries or DEFAULT_QUERIES
+    batch = [pool[i % len(pool)] for i in range(n_queries)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        results, summary = asyncio.run(_drive(batch, concurrency))
+
+    return {
+        "commit": _git_commit(),
+        "config": {"queries": n_queries, "concurrency": concurrency, "llm_latency_ms": latency_ms,
+                   "llm_tokens": tokens, "max_iters": orchestrator.MAX_ITERS, "coalesce": coalesce},
+        "throughput_qps": summary["qps"],
+        "elapsed_sec": summary["elapsed_sec"],
+        "errors": summary["errors"],
+        "coalesced": summary["coalesced"],
+        "cached": summary["cached"],
+        "end_to_end_ms": _percentiles([r["elapsed_ms"] for r in results if "error" not in r]),
+        "nodes_ms": {role: _percentiles(vals) for role, vals in samples.items()},
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _compare(current: dict, baseline: dict) -> dict:
+    """Razón actual/base de las métricas principales (< 1 en latencias = mejora)."""
+    def _ratio(a, b):
+        return round(a / b, 3) if a is not None and b else None
+    out = {"throughput_qps": _ratio(current["throughput_qps"], baseline.get("throughput_qps")),
+           "peak_rss_mb": _ratio(current["peak_rss_mb"], baseline.get("peak_rss_mb"))}
+    for p in ("p50", "p95", "p99"):
+        out[f"end_to_end_{p}"] = _ratio(current["end_to_end_ms"].get(p), baseline.get("end_to_end_ms", {}).get(p))
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark offline del pipeline A2A con LLM stub")
+    parser.add_argument("--queries", type=int, default=200, help="número total de consultas")
+    parser.add_argument("--concurrency", type=int, default=16, help="consultas en vuelo")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="latencia simulada por llamada LLM")
+    parser.add_argument("--llm-tokens", type=int, default=40, help="palabras por respuesta del stub")
+    parser.add_argument("--base-port", type=int, default=18001, help="puerto del agente search (+1, +2 el resto)")
+    parser.add_argument("--queries-file", help="consultas (una por línea) en lugar de las de ejemplo")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="activa la coalescencia de consultas idénticas (apagada para medir el pipeline)")
+    parser.add_argument("--out", help="escribe el reporte JSON en este archivo")
+    parser.add_argument("--compare", help="reporte JSON previo contra el que comparar")
+    args = parser.parse_args()
+
+    custom = None
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            custom = [line.strip() for line in f if line.strip()]
+
+    report = run_benchmark(args.queries, args.concurrency, args.llm_latency_ms, args.llm_tokens,
+                           base_port=args.base_port, queries=custom, coalesce=args.coalesce)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["vs_baseline"] = _compare(report, json.load(f))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,337 @@
+"""
+Índice invertido BM25 sobre un corpus local de documentos, partido en pasajes.
+La base se guarda en un archivo binario que se abre con mmap y se consulta en
+sitio: vocabulario y documentos son tablas ordenadas (campos con largo, sin
+separadores) que se buscan por bisección, como los alias de philo_kb. Los documentos
+agregados o actualizados después viven en un delta en memoria (con lápidas
+sobre los pasajes reemplazados) hasta el próximo `save()`, que fusiona todo
+en un archivo nuevo y lo reemplaza de forma atómica.
+
+    python bm25_index.py build docs/ corpus.bm25          # .txt/.md de un directorio o JSONL {"id", "text"}
+    python bm25_index.py add corpus.bm25 nuevos.jsonl
+    python bm25_index.py query corpus.bm25 "política de vacaciones"
+"""
+from __future__ import annotations
+import os, json, math, mmap, struct, threading
+from collections import Counter
+from typing import Iterable, Iterator, Optional
+
+from philo_kb import normalize, pack_u32, u32_view
+
+PASSAGE_WORDS = int(os.getenv("BM25_PASSAGE_WORDS", "120"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_MAGIC = b"BMI2"
+_LEGACY_MAGIC = b"BM25"             # formato anterior: vocabulario y docs como texto; se carga al delta
+# magic, pasajes, términos, documentos, postings, bytes de términos, bytes de doc_ids, tokens totales
+_HEADER = struct.Struct("<4s6IQ")
+_SLOT = struct.Struct("<QIII")      # offset del texto, largo del texto, largo del pasaje (tokens), documento
+_ROW = 4                            # filas de términos/docs: offset y largo del texto, primer elemento, cantidad
+
+_STOPWORDS = frozenset(
+    "a al algo como con de del el en es esta este ha la las lo los mas me mi no o para pero por que se "
+    "si sin sobre su sus un una uno unos unas y ya the of and to in is for on".split())
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in normalize(text).split() if len(t) > 1 and t not in _STOPWORDS]
+
+
+def split_passages(text: str, max_words: int = PASSAGE_WORDS) -> list[str]:
+    """Agrupa párrafos hasta `max_words` palabras; los párrafos largos se cortan en ventanas."""
+    passages, current = [], []
+    for para in (p.strip() for p in text.split("\n\n")):
+        words = para.split()
+        if not words:
+            continue
+        if current and len(current) + len(words) > max_words:
+            passages.append(" ".join(current))
+            current = []
+        while len(words) > max_words:
+            passages.append(" ".join(words[:max_words]))
+            words = words[max_words:]
+        current.extend(words)
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def _table(keys: list[bytes], counts: list[int]) -> tuple[list[int], bytes]:
+    """Filas (offset, largo, primer elemento, cantidad) y el bloque de texto de `keys` ya ordenadas."""
+    rows, first, off = [], 0, 0
+    for key, count in zip(keys, counts):
+        rows += [off, len(key), first, count]
+        off += len(key)
+        first += count
+    return rows, b"".join(keys)
+
+
+def _encode(passages: list[tuple[str, str]]) -> bytes:
+    """Serializa pasajes (doc_id, texto) al formato binario."""
+    docs: dict[bytes, list[int]] = {}
+    postings: dict[bytes, list[tuple[int, int]]] = {}
+    for pid, (doc_id, _) in enumerate(passages):
+        docs.setdefault(doc_id.encode("utf-8"), []).append(pid)
+    doc_keys = sorted(docs)
+    doc_pos = {d: i for i, d in enumerate(doc_keys)}
+    slots, texts, offset, total = [], [], 0, 0
+    for pid, (doc_id, text) in enumerate(passages):
+        tokens = tokenize(text)
+        blob = text.encode("utf-8")
+        slots.append(_SLOT.pack(offset, len(blob), len(tokens), doc_pos[doc_id.encode("utf-8")]))
+        texts.append(blob)
+        offset += len(blob)
+        total += len(tokens)
+        for term, tf in Counter(tokens).items():
+            postings.setdefault(term.encode("utf-8"), []).append((pid, tf))
+    term_keys = sorted(postings)
+    term_rows, term_text = _table(term_keys, [len(postings[t]) for t in term_keys])
+    doc_rows, doc_text = _table(doc_keys, [len(docs[d]) for d in doc_keys])
+    packed = [v for t in term_keys for pair in postings[t] for v in pair]
+    header = _HEADER.pack(_MAGIC, len(passages), len(term_keys), len(doc_keys), len(packed) // 2,
+                          len(term_text), len(doc_text), total)
+    return b"".join([header, *slots, pack_u32(term_rows), pack_u32(doc_rows),
+                     pack_u32([pid for d in doc_keys for pid in docs[d]]), pack_u32(packed),
+                     term_text, doc_text, *texts])
+
+
+def _legacy_passages(buf) -> list[tuple[str, str]]:
+    """Pasajes (doc_id, texto) de un archivo con el formato anterior."""
+    header, slot = struct.Struct("<4sIIIIQ"), struct.Struct("<QII")
+    _, n, vocab_len, docs_len, n_post, _ = header.unpack_from(buf, 0)
+    text_at = header.size + n * slot.size + vocab_len + docs_len + n_post * 8
+    out = []
+    for pid in range(n):
+        off, length, _ = slot.unpack_from(buf, header.size + pid * slot.size)
+        doc_id, _, text = buf[text_at + off:text_at + off + length].decode("utf-8").partition("\x00")
+        out.append((doc_id, text))
+    return out
+
+
+class BM25Index:
+    """Base inmutable en mmap + delta en memoria; `search` combina ambas."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._open(path)
+
+    def _open(self, path: Optional[str]) -> None:
+        if getattr(self, "_buf", None) is not None:
+            self._release()
+        self._buf = None
+        self._n_base = self._n_terms = self._n_docs = self._base_tokens = 0
+        self._delta: list[tuple[str, str, int]] = []
+        self._delta_post: dict[str, list[tuple[int, int]]] = {}
+        self._delta_docs: dict[str, list[int]] = {}
+        self._removed_base: set[str] = set()
+        self._tombstones: set[int] = set()
+        legacy = []
+        if path and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic = buf[:4]
+            if magic == _LEGACY_MAGIC:
+                # Se reindexa en memoria; el próximo save() lo reescribe en el formato nuevo.
+                legacy = _legacy_passages(buf)
+                buf.close()
+            elif magic != _MAGIC:
+                buf.close()
+                raise ValueError(f"{path}: no es un índice BM25")
+            else:
+                self._map(buf)
+        self._live_tokens = self._base_tokens
+        for doc_id, text in legacy:
+            self._add_passage(doc_id, text)
+
+    def _map(self, buf) -> None:
+        _, n, n_terms, n_docs, n_post, term_len, doc_len, total = _HEADER.unpack_from(buf, 0)
+        self._buf = buf
+        self._n_base, self._n_terms, self._n_docs, self._base_tokens = n, n_terms, n_docs, total
+        at = _HEADER.size + n * _SLOT.size
+        arrays = []
+        for count in (n_terms * _ROW, n_docs * _ROW, n, 2 * n_post):
+            arrays.append(u32_view(buf, at, count))
+            at += 4 * count
+        self._terms, self._doc_rows, self._doc_pids, self._post = arrays
+        self._term_text_at = at
+        self._doc_text_at = at + term_len
+        self._text_at = self._doc_text_at + doc_len
+
+    def _release(self) -> None:
+        # Las vistas u32 exportan el buffer: hay que soltarlas antes de cerrar el mmap.
+        for name in ("_terms", "_doc_rows", "_doc_pids", "_post"):
+            view = self.__dict__.pop(name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self._buf.close()
+
+    def _find(self, rows, n: int, text_at: int, key: str) -> tuple[int, int]:
+        """(primer elemento, cantidad) de `key` en una tabla ordenada del archivo; (0, 0) si no está."""
+        raw = key.encode("utf-8")
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            off, length = rows[mid * _ROW], rows[mid * _ROW + 1]
+            cur = self._buf[text_at + off:text_at + off + length]
+            if cur < raw:
+                lo = mid + 1
+            elif cur > raw:
+                hi = mid
+            else:
+                return rows[mid * _ROW + 2], rows[mid * _ROW + 3]
+        return 0, 0
+
+    def _base_pids(self, doc_id: str) -> list[int]:
+        if self._buf is None or doc_id in self._removed_base:
+            return []
+        first, count = self._find(self._doc_rows, self._n_docs, self._doc_text_at, doc_id)
+        return list(self._doc_pids[first:first + count])
+
+    def _slot(self, pid: int) -> tuple[int, int, int, int]:
+        return _SLOT.unpack_from(self._buf, _HEADER.size + pid * _SLOT.size)
+
+    def _doc_len(self, pid: int) -> int:
+        return self._slot(pid)[2] if pid < self._n_base else self._delta[pid - self._n_base][2]
+
+    def passage(self, pid: int) -> tuple[str, str]:
+        if pid >= self._n_base:
+            doc_id, text, _ = self._delta[pid - self._n_base]
+            return doc_id, text
+        off, length, _, doc = self._slot(pid)
+        d_off, d_len = self._doc_rows[doc * _ROW], self._doc_rows[doc * _ROW + 1]
+        doc_id = self._buf[self._doc_text_at + d_off:self._doc_text_at + d_off + d_len].decode("utf-8")
+        start = self._text_at + off
+        return doc_id, self._buf[start:start + length].decode("utf-8")
+
+    def __len__(self) -> int:
+        return self._n_base + len(self._delta) - len(self._tombstones)
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            base = self._base_pids(doc_id)
+            if base:
+                self._removed_base.add(doc_id)
+            for pid in base + self._delta_docs.pop(doc_id, []):
+                if pid not in self._tombstones:
+                    self._tombstones.add(pid)
+                    self._live_tokens -= self._doc_len(pid)
+
+    def _add_passage(self, doc_id: str, passage: str) -> int:
+        tokens = tokenize(passage)
+        pid = self._n_base + len(self._delta)
+        self._delta.append((doc_id, passage, len(tokens)))
+        self._live_tokens += len(tokens)
+        for term, tf in Counter(tokens).items():
+            self._delta_post.setdefault(term, []).append((pid, tf))
+        self._delta_docs.setdefault(doc_id, []).append(pid)
+        return pid
+
+    def add(self, doc_id: str, text: str) -> int:
+        """Agrega (o reemplaza) un documento; devuelve cuántos pasajes generó."""
+        with self._lock:
+            self.remove(doc_id)
+            self._delta_docs[doc_id] = []
+            return len([self._add_passage(doc_id, p) for p in split_passages(text)])
+
+    def _postings(self, term: str) -> Iterator[tuple[int, int]]:
+        if self._buf is not None:
+            first, df = self._find(self._terms, self._n_terms, self._term_text_at, term)
+            for i in range(first, first + df):
+                yield self._post[2 * i], self._post[2 * i + 1]
+        yield from self._delta_post.get(term, ())
+
+    def search(self, query: str, k: int = 3) -> list[tuple[float, str, str]]:
+        """Top-k pasajes (score, doc_id, texto) por BM25."""
+        with self._lock:
+            n = len(self)
+            terms = set(tokenize(query))
+            if not n or not terms:
+                return []
+            avgdl = max(self._live_tokens / n, 1.0)
+            scores: dict[int, float] = {}
+            for term in terms:
+                plist = [(pid, tf) for pid, tf in self._postings(term) if pid not in self._tombstones]
+                if not plist:
+                    continue
+                idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+                for pid, tf in plist:
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len(pid) / avgdl)
+                    scores[pid] = scores.get(pid, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+            top = sorted(scores.items(), key=lambda kv: -kv[1])[:k]
+            return [(round(score, 4), *self.passage(pid)) for pid, score in top]
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Fusiona base viva + delta en un archivo nuevo (reemplazo atómico) y lo reabre."""
+        with self._lock:
+            path = path or self.path
+            if not path:
+                raise ValueError("save() necesita una ruta")
+            live = [self.passage(pid) for pid in range(self._n_base + len(self._delta)) if pid not in self._tombstones]
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(_encode(live))
+            os.replace(tmp, path)
+            self.path = path
+            self._open(path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            docs = self._n_docs - len(self._removed_base) + len(self._delta_docs)
+            return {"passages": len(self), "base_passages": self._n_base, "delta_passages": len(self._delta),
+                    "tombstones": len(self._tombstones), "terms": self._n_terms,
+                    "delta_terms": len(self._delta_post), "docs": docs}
+
+
+def _iter_documents(source: str) -> Iterator[tuple[str, str]]:
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.endswith((".txt", ".md")):
+                    full = os.path.join(root, name)
+                    with open(full, encoding="utf-8") as f:
+                        yield os.path.relpath(full, source), f.read()
+        return
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                doc = json.loads(line)
+                yield str(doc["id"]), doc["text"]
+
+
+def build_index(documents: Iterable[tuple[str, str]], path: str) -> BM25Index:
+    index = BM25Index()
+    for doc_id, text in documents:
+        index.add(doc_id, text)
+    index.save(path)
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Índice BM25 local")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="construye el índice desde un directorio o un JSONL")
+    b.add_argument("source")
+    b.add_argument("out")
+    a = sub.add_parser("add", help="agrega/actualiza documentos y fusiona")
+    a.add_argument("index")
+    a.add_argument("source")
+    q = sub.add_parser("query", help="busca en el índice")
+    q.add_argument("index")
+    q.add_argument("query")
+    q.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        print(f"{args.out}: {build_index(_iter_documents(args.source), args.out).stats()}")
+    elif args.cmd == "add":
+        idx = BM25Index(args.index)
+        for doc_id, text in _iter_documents(args.source):
+            idx.add(doc_id, text)
+        idx.save()
+        print(f"{args.index}: {idx.stats()}")
+    else:
+        for score, doc_id, text in BM25Index(args.index).search(args.query, args.k):
+            print(f"{score:.3f}  [{doc_id}] {text[:200]}")
@@ -0,0 +1,115 @@
+from __future__ import annotations
+import os, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+MEMORY_MAX_THREADS  = int(os.getenv("A2A_MEMORY_MAX_THREADS", "256"))
+MEMORY_TTL_SEC      = float(os.getenv("A2A_MEMORY_TTL_SEC", "1800"))
+MEMORY_MAX_MESSAGES = int(os.getenv("A2A_MEMORY_MAX_MESSAGES", "20"))
+
+
+def _approx_bytes(obj: Any) -> int:
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return len(obj)
+    if isinstance(obj, str):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(_approx_bytes(k) + _approx_bytes(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sum(_approx_bytes(v) for v in obj)
+    return 0
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """
+    `InMemorySaver` con desalojo de threads: conserva a lo sumo `max_threads`
+    (LRU) y descarta los que llevan más de `ttl` segundos sin uso. Los métodos
+    async de InMemorySaver delegan en los sync, así que basta con interceptar éstos.
+    """
+
+    def __init__(self, max_threads: int = MEMORY_MAX_THREADS, ttl: float = MEMORY_TTL_SEC, **kwargs):
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.ttl = ttl
+        self.evicted = 0
+        self._last_used: "OrderedDict[str, float]" = OrderedDict()
+        self._lru_lock = threading.RLock()
+
+    @staticmethod
+    def _thread_id(config) -> Optional[str]:
+        tid = (config or {}).get("configurable", {}).get("thread_id")
+        return str(tid) if tid is not None else None
+
+    def _touch(self, config) -> None:
+        tid = self._thread_id(config)
+        if tid is None:
+            return
+        with self._lru_lock:
+            self._last_used[tid] = time.monotonic()
+            self._last_used.move_to_end(tid)
+            self._evict()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._last_used:
+            tid, last = next(iter(self._last_used.items()))
+            if len(self._last_used) <= self.max_threads and now - last <= self.ttl:
+                break
+            del self._last_used[tid]
+            self.delete_thread(tid)
+            self.evicted += 1
+
+    def get_tuple(self, config):
+        tup = super().get_tuple(config)
+        if tup is not None:
+            self._touch(config)
+        return tup
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        res = super().put(config, checkpoint, metadata, new_versions)
+        self._touch(config)
+        return res
+
+    def put_writes(self, config, writes, task_id, task_path: str = ""):
+        res = super().put_writes(config, writes, task_id, task_path)
+        self._touch(config)
+        return res
+
+    def prune_expired(self) -> None:
+        with self._lru_lock:
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lru_lock:
+            checkpoints = sum(len(cps) for ns in self.storage.values() for cps in ns.values())
+            return {
+                "threads": len(self._last_used),
+                "max_threads": self.max_threads,
+                "ttl": self.ttl,
+                "checkpoints": checkpoints,
+                "evicted": self.evicted,
+                "approx_bytes": _approx_bytes(dict(self.storage)) + _approx_bytes(dict(self.writes))
+                                + _approx_bytes(dict(getattr(self, "blobs", {}))),
+            }
+
+
+def make_history_trimmer(max_messages: int = MEMORY_MAX_MESSAGES) -> Callable[[dict], dict]:
+    """
+    `pre_model_hook` para `create_react_agent`: si el thread supera `max_messages`,
+    reescribe el historial guardado con los últimos mensajes (empezando en un
+    mensaje humano y conservando el system inicial), así el prompt no crece sin límite.
+    """
+    from langchain_core.messages import RemoveMessage, trim_messages
+    from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+    def _trim(state: dict) -> dict:
+        messages = state["messages"]
+        if len(messages) <= max_messages:
+            return {}
+        kept = trim_messages(messages, strategy="last", token_counter=len, max_tokens=max_messages,
+                             start_on="human", include_system=True)
+        return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *kept]}
+
+    return _trim
@@ -0,0 +1,131 @@
+from __future__ import annotations
+import re
+from datetime import date
+from typing import Optional, Sequence
+
+_DATE = r"(\d{4}-\d{2}-\d{2}|hoy|today)"
+_OFFSET_RX = re.compile(rf"^\s*{_DATE}\s*([+\-])\s*(\d+)\s*([a-záéíóú]*)\s*$", re.I)
+_ISO_RX = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_DIFF_RX = re.compile(rf"^\s*{_DATE}\s*-\s*{_DATE}\s*([a-záéíóú]*)\s*$", re.I)
+
+# Unidad de desplazamiento: d (días), w (semanas), m (meses, con el día acotado
+# al fin de mes) y b (días hábiles lun-vie).
+_UNITS = {
+    "": "d", "d": "d", "dia": "d", "día": "d", "dias": "d", "días": "d",
+    "w": "w", "sem": "w", "semana": "w", "semanas": "w",
+    "m": "m", "mes": "m", "meses": "m",
+    "b": "b", "bd": "b", "habil": "b", "hábil": "b", "habiles": "b", "hábiles": "b",
+}
+
+
+def _parse_date(token: str) -> str:
+    return date.today().isoformat() if token.lower() in ("hoy", "today") else token
+
+
+def _valid_date(token: str) -> bool:
+    try:
+        date.fromisoformat(_parse_date(token))
+        return True
+    except ValueError:
+        return False
+
+
+def offset_unit(token: str) -> Optional[str]:
+    return _UNITS.get((token or "").strip().lower())
+
+
+def is_date_expression(text: str) -> bool:
+    m = _OFFSET_RX.match(text) or _DIFF_RX.match(text)
+    return bool(m) and offset_unit(m.groups()[-1]) is not None
+
+
+def shift(bases: Sequence[str], offsets: Sequence[int], unit: str = "d") -> list[str]:
+    """Desplaza cada fecha base por su offset en una sola pasada de datetime64."""
+    import numpy as np  # diferido: numpy sólo se carga la primera vez que se usa
+    d = np.asarray([_parse_date(b) for b in bases], dtype="datetime64[D]")
+    n = np.asarray(offsets, dtype=np.int64)
+    if unit == "d":
+        out = d + n.astype("timedelta64[D]")
+    elif unit == "w":
+        out = d + (n * 7).astype("timedelta64[D]")
+    elif unit == "m":
+        month = d.astype("datetime64[M]")
+        day = d - month.astype("datetime64[D]")
+        target = month + n.astype("timedelta64[M]")
+        last = (target + 1).astype("datetime64[D]") - target.astype("datetime64[D]") - 1
+        out = target.astype("datetime64[D]") + np.minimum(day, last)
+    elif unit == "b":
+        out = np.empty_like(d)
+        fwd = n >= 0
+        out[fwd] = np.busday_offset(d[fwd], n[fwd], roll="forward")
+        out[~fwd] = np.busday_offset(d[~fwd], n[~fwd], roll="backward")
+    else:
+        raise ValueError(f"unidad no soportada: {unit}")
+    return [str(x) for x in out]
+
+
+def diff(starts: Sequence[str], ends: Sequence[str], unit: str = "d") -> list[int]:
+    """Días (o días hábiles con unit='b') de cada `start` a su `end`."""
+    import numpy as np
+    a = np.asarray([_parse_date(s) for s in starts], dtype="datetime64[D]")
+    b = np.asarray([_parse_date(e) for e in ends], dtype="datetime64[D]")
+    if unit == "b":
+        return np.busday_count(a, b).tolist()
+    days = (b - a).astype(np.int64)
+    return (days // 7 if unit == "w" else days).tolist()
+
+
+def evaluate(expressions: Sequence[str]) -> list[str]:
+    """
+    Evalúa 'YYYY-MM-DD +/- N [d|w|m|b]' y 'YYYY-MM-DD - YYYY-MM-DD [d|w|b]'.
+    Agrupa por operación y unidad para resolver cada grupo en una sola pasada;
+    los resultados vuelven en el orden de entrada ('error: ...' si no parsea).
+    Las fechas se validan antes de agrupar: una inválida no arrastra al resto.
+
+    >>> evaluate(["2025-08-17 + 10 d", "2025-02-30 + 1 d", "2025-12-25 - 2025-10-17", "2025-13-01 - 2025-10-17"])
+    ['2025-08-27', 'error: fecha inválida (2025-02-30)', '69 días', 'error: fecha inválida (2025-13-01)']
+    """
+    results: list[str] = [""] * len(expressions)
+    shifts: dict[str, list[tuple[int, str, int]]] = {}
+    diffs: dict[str, list[tuple[int, str, str]]] = {}
+    for i, expr in enumerate(expressions):
+        m = _DIFF_RX.match(expr or "") or _OFFSET_RX.match(expr or "")
+        bad = next((t for t in (m.groups()[:2] if m else ()) if _ISO_RX.match(t) and not _valid_date(t)), None)
+        if bad:
+            results[i] = f"error: fecha inválida ({bad})"
+            continue
+        m = _DIFF_RX.match(expr or "")
+        if m and offset_unit(m.group(3)) in ("d", "w", "b"):
+            # `fin - inicio`: cuántos días faltan de inicio a fin
+            diffs.setdefault(offset_unit(m.group(3)), []).append((i, m.group(2), m.group(1)))
+            continue
+        m = _OFFSET_RX.match(expr or "")
+        if m and offset_unit(m.group(4)) is not None:
+            ds, sign, n, unit = m.groups()
+            shifts.setdefault(offset_unit(unit), []).append((i, ds, int(n) if sign == "+" else -int(n)))
+            continue
+        results[i] = "error: formato esperado 'YYYY-MM-DD +/- N [d|w|m|b]' o 'YYYY-MM-DD - YYYY-MM-DD'"
+
+    labels = {"d": "días", "w": "semanas", "b": "días hábiles"}
+    for op, groups in ((shift, shifts), (diff, diffs)):
+        for unit, items in groups.items():
+            for (i, _, _), r in zip(items, _run_group(op, unit, items, labels.get(unit))):
+                results[i] = r
+    return results
+
+
+def _run_group(op, unit: str, items: list[tuple], label: Optional[str]) -> list[str]:
+    """
+    Una pasada vectorizada por grupo; si falla (p. ej. desborde de datetime64),
+    se reintenta ítem por ítem para que el error quede sólo en el que lo causa.
+    """
+    def _call(group: list[tuple]) -> list[str]:
+        out = op([a for _, a, _ in group], [b for _, _, b in group], unit)
+        return [f"{x} {label}" for x in out] if op is diff else out
+
+    try:
+        return _call(items)
+    except Exception as e:
+        if len(items) == 1:
+            return [f"error: {e}"]
+    return [_run_group(op, unit, [item], label)[0] for item in items]
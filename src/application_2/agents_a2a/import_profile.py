@@ -0,0 +1,63 @@
+"""
+Perfil de tiempo de import de los puntos de entrada (`python -X importtime` en un
+proceso limpio por módulo). Por cada módulo informa el tiempo total de import y
+los paquetes que más aportan (tiempo propio sumado por paquete raíz).
+
+    python import_profile.py                          # agentes + orquestador
+    python import_profile.py agent_search --top 20
+    python import_profile.py --json > import_profile.json
+"""
+from __future__ import annotations
+import os, re, sys, json, argparse, subprocess
+
+ENTRY_POINTS = ["agent_search", "agent_analyst", "agent_response", "orchestrator"]
+
+_LINE_RX = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def profile_module(module: str, cwd: str) -> dict:
+    """Importa `module` en un intérprete nuevo y agrega su traza de importtime."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=cwd, capture_output=True, text=True)
+    by_package: dict[str, int] = {}
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        m = _LINE_RX.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us, indent, name = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+        root = name.split(".")[0]
+        by_package[root] = by_package.get(root, 0) + self_us
+        if name == module and len(indent) <= 1:
+            total_us = cumulative_us
+    error = None
+    if proc.returncode != 0:
+        error = (proc.stderr.strip().splitlines() or ["error desconocido"])[-1]
+    ranked = sorted(by_package.items(), key=lambda kv: -kv[1])
+    return {"module": module, "total_ms": round(total_us / 1000, 1), "error": error,
+            "packages": [{"package": p, "self_ms": round(us / 1000, 1)} for p, us in ranked]}
+
+
+def _print_report(report: dict, top: int) -> None:
+    head = f"{report['module']}: {report['total_ms']:.1f} ms"
+    print(head + (f"  (falló: {report['error']})" if report["error"] else ""))
+    for row in report["packages"][:top]:
+        share = row["self_ms"] / report["total_ms"] * 100 if report["total_ms"] else 0.0
+        print(f"  {row['self_ms']:9.1f} ms  {share:5.1f}%  {row['package']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perfil de tiempo de import por módulo")
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--top", type=int, default=12, help="paquetes a listar por módulo")
+    parser.add_argument("--json", action="store_true", help="salida JSON en vez de tabla")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    reports = [profile_module(m, here) for m in args.modules]
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+    else:
+        for r in reports:
+            _print_report(r, args.top)
+            print()
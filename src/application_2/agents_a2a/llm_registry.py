@@ -0,0 +1,110 @@
+from __future__ import annotations
+import os, threading
+from typing import Any, Callable, Optional
+
+import httpx
+
+from llm_scheduler import LLM_SCHED_ENABLED, SCHEDULER, scheduled_chat_class
+
+OPENAI_MODEL            = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+LLM_MAX_CONNECTIONS     = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE       = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+LLM_KEEPALIVE_SEC       = float(os.getenv("LLM_KEEPALIVE_SEC", "60"))
+LLM_TIMEOUT_SEC         = float(os.getenv("LLM_TIMEOUT_SEC", "60"))
+LLM_CONNECT_TIMEOUT_SEC = float(os.getenv("LLM_CONNECT_TIMEOUT_SEC", "5"))
+LLM_MAX_RETRIES         = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+ModelKey = tuple[str, float, bool, str]
+ChatFactory = Callable[..., Any]
+
+_lock = threading.Lock()
+_models: dict[ModelKey, Any] = {}
+_factory: Optional[ChatFactory] = None
+_sync_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                        keepalive_expiry=LLM_KEEPALIVE_SEC)
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_TIMEOUT_SEC, connect=LLM_CONNECT_TIMEOUT_SEC)
+
+
+def _clients() -> tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    Clientes HTTP compartidos por todos los modelos del proceso. El async queda
+    ligado al loop persistente de `a2a_runtime`, donde corren los agentes.
+    """
+    global _sync_client, _async_client
+    if _sync_client is None:
+        _sync_client = httpx.Client(limits=_limits(), timeout=_timeout())
+        _async_client = httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+    return _sync_client, _async_client
+
+
+def _build_openai(model: str, temperature: float, streaming: bool, role: str) -> Any:
+    http_client, http_async_client = _clients()
+    kwargs = dict(model=model, temperature=temperature, streaming=streaming, timeout=LLM_TIMEOUT_SEC,
+                  http_client=http_client, http_async_client=http_async_client)
+    if LLM_SCHED_ENABLED:
+        # Los reintentos los hace el scheduler (con pausa global ante 429), no el cliente.
+        return scheduled_chat_class()(max_retries=0, sched_role=role, **kwargs)
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(max_retries=LLM_MAX_RETRIES, **kwargs)
+
+
+def get_chat_model(model: Optional[str] = None, temperature: float = 0.0, streaming: bool = False,
+                   role: str = "search") -> Any:
+    """
+    Devuelve el chat model compartido para (model, temperature, streaming, role),
+    creándolo una sola vez. `role` fija la prioridad en el scheduler de llm_scheduler.
+    """
+    key: ModelKey = (model or OPENAI_MODEL, float(temperature), bool(streaming), role)
+    with _lock:
+        llm = _models.get(key)
+        if llm is None:
+            if _factory is not None:
+                llm = _factory(model=key[0], temperature=key[1], streaming=key[2])
+            else:
+                llm = _build_openai(*key)
+            _models[key] = llm
+        return llm
+
+
+def set_chat_factory(factory: Optional[ChatFactory]) -> None:
+    """Reemplaza la construcción de modelos (p. ej. el stub del benchmark) y vacía el registro."""
+    global _factory
+    with _lock:
+        _factory = factory
+        _models.clear()
+
+
+def _pool_usage(client: Optional[httpx.Client | httpx.AsyncClient]) -> dict:
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    conns = list(getattr(pool, "connections", None) or [])
+    idle = sum(1 for c in conns if c.is_idle())
+    return {"connections": len(conns), "idle": idle, "active": len(conns) - idle}
+
+
+def registry_stats() -> dict:
+    """Modelos registrados y uso de los pools de conexiones (activas/ociosas sobre el máximo)."""
+    with _lock:
+        n_models = len(_models)
+    sync_use, async_use = _pool_usage(_sync_client), _pool_usage(_async_client)
+    return {
+        "models": n_models,
+        "max_connections": LLM_MAX_CONNECTIONS,
+        "sync_connections": sync_use["connections"],
+        "sync_active": sync_use["active"],
+        "async_connections": async_use["connections"],
+        "async_active": async_use["active"],
+        "pool_utilization": round(max(sync_use["active"], async_use["active"]) / max(LLM_MAX_CONNECTIONS, 1), 4),
+    }
+
+
+def scheduler_stats() -> dict:
+    """Colas, presupuesto restante y reintentos del scheduler LLM del proceso."""
+    return SCHEDULER.stats()
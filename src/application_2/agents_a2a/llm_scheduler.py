@@ -0,0 +1,449 @@
+"""
+Scheduler compartido para las llamadas a OpenAI: todo pasa por dos token buckets
+(requests y tokens por minuto), una cola acotada con prioridad por rol
+(response > analysis > search) y reintentos con jitter ante 429/errores
+transitorios. Ante un 429 se pausa el despacho para todos los llamadores, en vez
+de que cada uno reintente por su cuenta.
+
+Con LLM_SCHED_PATH los buckets viven en SQLite y los comparten todos los
+procesos del host (agentes y réplicas); la prioridad entre procesos se respeta
+con una reserva por rol: los roles de menor prioridad no pueden bajar el
+presupuesto por debajo de su fracción reservada.
+"""
+from __future__ import annotations
+import os, time, heapq, random, sqlite3, asyncio, logging, itertools, threading
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from metrics import REGISTRY
+
+LLM_SCHED_ENABLED      = os.getenv("LLM_SCHED", "1") != "0"
+LLM_RPM                = float(os.getenv("LLM_RPM", "0"))        # 0 = sin límite
+LLM_TPM                = float(os.getenv("LLM_TPM", "0"))
+LLM_SCHED_PATH         = os.getenv("LLM_SCHED_PATH") or None
+LLM_SCHED_MAX_QUEUE    = int(os.getenv("LLM_SCHED_MAX_QUEUE", "256"))
+LLM_SCHED_MAX_WAIT_SEC = float(os.getenv("LLM_SCHED_MAX_WAIT_SEC", "30"))
+LLM_SCHED_RETRIES      = int(os.getenv("LLM_SCHED_RETRIES", "3"))
+LLM_SCHED_BACKOFF_SEC  = float(os.getenv("LLM_SCHED_BACKOFF_SEC", "0.5"))
+LLM_SCHED_BACKOFF_MAX  = float(os.getenv("LLM_SCHED_BACKOFF_MAX_SEC", "20"))
+LLM_SCHED_OUT_TOKENS   = int(os.getenv("LLM_SCHED_OUT_TOKENS", "300"))
+# Fracción del presupuesto que cada rol no puede consumir (queda para los de mayor prioridad).
+LLM_SCHED_RESERVE      = os.getenv("LLM_SCHED_RESERVE", "response=0,analysis=0.1,search=0.25")
+
+PRIORITIES = {"response": 0, "analysis": 1, "search": 2}
+
+T = TypeVar("T")
+log = logging.getLogger("LLMScheduler")
+
+
+class SchedulerBusy(RuntimeError):
+    """La cola del scheduler está llena o la espera superó LLM_SCHED_MAX_WAIT_SEC."""
+
+
+def _parse_reserve(spec: str) -> dict[str, float]:
+    out = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        role, _, frac = part.partition("=")
+        out[role.strip()] = min(max(float(frac), 0.0), 0.9)
+    return out
+
+
+class _Budget:
+    """Buckets de requests/min y tokens/min (capacidad = un minuto de presupuesto) en memoria."""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.caps = (rpm, tpm)
+        self._levels, self._at = [rpm, tpm], time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self, levels: list[float], elapsed: float) -> list[float]:
+        return [min(cap, lvl + cap * max(elapsed, 0.0) / 60) if cap > 0 else 0.0
+                for cap, lvl in zip(self.caps, levels)]
+
+    def _apply(self, fn: Callable[[list[float]], T]) -> T:
+        with self._lock:
+            now = time.time()
+            self._levels, self._at = self._refill(self._levels, now - self._at), now
+            return fn(self._levels)
+
+    def try_take(self, tokens: float, reserve: float) -> float:
+        """Descuenta 1 request y `tokens` si alcanzan sobre la reserva; si no, segundos a esperar."""
+        def take(levels: list[float]) -> float:
+            wait = 0.0
+            for i, need in enumerate((1.0, tokens)):
+                cap = self.caps[i]
+                if cap > 0:
+                    short = reserve * cap + min(need, cap * (1 - reserve)) - levels[i]
+                    wait = max(wait, short * 60 / cap)
+            if wait <= 0:
+                levels[0] -= 1.0
+                levels[1] -= tokens
+            return wait
+        return self._apply(take)
+
+    def refund(self, tokens: float) -> None:
+        """Devuelve un permiso ya descontado que al final no se entregó."""
+        def give(levels: list[float]) -> None:
+            levels[0] = min(levels[0] + 1.0, self.caps[0])
+            levels[1] = min(levels[1] + tokens, self.caps[1])
+        self._apply(give)
+
+    def adjust(self, tokens: float) -> None:
+        """Corrige el bucket de tokens con el uso real (puede quedar en deuda)."""
+        def fix(levels: list[float]) -> None:
+            levels[1] -= tokens
+        self._apply(fix)
+
+    def levels(self) -> tuple[float, float]:
+        return self._apply(lambda levels: (levels[0], levels[1]))
+
+
+class _SharedBudget(_Budget):
+    """Mismos buckets persistidos en SQLite: una fila por presupuesto, actualizada en transacción."""
+
+    def __init__(self, rpm: float, tpm: float, path: str, name: str = "openai"):
+        super().__init__(rpm, tpm)
+        self.path, self.name = path, name
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().execute("CREATE TABLE IF NOT EXISTS llm_budget ("
+                             "name TEXT PRIMARY KEY, requests REAL NOT NULL, tokens REAL NOT NULL, at REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _apply(self, fn: Callable[[list[float]], T]) -> T:
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = c.execute("SELECT requests, tokens, at FROM llm_budget WHERE name = ?", (self.name,)).fetchone()
+            levels = list(self.caps) if row is None else self._refill([row[0], row[1]], now - row[2])
+            out = fn(levels)
+            c.execute("INSERT OR REPLACE INTO llm_budget (name, requests, tokens, at) VALUES (?, ?, ?, ?)",
+                      (self.name, levels[0], levels[1], now))
+            c.execute("COMMIT")
+            return out
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+
+
+class _Waiter:
+    __slots__ = ("prio", "seq", "role", "tokens", "since", "state", "event", "loop", "future")
+
+    def __init__(self, prio: int, seq: int, role: str, tokens: float):
+        self.prio, self.seq, self.role, self.tokens = prio, seq, role, tokens
+        self.since = time.monotonic()
+        self.state = "waiting"
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.prio, self.seq) < (other.prio, other.seq)
+
+
+def _resolve(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+class LLMScheduler:
+    """
+    Cola de prioridad acotada delante del presupuesto. Un hilo despachador
+    entrega permisos al primero de la cola cuando el presupuesto alcanza; los
+    llamadores (hilos o corrutinas de cualquier loop) sólo esperan su turno.
+    """
+
+    def __init__(self, budget: _Budget, max_queue: int = LLM_SCHED_MAX_QUEUE,
+                 max_wait: float = LLM_SCHED_MAX_WAIT_SEC, reserve: Optional[dict[str, float]] = None):
+        self.budget = budget
+        self.max_queue, self.max_wait = max_queue, max_wait
+        self.reserve = reserve if reserve is not None else _parse_reserve(LLM_SCHED_RESERVE)
+        self._heap: list[_Waiter] = []
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._pause_until = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self.counts = {"granted": 0, "rejected": 0, "timeouts": 0, "retries": 0, "rate_limited": 0}
+
+    # --- cola y despacho -------------------------------------------------------
+
+    def _depth(self, role: str) -> None:
+        REGISTRY.set_gauge("a2a_llm_queue_depth", sum(1 for w in self._heap if w.role == role), role=role)
+
+    def _wake(self, w: _Waiter) -> None:
+        if w.event is not None:
+            w.event.set()
+        elif w.loop is not None and not w.loop.is_closed():
+            w.loop.call_soon_threadsafe(_resolve, w.future)
+
+    def _enqueue(self, w: _Waiter) -> None:
+        with self._cond:
+            if len(self._heap) >= self.max_queue:
+                worst = max(self._heap)
+                if worst.prio <= w.prio:
+                    self._count("rejected", w.role)
+                    raise SchedulerBusy(f"cola LLM llena ({self.max_queue})")
+                # Cola llena: el nuevo desplaza al de menor prioridad más reciente.
+                self._heap.remove(worst)
+                heapq.heapify(self._heap)
+                worst.state = "rejected"
+                self._depth(worst.role)
+                self._wake(worst)
+            heapq.heappush(self._heap, w)
+            self._depth(w.role)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name="llm-scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _take(self, head: _Waiter) -> float:
+        try:
+            return self.budget.try_take(head.tokens, self.reserve.get(head.role, 0.0))
+        except Exception:
+            log.exception("presupuesto LLM no disponible; se concede sin descontar")
+            return 0.0
+
+    def _grant(self, head: _Waiter) -> bool:
+        with self._cond:
+            if head.state != "waiting":
+                return False
+            self._heap.remove(head)
+            heapq.heapify(self._heap)
+            head.state = "granted"
+            self._depth(head.role)
+            self._wake(head)
+            return True
+
+    def _dispatch(self) -> None:
+        # El descuento en el presupuesto (en SQLite, una transacción BEGIN IMMEDIATE)
+        # se hace sin _cond: encolar y vencer esperas no quedan detrás del disco.
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                head = self._heap[0]
+                wait = self._pause_until - time.time()
+            if wait <= 0:
+                wait = self._take(head)
+                if wait <= 0:
+                    if not self._grant(head):
+                        # Venció o se canceló mientras se descontaba: se devuelve el permiso.
+                        self.budget.refund(head.tokens)
+                    continue
+                if isinstance(self.budget, _SharedBudget):
+                    # Otros procesos calculan la misma espera: jitter para no chocar al reintentar.
+                    wait += random.uniform(0, min(wait, 1.0)) * 0.1
+            with self._cond:
+                # Se espera lo que falta para recargar; sólo un cambio de cabeza (alguien
+                # más prioritario, o la cabeza venció) despierta antes.
+                if self._heap and self._heap[0] is head:
+                    self._cond.wait(max(wait, 0.005))
+
+    def _settle(self, w: _Waiter) -> None:
+        with self._cond:
+            if w.state == "waiting":
+                self._heap.remove(w)
+                heapq.heapify(self._heap)
+                w.state = "timeout"
+                self._depth(w.role)
+                self._cond.notify()
+        waited = time.monotonic() - w.since
+        REGISTRY.observe("a2a_llm_wait_seconds", waited, role=w.role)
+        if w.state == "granted":
+            self._count("granted", w.role)
+            return
+        self._count("timeouts" if w.state == "timeout" else "rejected", w.role)
+        raise SchedulerBusy(f"sin turno LLM para {w.role} tras {waited:.1f}s ({w.state})")
+
+    def _count(self, outcome: str, role: str) -> None:
+        # _cond usa un RLock: también se llama con el lock tomado (desde _enqueue).
+        with self._cond:
+            self.counts[outcome] += 1
+        REGISTRY.inc("a2a_llm_sched_total", role=role, outcome=outcome)
+
+    def _waiter(self, role: str, tokens: float) -> _Waiter:
+        return _Waiter(PRIORITIES.get(role, len(PRIORITIES)), next(self._seq), role, tokens)
+
+    def acquire(self, role: str, tokens: float) -> None:
+        """Bloquea hasta obtener turno; SchedulerBusy si la cola está llena o se agota la espera."""
+        w = self._waiter(role, tokens)
+        w.event = threading.Event()
+        self._enqueue(w)
+        w.event.wait(self.max_wait)
+        self._settle(w)
+
+    async def aacquire(self, role: str, tokens: float) -> None:
+        w = self._waiter(role, tokens)
+        w.loop = asyncio.get_running_loop()
+        w.future = w.loop.create_future()
+        self._enqueue(w)
+        try:
+            await asyncio.wait_for(asyncio.shield(w.future), self.max_wait)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with self._cond:
+                if w.state == "waiting":
+                    self._heap.remove(w)
+                    heapq.heapify(self._heap)
+                    w.state = "cancelled"
+                    self._depth(w.role)
+                    self._cond.notify()
+            raise
+        self._settle(w)
+
+    # --- reintentos ------------------------------------------------------------
+
+    def _retry_delay(self, e: BaseException, attempt: int, role: str) -> Optional[float]:
+        """Segundos antes de reintentar, o None si el error no es transitorio o se agotaron los intentos."""
+        response = getattr(e, "response", None)
+        status = getattr(e, "status_code", None) or getattr(response, "status_code", None)
+        rate_limited = status == 429 or type(e).__name__ == "RateLimitError"
+        transient = rate_limited or (status or 0) >= 500 or type(e).__name__ in ("APIConnectionError", "APITimeoutError")
+        if not transient or attempt >= LLM_SCHED_RETRIES:
+            return None
+        backoff = min(LLM_SCHED_BACKOFF_MAX, LLM_SCHED_BACKOFF_SEC * 2 ** attempt)
+        if rate_limited:
+            try:
+                backoff = max(backoff, float(getattr(response, "headers", {}).get("retry-after") or 0))
+            except (TypeError, ValueError):
+                pass
+            # Pausa global: nadie más sale hasta que pase el backoff.
+            with self._cond:
+                self._pause_until = max(self._pause_until, time.time() + backoff)
+                self._cond.notify()
+            self._count("rate_limited", role)
+        self._count("retries", role)
+        # Jitter completo sobre el backoff para que los reintentos no salgan juntos.
+        return backoff + random.uniform(0, backoff)
+
+    def call(self, role: str, fn: Callable[[], T], tokens: float) -> T:
+        attempt = 0
+        while True:
+            self.acquire(role, tokens)
+            try:
+                return fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, role)
+                if delay is None:
+                    raise
+                log.warning("LLM %s: %s; reintento %d en %.2fs", role, type(e).__name__, attempt + 1, delay)
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, role: str, fn: Callable[[], Awaitable[T]], tokens: float) -> T:
+        attempt = 0
+        while True:
+            await self.aacquire(role, tokens)
+            try:
+                return await fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, role)
+                if delay is None:
+                    raise
+                log.warning("LLM %s: %s; reintento %d en %.2fs", role, type(e).__name__, attempt + 1, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def reconcile(self, estimated: float, llm_output: Optional[dict]) -> None:
+        """Ajusta el bucket de tokens con el uso real informado por la API."""
+        usage = (llm_output or {}).get("token_usage") or {}
+        actual = usage.get("total_tokens")
+        if actual and self.budget.caps[1] > 0:
+            self.budget.adjust(float(actual) - estimated)
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued = {role: sum(1 for w in self._heap if w.role == role) for role in PRIORITIES}
+            paused = max(self._pause_until - time.time(), 0.0)
+            counts = dict(self.counts)
+        requests_left, tokens_left = self.budget.levels()
+        return {**counts, **{f"queued_{r}": n for r, n in queued.items()}, "queued": sum(queued.values()),
+                "max_queue": self.max_queue, "paused_sec": round(paused, 3), "rpm": self.budget.caps[0],
+                "tpm": self.budget.caps[1], "requests_left": round(requests_left, 2),
+                "tokens_left": round(tokens_left, 1)}
+
+
+def estimate_tokens(messages: Any) -> float:
+    """Estimación previa (≈4 caracteres por token + salida esperada); se corrige con `reconcile`."""
+    if isinstance(messages, str):
+        chars = len(messages)
+    else:
+        chars = sum(len(str(getattr(m, "content", m))) for m in messages or [])
+    return chars / 4 + LLM_SCHED_OUT_TOKENS
+
+
+SCHEDULER = LLMScheduler(_SharedBudget(LLM_RPM, LLM_TPM, LLM_SCHED_PATH) if LLM_SCHED_PATH
+                         else _Budget(LLM_RPM, LLM_TPM))
+
+# Evita agendar dos veces cuando ChatOpenAI delega _generate en _stream.
+_SCHEDULED: ContextVar[bool] = ContextVar("llm_scheduled", default=False)
+_chat_class: Optional[type] = None
+
+
+def scheduled_chat_class() -> type:
+    """Subclase de ChatOpenAI cuyas llamadas (invoke/stream, sync/async) pasan por SCHEDULER."""
+    global _chat_class
+    if _chat_class is not None:
+        return _chat_class
+    from langchain_openai import ChatOpenAI
+
+    class ScheduledChatOpenAI(ChatOpenAI):
+        sched_role: str = "search"
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            parent = super()._generate
+            if _SCHEDULED.get():
+                return parent(messages, stop=stop, run_manager=run_manager, **kwargs)
+            est = estimate_tokens(messages)
+            token = _SCHEDULED.set(True)
+            try:
+                result = SCHEDULER.call(self.sched_role,
+                                        lambda: parent(messages, stop=stop, run_manager=run_manager, **kwargs), est)
+            finally:
+                _SCHEDULED.reset(token)
+            SCHEDULER.reconcile(est, result.llm_output)
+            return result
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            parent = super()._agenerate
+            if _SCHEDULED.get():
+                return await parent(messages, stop=stop, run_manager=run_manager, **kwargs)
+            est = estimate_tokens(messages)
+            token = _SCHEDULED.set(True)
+            try:
+                result = await SCHEDULER.acall(self.sched_role,
+                                               lambda: parent(messages, stop=stop, run_manager=run_manager, **kwargs),
+                                               est)
+            finally:
+                _SCHEDULED.reset(token)
+            SCHEDULER.reconcile(est, result.llm_output)
+            return result
+
+        # Streaming: se pide turno una vez y no se reintenta (ya pudieron salir tokens).
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            if not _SCHEDULED.get():
+                SCHEDULER.acquire(self.sched_role, estimate_tokens(messages))
+            yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            if not _SCHEDULED.get():
+                await SCHEDULER.aacquire(self.sched_role, estimate_tokens(messages))
+            async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                yield chunk
+
+    _chat_class = ScheduledChatOpenAI
+    return _chat_class
+
+
+REGISTRY.describe("a2a_llm_queue_depth", "Llamadas LLM esperando turno en el scheduler, por rol")
+REGISTRY.describe("a2a_llm_wait_seconds", "Espera en la cola del scheduler LLM, por rol")
+REGISTRY.describe("a2a_llm_sched_total", "Resultados del scheduler LLM (granted/rejected/timeouts/retries/rate_limited)")
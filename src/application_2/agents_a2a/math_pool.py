@@ -0,0 +1,226 @@
+from __future__ import annotations
+import os, re, queue, signal, logging, threading
+import multiprocessing as mp
+from typing import Optional
+
+from result_cache import LRUTTLCache
+
+log = logging.getLogger("MathPool")
+
+MATH_POOL_SIZE        = int(os.getenv("MATH_POOL_SIZE", "2"))
+MATH_CPU_TIMEOUT_SEC  = float(os.getenv("MATH_CPU_TIMEOUT_SEC", "2"))
+MATH_WALL_TIMEOUT_SEC = float(os.getenv("MATH_WALL_TIMEOUT_SEC", "5"))
+MATH_MEM_LIMIT_MB     = int(os.getenv("MATH_MEM_LIMIT_MB", "1024"))
+MATH_CACHE_SIZE       = int(os.getenv("MATH_CACHE_SIZE", "2048"))
+MATH_CACHE_TTL_SEC    = float(os.getenv("MATH_CACHE_TTL_SEC", "86400"))
+MATH_POOL_START       = os.getenv("MATH_POOL_START", "spawn")
+
+_WS_RX = re.compile(r"\s+")
+
+
+class _CpuTimeout(Exception):
+    pass
+
+
+def _on_cpu_timeout(signum, frame):
+    raise _CpuTimeout()
+
+
+def _worker_init(mem_limit_mb: int) -> None:
+    """Inicializa un worker: límite de memoria (sandbox) y sympy precargado."""
+    if mem_limit_mb > 0:
+        try:
+            import resource
+            limit = mem_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except Exception:
+            pass
+    try:
+        import sympy as sp
+        sp.solve(sp.Eq(sp.sympify("x**2 - 4"), 0), sp.symbols("x"))
+    except Exception:
+        pass
+
+
+def _worker_main(conn, mem_limit_mb: int) -> None:
+    """Bucle de un worker: recibe (expresión, límite de CPU) y responde el resultado."""
+    _worker_init(mem_limit_mb)
+    conn.send(os.getpid())
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        conn.send(solve_expression(*msg))
+
+
+def solve_expression(expr_norm: str, cpu_timeout: float = 0.0) -> str:
+    """
+    Resuelve `expr_norm` (ya con '^' -> '**') con sympy. En el hilo principal de
+    un worker aplica un límite de tiempo de CPU con ITIMER_VIRTUAL.
+    """
+    use_timer = (cpu_timeout > 0 and hasattr(signal, "setitimer")
+                 and threading.current_thread() is threading.main_thread())
+    if use_timer:
+        signal.signal(signal.SIGVTALRM, _on_cpu_timeout)
+        signal.setitimer(signal.ITIMER_VIRTUAL, cpu_timeout)
+    try:
+        try:
+            import sympy as sp
+        except Exception as e:
+            return f"error: sympy no está disponible ({e})"
+        x = sp.symbols('x')
+        if "=" in expr_norm:
+            lhs, rhs = expr_norm.split("=", 1)
+            sol = sp.solve(sp.Eq(sp.sympify(lhs), sp.sympify(rhs)), x)
+            return f"solución: {sol}"
+        val = sp.sympify(expr_norm)
+        exacto = sp.simplify(val)
+        aprox = exacto.evalf()
+        return f"resultado: {exacto} ; aproximado: {aprox}"
+    except _CpuTimeout:
+        return f"error: se excedió el límite de CPU ({cpu_timeout:g}s)"
+    except MemoryError:
+        return "error: se excedió el límite de memoria"
+    except Exception as e:
+        return f"error: no se pudo interpretar la expresión ({e})"
+    finally:
+        if use_timer:
+            signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+
+
+class _Worker:
+    """Un proceso de cálculo con su pipe; se arranca y espera a que tenga sympy cargado."""
+
+    def __init__(self, ctx, mem_limit_mb: int):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, mem_limit_mb), daemon=True)
+        self.proc.start()
+        child.close()
+
+    def wait_ready(self) -> None:
+        while not self.conn.poll(0.5):
+            if not self.proc.is_alive():
+                raise RuntimeError(f"el worker salió con código {self.proc.exitcode}")
+        self.conn.recv()
+
+    def kill(self) -> None:
+        try:
+            self.proc.kill()
+            self.proc.join(1)
+        finally:
+            self.conn.close()
+
+
+class MathPool:
+    """
+    Pool de procesos caliente para sympy: cada cálculo corre fuera del proceso del
+    agente con límite de CPU (en el worker) y de tiempo total (en el llamador), y
+    los resultados correctos se memorizan por expresión normalizada. El tiempo total
+    corre desde que un worker toma el cálculo (no cuenta la espera por un worker
+    libre) y al vencer sólo se recicla ese worker. Con `size=0` resuelve inline.
+    """
+
+    def __init__(self, size: int = MATH_POOL_SIZE, cpu_timeout: float = MATH_CPU_TIMEOUT_SEC,
+                 wall_timeout: float = MATH_WALL_TIMEOUT_SEC, mem_limit_mb: int = MATH_MEM_LIMIT_MB,
+                 cache_size: int = MATH_CACHE_SIZE, cache_ttl: float = MATH_CACHE_TTL_SEC,
+                 start_method: str = MATH_POOL_START):
+        self.size = size
+        self.cpu_timeout = cpu_timeout
+        self.wall_timeout = wall_timeout
+        self.mem_limit_mb = mem_limit_mb
+        self._ctx = mp.get_context(start_method)
+        self._cache = LRUTTLCache(maxsize=max(cache_size, 1), ttl=cache_ttl)
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._alive = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def _spawn(self) -> None:
+        """Arranca un worker y lo deja libre cuando está listo."""
+        try:
+            w = _Worker(self._ctx, self.mem_limit_mb)
+            w.wait_ready()
+        except Exception as e:
+            with self._lock:
+                self._alive -= 1
+            log.error(f"[MATH] no se pudo arrancar un worker: {e}")
+            return
+        self._idle.put(w)
+
+    def start(self) -> None:
+        """Crea los workers y espera a que cada uno haya importado sympy (idempotente)."""
+        if self.size <= 0:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._alive = self.size
+            threads = [threading.Thread(target=self._spawn, daemon=True) for _ in range(self.size)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        log.info(f"[MATH] pool de {self._alive} workers listo")
+
+    def warm_in_background(self) -> None:
+        threading.Thread(target=self.start, name="math-pool-warmup", daemon=True).start()
+
+    def _replace(self, worker: _Worker) -> None:
+        """Mata un worker colgado o caído y arranca otro en segundo plano; el resto sigue."""
+        worker.kill()
+        with self._lock:
+            self.restarts += 1
+        threading.Thread(target=self._spawn, name="math-pool-respawn", daemon=True).start()
+
+    def _checkout(self) -> Optional[_Worker]:
+        while True:
+            try:
+                return self._idle.get(timeout=1.0)
+            except queue.Empty:
+                with self._lock:
+                    if self._alive <= 0:
+                        return None
+
+    def _run(self, expr_norm: str) -> str:
+        self.start()
+        worker = self._checkout()
+        if worker is None:
+            return solve_expression(expr_norm, self.cpu_timeout)
+        try:
+            worker.conn.send((expr_norm, self.cpu_timeout))
+            if not worker.conn.poll(self.wall_timeout):
+                with self._lock:
+                    self.timeouts += 1
+                self._replace(worker)
+                return f"error: el cálculo superó {self.wall_timeout:g}s"
+            result = worker.conn.recv()
+        except (EOFError, OSError):
+            self._replace(worker)
+            return "error: el worker de cálculo terminó inesperadamente"
+        self._idle.put(worker)
+        return result
+
+    def solve(self, expr_norm: str) -> str:
+        key = _WS_RX.sub("", expr_norm)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        result = solve_expression(expr_norm) if self.size <= 0 else self._run(expr_norm)
+        if not result.startswith("error:"):
+            self._cache.set(key, result)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            alive, timeouts, restarts = self._alive, self.timeouts, self.restarts
+        return {**self._cache.stats(), "workers": self.size, "alive": alive, "idle": self._idle.qsize(),
+                "timeouts": timeouts, "restarts": restarts}
+
+
+MATH_POOL = MathPool()
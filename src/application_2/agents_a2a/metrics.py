@@ -0,0 +1,207 @@
+from __future__ import annotations
+import os, time, random, logging, threading, contextlib
+from typing import Any, Iterator, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+LOG_SAMPLE_RATE = float(os.getenv("A2A_LOG_SAMPLE_RATE", "0.05"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(key: LabelKey, extra: Optional[tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Registro de métricas del proceso (contadores, gauges, histogramas) en formato Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[LabelKey, float]] = {}
+        self._gauges: dict[str, dict[LabelKey, float]] = {}
+        self._hists: dict[str, dict[LabelKey, _Histogram]] = {}
+        self._help: dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels(labels)] = float(value)
+
+    def observe(self, name: str, value: float, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels: Any) -> None:
+        key = _labels(labels)
+        with self._lock:
+            series = self._hists.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(buckets)
+            hist.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[dict]:
+        """Mide la duración del bloque (segundos) en el histograma `name`; expone `ms` al salir."""
+        box: dict = {}
+        t0 = time.perf_counter()
+        try:
+            yield box
+        finally:
+            elapsed = time.perf_counter() - t0
+            box["ms"] = round(elapsed * 1000, 2)
+            self.observe(name, elapsed, **labels)
+
+    def render(self, extra_gauges: Optional[dict[str, float]] = None) -> str:
+        lines: list[str] = []
+        with self._lock:
+            for kind, store in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(store.items()):
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, v in series.items():
+                        lines.append(f"{name}{_fmt_labels(key)} {v}")
+            for name, series in sorted(self._hists.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in series.items():
+                    for b, c in zip(h.buckets, h.counts):
+                        lines.append(f"{name}_bucket{_fmt_labels(key, ('le', repr(b)))} {c}")
+                    lines.append(f"{name}_bucket{_fmt_labels(key, ('le', '+Inf'))} {h.count}")
+                    lines.append(f"{name}_sum{_fmt_labels(key)} {h.sum}")
+                    lines.append(f"{name}_count{_fmt_labels(key)} {h.count}")
+        for name, v in sorted((extra_gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {v}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def flatten_stats(prefix: str, stats: dict) -> dict[str, float]:
+    """Convierte un dict de stats (cachés, memoria) en gauges numéricos `prefix_clave`."""
+    return {f"{prefix}_{k}": float(v) for k, v in stats.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+
+def log_sampled(logger: logging.Logger, msg: str, *args: Any, rate: float = LOG_SAMPLE_RATE) -> None:
+    """DEBUG muestreado para payloads completos: sólo se emite con probabilidad `rate`."""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < rate:
+        logger.debug(msg, *args)
+
+
+class MetricsCallback(BaseCallbackHandler):
+    """
+    Callback de LangChain que mide cada llamada LLM y cada tool de un request:
+    alimenta el `REGISTRY` global y acumula el costo del request (llamadas,
+    tokens, tools) en atributos propios.
+    """
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._starts: dict[UUID, tuple[float, str]] = {}
+
+    def cost(self) -> dict:
+        return {"llm_calls": self.llm_calls, "tool_calls": self.tool_calls,
+                "input_tokens": self.input_tokens, "output_tokens": self.output_tokens}
+
+    def add_cost(self, cost: dict) -> None:
+        """Suma un costo medido por otro callback (p. ej. la parte de un lote compartido)."""
+        for k in ("llm_calls", "tool_calls", "input_tokens", "output_tokens"):
+            setattr(self, k, round(getattr(self, k) + cost.get(k, 0), 4))
+
+    def _model_name(self, serialized: Optional[dict], kwargs: dict) -> str:
+        params = kwargs.get("invocation_params") or {}
+        return str(params.get("model") or params.get("model_name") or (serialized or {}).get("name") or "llm")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self._starts[run_id] = (time.perf_counter(), self._model_name(serialized, kwargs))
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> None:
+        self._starts[run_id] = (time.perf_counter(), self._model_name(serialized, kwargs))
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        t0, model = self._starts.pop(run_id, (time.perf_counter(), "llm"))
+        REGISTRY.observe("a2a_llm_seconds", time.perf_counter() - t0, agent=self.agent, model=model)
+        self.llm_calls += 1
+        n_in = n_out = 0
+        for gens in getattr(response, "generations", []) or []:
+            for g in gens:
+                usage = getattr(getattr(g, "message", None), "usage_metadata", None) or {}
+                n_in += int(usage.get("input_tokens", 0))
+                n_out += int(usage.get("output_tokens", 0))
+        if not (n_in or n_out):
+            usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+            n_in, n_out = int(usage.get("prompt_tokens", 0)), int(usage.get("completion_tokens", 0))
+        self.input_tokens += n_in
+        self.output_tokens += n_out
+        REGISTRY.inc("a2a_llm_tokens_total", n_in, agent=self.agent, model=model, kind="input")
+        REGISTRY.inc("a2a_llm_tokens_total", n_out, agent=self.agent, model=model, kind="output")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        t0, model = self._starts.pop(run_id, (time.perf_counter(), "llm"))
+        REGISTRY.observe("a2a_llm_seconds", time.perf_counter() - t0, agent=self.agent, model=model)
+        REGISTRY.inc("a2a_llm_errors_total", agent=self.agent, model=model, error=type(error).__name__)
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._starts[run_id] = (time.perf_counter(), str((serialized or {}).get("name") or "tool"))
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        t0, name = self._starts.pop(run_id, (time.perf_counter(), "tool"))
+        self.tool_calls += 1
+        REGISTRY.observe("a2a_tool_seconds", time.perf_counter() - t0, agent=self.agent, tool=name)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        t0, name = self._starts.pop(run_id, (time.perf_counter(), "tool"))
+        REGISTRY.observe("a2a_tool_seconds", time.perf_counter() - t0, agent=self.agent, tool=name)
+        REGISTRY.inc("a2a_tool_errors_total", agent=self.agent, tool=name)
+
+
+REGISTRY.describe("a2a_request_seconds", "Duración de cada request atendido por un agente A2A")
+REGISTRY.describe("a2a_react_seconds", "Duración de la invocación del agente ReAct")
+REGISTRY.describe("a2a_llm_seconds", "Duración de cada llamada al LLM")
+REGISTRY.describe("a2a_llm_tokens_total", "Tokens consumidos por llamada LLM (input/output)")
+REGISTRY.describe("a2a_tool_seconds", "Duración de cada tool")
+REGISTRY.describe("a2a_hop_seconds", "Duración de cada hop HTTP del orquestador hacia un agente")
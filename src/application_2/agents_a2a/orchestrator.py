@@ -1,17 +1,52 @@
 
 from __future__ import annotations
-import os, json, time, requests
-from typing import TypedDict
-from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
+import os, re, sys, copy, json, time, uuid, asyncio, logging, threading, weakref, argparse, contextlib, requests, httpx
+from typing import Annotated, TypedDict, AsyncIterator, Iterator, TextIO
+from requests.adapters import HTTPAdapter
 from langchain_core.runnables.config import RunnableConfig
 
+from a2a_runtime import Warmup
+from a2a_trace import TRACE
+from metrics import REGISTRY, log_sampled
+from replicas import ReplicaPool, parse_urls
+from result_cache import make_cache, make_key, normalize_text
+from singleflight import SINGLEFLIGHT_ENABLED, SingleFlight
+
+log = logging.getLogger("Orchestrator")
+
+# Cada URL admite varias réplicas separadas por comas (ver replicas.py).
 SEARCH_URL   = os.getenv("A2A_SEARCH_URL",   "http://127.0.0.1:8001")
 ANALYSIS_URL = os.getenv("A2A_ANALYSIS_URL", "http://127.0.0.1:8002")
 RESPONSE_URL = os.getenv("A2A_RESPONSE_URL", "http://127.0.0.1:8003")
 
 A2A_TIMEOUT  = int(os.getenv("A2A_TIMEOUT_SEC", "120"))
 MAX_ITERS    = int(os.getenv("SWARM_MAX_ITERS", "2"))
+BATCH_CONCURRENCY = int(os.getenv("A2A_BATCH_CONCURRENCY", "16"))
+STREAM_RESPONSE = os.getenv("A2A_STREAM_RESPONSE", "0") == "1"
+SPECULATIVE = os.getenv("A2A_SPECULATIVE", "0") == "1"
+
+# Caché de respuestas finales delante del grafo (opt-in). Con A2A_ANSWER_CACHE_PATH vive en
+# SQLite y la comparten los orquestadores del host; un hit no hace ningún hop A2A.
+ANSWER_CACHE_PATH       = os.getenv("A2A_ANSWER_CACHE_PATH") or None
+ANSWER_CACHE_ENABLED    = os.getenv("A2A_ANSWER_CACHE", "1" if ANSWER_CACHE_PATH else "0") == "1"
+ANSWER_CACHE_TTL_SEC    = float(os.getenv("A2A_ANSWER_CACHE_TTL_SEC", "86400"))
+ANSWER_CACHE_BUCKET_SEC = float(os.getenv("A2A_ANSWER_CACHE_BUCKET_SEC", "3600"))
+
+NO_ANSWER = "No fue posible formular la respuesta."
+
+# Transporte HTTP: un pool keep-alive por URL de agente, con timeouts por fase.
+A2A_POOL_SIZE       = int(os.getenv("A2A_POOL_SIZE", "32"))
+A2A_KEEPALIVE_SEC   = float(os.getenv("A2A_KEEPALIVE_SEC", "30"))
+A2A_CONNECT_TIMEOUT = float(os.getenv("A2A_CONNECT_TIMEOUT_SEC", "5"))
+A2A_READ_TIMEOUT    = float(os.getenv("A2A_READ_TIMEOUT_SEC", str(A2A_TIMEOUT)))
+A2A_WRITE_TIMEOUT   = float(os.getenv("A2A_WRITE_TIMEOUT_SEC", "10"))
+A2A_POOL_TIMEOUT    = float(os.getenv("A2A_POOL_TIMEOUT_SEC", "30"))
+
+def _merge_timings(left: list[dict] | None, right: list[dict] | None) -> list[dict]:
+    """Acumula los tiempos por nodo de una corrida; `None` (estado inicial) los reinicia."""
+    if right is None:
+        return []
+    return (left or []) + right
 
 class State(TypedDict, total=False):
     query: str
@@ -19,24 +54,163 @@ class State(TypedDict, total=False):
     sufficient: bool
     final_answer: str
     iteration: int
+    speculated: bool
+    analysis_reason: str
+    analysis_error: bool
+    search_path: str
+    coalesced: bool
+    timings: Annotated[list[dict], _merge_timings]
+    costs: Annotated[list[dict], _merge_timings]
+
+
+_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
 
 
-def _post_a2a_envelope(url: str, user_text: str) -> dict | str:
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+def _get_session(url: str) -> requests.Session:
+    """Sesión `requests` compartida por URL (pool keep-alive para el grafo síncrono)."""
+    with _sessions_lock:
+        sess = _sessions.get(url)
+        if sess is None:
+            sess = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=A2A_POOL_SIZE)
+            sess.mount("http://", adapter)
+            sess.mount("https://", adapter)
+            _sessions[url] = sess
+        return sess
+
+
+def _get_async_client(url: str) -> httpx.AsyncClient:
+    """
+    Cliente httpx compartido por URL. Las conexiones de httpx quedan ligadas al
+    event loop que las abrió, por eso el pool se mantiene por loop.
+    """
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(url)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            headers=_HEADERS,
+            limits=httpx.Limits(max_connections=A2A_POOL_SIZE,
+                                max_keepalive_connections=A2A_POOL_SIZE,
+                                keepalive_expiry=A2A_KEEPALIVE_SEC),
+            timeout=httpx.Timeout(connect=A2A_CONNECT_TIMEOUT, read=A2A_READ_TIMEOUT,
+                                  write=A2A_WRITE_TIMEOUT, pool=A2A_POOL_TIMEOUT),
+        )
+        clients[url] = client
+    return client
+
+
+async def aclose_clients() -> None:
+    """Cierra los clientes httpx abiertos en el loop actual."""
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    await asyncio.gather(*(c.aclose() for c in clients.values()), return_exceptions=True)
+
+
+def _envelope_body(user_text: str, conversation_id: str | None = None) -> dict:
     body = {"role": "user", "content": {"type": "text", "text": user_text}}
-    r = requests.post(url, json=body, headers=headers, timeout=A2A_TIMEOUT)
-    print(f"[HTTP] {url} -> {r.status_code}, len={len(r.content)}")
-    brief_headers = {k: v for k, v in r.headers.items()
-                     if k.lower() in ("content-type", "content-length", "transfer-encoding")}
-    print("[HTTP] headers:", brief_headers)
-    r.raise_for_status()
+    if conversation_id:
+        body["conversation_id"] = conversation_id
+    return body
+
+
+def _decode_envelope(url: str, status: int, headers, text: str) -> dict | str:
+    if log.isEnabledFor(logging.DEBUG):
+        brief_headers = {k: v for k, v in headers.items()
+                         if k.lower() in ("content-type", "content-length", "transfer-encoding")}
+        log.debug("[HTTP] %s -> %s, len=%d headers=%s", url, status, len(text), brief_headers)
     try:
-        return r.json()
+        return json.loads(text)
     except Exception:
-        try:
-            return json.loads(r.text)
-        except Exception:
-            return r.text
+        return text
+
+
+# Rol de cada URL de agente (lo completa `_replica_pool`), para etiquetar las trazas.
+_url_roles: dict[str, str] = {}
+
+
+def _trace_span(url: str, user_text: str, conversation_id: str | None):
+    if TRACE is None:
+        return contextlib.nullcontext({})
+    return TRACE.span(_url_roles.get(url, url), url, user_text, conversation_id)
+
+
+def _post_a2a_envelope(url: str, user_text: str, conversation_id: str | None = None) -> dict | str:
+    with _trace_span(url, user_text, conversation_id) as rec:
+        r = _get_session(url).post(url, json=_envelope_body(user_text, conversation_id), headers=_HEADERS,
+                                   timeout=(A2A_CONNECT_TIMEOUT, A2A_READ_TIMEOUT))
+        rec.update(status=r.status_code, resp=r.text)
+        env = _decode_envelope(url, r.status_code, r.headers, r.text)
+        r.raise_for_status()
+    return env
+
+
+async def _apost_a2a_envelope(url: str, user_text: str, conversation_id: str | None = None) -> dict | str:
+    with _trace_span(url, user_text, conversation_id) as rec:
+        r = await _get_async_client(url).post(url, json=_envelope_body(user_text, conversation_id))
+        rec.update(status=r.status_code, resp=r.text)
+        env = _decode_envelope(url, r.status_code, r.headers, r.text)
+        r.raise_for_status()
+    return env
+
+def _sse_text(data: str) -> str:
+    """Texto de un evento SSE de python_a2a: {"content": "..."} / {"content": {"text": ...}} / string."""
+    parsed = _safe_json(data)
+    if isinstance(parsed, dict):
+        for k in ("content", "text", "delta"):
+            val = parsed.get(k)
+            if isinstance(val, dict):
+                val = val.get("text")
+            if isinstance(val, str):
+                return val
+        return ""
+    return parsed if isinstance(parsed, str) else str(parsed)
+
+
+class A2AStreamError(RuntimeError):
+    """El agente cortó el SSE con `event: error` (o un `{"error": ...}` en los datos)."""
+
+
+async def _astream_a2a(url: str, user_text: str, conversation_id: str | None = None,
+                       meta: dict | None = None) -> AsyncIterator[str]:
+    """
+    POST al endpoint `/stream` del agente y produce los fragmentos de texto del SSE.
+    Un evento de error se levanta como `A2AStreamError`; el costo que el agente
+    emite al final (`{"content": {"cost": ...}}`) queda en `meta["cost"]`.
+    """
+    client = _get_async_client(url)
+    stream_url = url.rstrip("/") + "/stream"
+    headers = {"Accept": "text/event-stream"}
+    event = "message"
+    async with client.stream("POST", stream_url, json=_envelope_body(user_text, conversation_id), headers=headers) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line:
+                event = "message"
+                continue
+            if line.startswith("event:"):
+                event = line[6:].strip()
+                continue
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            parsed = _safe_json(data)
+            if event == "error" or (isinstance(parsed, dict) and "error" in parsed):
+                raise A2AStreamError(str(parsed.get("error") if isinstance(parsed, dict) else parsed))
+            content = parsed.get("content") if isinstance(parsed, dict) else None
+            if isinstance(content, dict) and isinstance(content.get("cost"), dict):
+                if meta is not None:
+                    meta["cost"] = content["cost"]
+                continue
+            text = _sse_text(data)
+            if text:
+                yield text
+
 
 def _extract_agent_text(envelope: dict | str) -> str:
     """
@@ -92,84 +266,587 @@ def _extract_final_answer(agent_text: str) -> str:
     if isinstance(parsed, dict) and "final_answer" in parsed:
         val = parsed["final_answer"]
         return val if isinstance(val, str) else json.dumps(val, ensure_ascii=False)
-    return str(parsed) if parsed else "No fue posible formular la respuesta."
+    return str(parsed) if parsed else NO_ANSWER
 
 
-def node_search(state: State, *, config: RunnableConfig) -> State:
-    q = state["query"]
-    env = _post_a2a_envelope(SEARCH_URL, q)
+def _analysis_payload(state: State) -> str:
+    payload = {"query": state["query"], "internet_text": state.get("internet_text", "")}
+    if state.get("search_path", "").startswith("fast:"):
+        # Resultado del fast-path: si la tool es determinista, analysis lo acepta sin clasificar.
+        payload["path"] = state["search_path"]
+    return json.dumps(payload, ensure_ascii=False)
+
+def _search_payload(state: State) -> str:
+    """
+    Primera búsqueda: la consulta tal cual. En las siguientes iteraciones se envía
+    además el texto anterior y el motivo de la insuficiencia, para que el agente
+    complete lo que falta en vez de repetir la misma búsqueda.
+    """
+    if not state.get("iteration") or not state.get("internet_text"):
+        return state["query"]
+    return json.dumps({"query": state["query"], "previous_internet_text": state["internet_text"],
+                       "reason": state.get("analysis_reason", "")}, ensure_ascii=False)
+
+def _conversation_id(config: RunnableConfig | None) -> str | None:
+    cid = ((config or {}).get("configurable") or {}).get("conversation_id")
+    return str(cid) if cid is not None else None
 
-    print("############## ENVELOPE search ##############")
-    print(env)
-    print("#############################################")
+def with_conversation(config: RunnableConfig | None, prefix: str = "query") -> RunnableConfig:
+    """
+    Copia de `config` con un `conversation_id` nuevo para esta invocación (thread_id
+    + uuid). Los agentes lo usan como hilo ReAct y scope del memo de tools: vale
+    para las iteraciones de una consulta y no se reutiliza entre corridas aunque
+    el thread_id del grafo se repita. Sin él, cada mensaje A2A usa su propio hilo.
+    """
+    configurable = dict((config or {}).get("configurable") or {})
+    configurable["conversation_id"] = f"{configurable.get('thread_id', prefix)}-{uuid.uuid4().hex[:12]}"
+    return {**(config or {}), "configurable": configurable}
+
+def _timing(node: str, iteration: int, ms: float, **extra) -> State:
+    return {"timings": [{"node": node, "iteration": iteration, "ms": ms, **extra}]}
+
+def _cost(node: str, iteration: int, parsed) -> State:
+    """Costo reportado por el agente (llamadas LLM, tokens, tools) para esta iteración."""
+    cost = parsed.get("cost") if isinstance(parsed, dict) else None
+    return {"costs": [{"node": node, "iteration": iteration, **cost}]} if isinstance(cost, dict) else {}
+
+def _log_envelope(node: str, env: dict | str) -> None:
     meta = env.get("metadata", {}) if isinstance(env, dict) else {}
-    print(f"[analysis][meta] message_id={meta.get('message_id')} parent={meta.get('parent_message_id')}")
+    log_sampled(log, "envelope %s (message_id=%s parent=%s): %s", node,
+                meta.get("message_id"), meta.get("parent_message_id"), env)
 
+def _search_update(state: State, env: dict | str, ms: float) -> State:
+    _log_envelope("search", env)
     agent_text = _extract_agent_text(env)
     internet_text = _extract_internet_text(agent_text).strip()
+    parsed = _safe_json(agent_text)
+    # El costo va sólo en `costs` (ver `_cost`); timings lleva la ruta para distinguir fast-path y ReAct.
+    extra = {"path": parsed["path"]} if isinstance(parsed, dict) and "path" in parsed else {}
 
-    print(f"[{time.strftime('%H:%M:%S')}] ▶ NODE: search  | internet_text: {internet_text[:160]}...")
-    return {"internet_text": internet_text, "iteration": state.get("iteration", 0) + 1}
-
-def node_analysis(state: State, *, config: RunnableConfig) -> State:
-    payload = {"query": state["query"], "internet_text": state.get("internet_text", "")}
-    env = _post_a2a_envelope(ANALYSIS_URL, json.dumps(payload, ensure_ascii=False))
+    iteration = state.get("iteration", 0) + 1
+    log.info("▶ NODE: search   | %.0f ms | internet_text: %s...", ms, internet_text[:160])
+    return {"internet_text": internet_text, "iteration": iteration, "search_path": str(extra.get("path") or ""),
+            **_timing("search", iteration, ms, **extra),
+            **_cost("search", iteration, parsed)}
 
-    print("############## ENVELOPE analysis ############")
-    print(env)
-    print("#############################################")
-    meta = env.get("metadata", {}) if isinstance(env, dict) else {}
-    print(f"[analysis][meta] message_id={meta.get('message_id')} parent={meta.get('parent_message_id')}")
+def _analysis_update(state: State, env: dict | str, ms: float) -> State:
+    _log_envelope("analysis", env)
     agent_text = _extract_agent_text(env)
     sufficient = _extract_sufficient(agent_text)
+    parsed = _safe_json(agent_text)
+    extra = {"stage": parsed["stage"]} if isinstance(parsed, dict) and "stage" in parsed else {}
+    reason = str(parsed.get("reason") or "") if isinstance(parsed, dict) else ""
+    # Fallo del modelo (stage 'error') o del agente ({"error": ...}): no es un veredicto de insuficiencia.
+    failed = isinstance(parsed, dict) and (parsed.get("stage") == "error" or "error" in parsed)
+    iteration = state.get("iteration", 0)
+
+    log.info("▶ NODE: analysis | %.0f ms | sufficient: %s %s", ms, sufficient, f"({reason})" if reason else "")
+    return {"sufficient": sufficient, "analysis_reason": reason, "analysis_error": failed,
+            **_timing("analysis", iteration, ms, **extra),
+            **_cost("analysis", iteration, parsed)}
+
+def _response_update(state: State, env: dict | str, ms: float) -> State:
+    _log_envelope("response", env)
+    agent_text = _extract_agent_text(env)
+    final_answer = _extract_final_answer(agent_text)
+    iteration = state.get("iteration", 0)
+
+    log.info("▶ NODE: response | %.0f ms | final_answer: %s...", ms, final_answer[:240])
+    return {"final_answer": final_answer, **_timing("response", iteration, ms),
+            **_cost("response", iteration, _safe_json(agent_text))}
+
+
+_pools: dict[tuple[str, str], ReplicaPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _replica_pool(role: str, urls: str) -> ReplicaPool:
+    """Pool de réplicas del rol para el valor actual de su `*_URL` (lista separada por comas)."""
+    with _pools_lock:
+        pool = _pools.get((role, urls))
+        if pool is None:
+            pool = _pools[(role, urls)] = ReplicaPool(role, parse_urls(urls))
+            _url_roles.update((rep.url, role) for rep in pool.replicas)
+        return pool
 
-    print(f"[{time.strftime('%H:%M:%S')}] ▶ NODE: analysis | sufficient: {sufficient}")
-    return {"sufficient": sufficient}
+
+def replica_stats() -> dict[str, dict]:
+    with _pools_lock:
+        return {role: pool.stats() for (role, _), pool in _pools.items()}
+
+
+def _timed_post(role: str, urls: str, user_text: str, conversation_id: str | None = None) -> tuple[dict | str, float]:
+    with REGISTRY.timer("a2a_hop_seconds", role=role) as t:
+        env = _replica_pool(role, urls).call(lambda url: _post_a2a_envelope(url, user_text, conversation_id))
+    return env, t["ms"]
+
+async def _atimed_post(role: str, urls: str, user_text: str,
+                       conversation_id: str | None = None) -> tuple[dict | str, float]:
+    with REGISTRY.timer("a2a_hop_seconds", role=role) as t:
+        env = await _replica_pool(role, urls).acall(lambda url: _apost_a2a_envelope(url, user_text, conversation_id))
+    return env, t["ms"]
+
+
+def node_search(state: State, *, config: RunnableConfig) -> State:
+    return _search_update(state, *_timed_post("search", SEARCH_URL, _search_payload(state),
+                                              _conversation_id(config)))
+
+def node_analysis(state: State, *, config: RunnableConfig) -> State:
+    return _analysis_update(state, *_timed_post("analysis", ANALYSIS_URL, _analysis_payload(state),
+                                                _conversation_id(config)))
 
 def node_response(state: State, *, config: RunnableConfig) -> State:
-    payload = {"query": state["query"], "internet_text": state.get("internet_text", "")}
-    env = _post_a2a_envelope(RESPONSE_URL, json.dumps(payload, ensure_ascii=False))
+    return _response_update(state, *_timed_post("response", RESPONSE_URL, _analysis_payload(state),
+                                                _conversation_id(config)))
 
-    print("############## ENVELOPE response ############")
-    print(env)
-    print("#############################################")
 
-    agent_text = _extract_agent_text(env)
-    final_answer = _extract_final_answer(agent_text)
+async def anode_search(state: State, *, config: RunnableConfig) -> State:
+    return _search_update(state, *await _atimed_post("search", SEARCH_URL, _search_payload(state),
+                                                     _conversation_id(config)))
+
+async def anode_analysis(state: State, *, config: RunnableConfig) -> State:
+    return _analysis_update(state, *await _atimed_post("analysis", ANALYSIS_URL, _analysis_payload(state),
+                                                       _conversation_id(config)))
+
+async def anode_response(state: State, *, config: RunnableConfig) -> State:
+    return _response_update(state, *await _atimed_post("response", RESPONSE_URL, _analysis_payload(state),
+                                                       _conversation_id(config)))
+
+async def anode_response_stream(state: State, *, config: RunnableConfig) -> State:
+    """
+    Como `anode_response`, pero consume el SSE del agente response y reenvía cada
+    fragmento como evento custom `{"final_answer_delta": ...}` (stream_mode="custom").
+    Si el agente no soporta streaming o el SSE falla antes del primer fragmento,
+    cae al POST normal.
+    """
+    from langgraph.config import get_stream_writer
+    writer = get_stream_writer()
+    parts: list[str] = []
+    meta: dict = {}
+    first_ms = None
+    pool = _replica_pool("response", RESPONSE_URL)
+    rep = pool.pick()
+    try:
+        with REGISTRY.timer("a2a_hop_seconds", role="response_stream") as t, pool.track(rep):
+            t0 = time.perf_counter()
+            async for chunk in _astream_a2a(rep.url, _analysis_payload(state), _conversation_id(config), meta):
+                if first_ms is None:
+                    first_ms = round((time.perf_counter() - t0) * 1000, 2)
+                parts.append(chunk)
+                writer({"final_answer_delta": chunk})
+    except (httpx.HTTPError, A2AStreamError) as e:
+        if parts:
+            raise
+        log.warning("streaming no disponible en %s (%s); se usa POST normal", rep.url, e)
+        return await anode_response(state, config=config)
+
+    final_answer = "".join(parts).strip() or NO_ANSWER
+    log.info("▶ NODE: response | %.0f ms (primer token %s ms) | final_answer: %s...", t["ms"], first_ms, final_answer[:240])
+    iteration = state.get("iteration", 0)
+    return {"final_answer": final_answer, **_timing("response", iteration, t["ms"], first_token_ms=first_ms),
+            **_cost("response", iteration, meta)}
+
+# Contadores del modo especulativo (proceso): lanzadas, confirmadas y descartadas.
+SPECULATION_STATS = {"launched": 0, "committed": 0, "wasted": 0}
+
+
+async def _discard(task: asyncio.Task) -> None:
+    task.cancel()
+    with contextlib.suppress(BaseException):
+        await task
+    SPECULATION_STATS["wasted"] += 1
+
+
+async def anode_analysis_speculative(state: State, *, config: RunnableConfig) -> State:
+    """
+    Analysis con respuesta especulativa: lanza el POST a response en paralelo con
+    el de analysis sobre el mismo internet_text. Si el grafo iría a response
+    (suficiente o última iteración) se confirma esa respuesta y se salta el nodo
+    response; si vuelve a search, la especulación se cancela y se cuenta como
+    desperdiciada.
+    """
+    payload = _analysis_payload(state)
+    conv_id = _conversation_id(config)
+    spec = asyncio.create_task(_atimed_post("response", RESPONSE_URL, payload, conv_id))
+    SPECULATION_STATS["launched"] += 1
+    try:
+        env, ms = await _atimed_post("analysis", ANALYSIS_URL, payload, conv_id)
+    except BaseException:
+        await _discard(spec)
+        raise
+
+    update = _analysis_update(state, env, ms)
+    if _route_after_analysis({**state, **update}) != "response":
+        await _discard(spec)
+        return update
+    try:
+        resp_env, resp_ms = await spec
+    except Exception as e:
+        SPECULATION_STATS["wasted"] += 1
+        log.warning("response especulativa falló (%s); se ejecuta el nodo response", e)
+        return update
+    SPECULATION_STATS["committed"] += 1
+    resp = _response_update(state, resp_env, resp_ms)
+    return {**update, **resp, "timings": update["timings"] + [{**resp["timings"][0], "speculative": True}],
+            "costs": update.get("costs", []) + resp.get("costs", []), "speculated": True}
 
-    print(f"[{time.strftime('%H:%M:%S')}] ▶ NODE: response| final_answer: {final_answer[:240]}...")
-    return {"final_answer": final_answer}
 
 def _route_after_analysis(state: State) -> str:
     if state.get("sufficient"): return "response"
+    # Sin veredicto (modelo saturado): re-buscar sólo sumaría llamadas; se responde con lo que hay.
+    if state.get("analysis_error"): return "response"
     if state.get("iteration", 0) >= MAX_ITERS: return "response"
     return "search"
 
+def _route_after_speculative_analysis(state: State) -> str:
+    if state.get("speculated"): return "end"
+    return _route_after_analysis(state)
 
-def build_app():
+
+def build_app(async_mode: bool = False, memory: bool = True, stream_response: bool = STREAM_RESPONSE,
+              speculative: bool = SPECULATIVE):
+    """
+    Compila el grafo search -> analysis -> response.
+    Con `async_mode=True` los nodos son corrutinas sobre el pool httpx compartido
+    y el grafo se usa con `app.ainvoke` / `app.astream`.
+    Con `memory=False` se compila sin checkpointer (modo batch: el estado de
+    cada consulta no se retiene en memoria al terminar).
+    Con `stream_response=True` (sólo en modo async) el nodo response reenvía los
+    tokens del agente; se consumen con `app.astream(..., stream_mode=["updates", "custom"])`.
+    Con `speculative=True` (sólo en modo async) response se lanza junto con
+    analysis; las respuestas confirmadas no pasan por el nodo response (ni por su
+    streaming). Ver `SPECULATION_STATS`.
+    """
+    if speculative and not async_mode:
+        raise ValueError("speculative=True requiere async_mode=True")
+    from langgraph.graph import StateGraph, END
+    from langgraph.checkpoint.memory import MemorySaver
     g = StateGraph(State)
-    g.add_node("search", node_search)
-    g.add_node("analysis", node_analysis)
-    g.add_node("response", node_response)
+    if async_mode:
+        g.add_node("search", anode_search)
+        g.add_node("analysis", anode_analysis_speculative if speculative else anode_analysis)
+        g.add_node("response", anode_response_stream if stream_response else anode_response)
+    else:
+        g.add_node("search", node_search)
+        g.add_node("analysis", node_analysis)
+        g.add_node("response", node_response)
 
     g.set_entry_point("search")
     g.add_edge("search", "analysis")
-    g.add_conditional_edges("analysis", _route_after_analysis, {"search": "search", "response": "response"})
+    if speculative:
+        g.add_conditional_edges("analysis", _route_after_speculative_analysis,
+                                {"search": "search", "response": "response", "end": END})
+    else:
+        g.add_conditional_edges("analysis", _route_after_analysis, {"search": "search", "response": "response"})
     g.add_edge("response", END)
 
-    return g.compile(checkpointer=MemorySaver())
+    return g.compile(checkpointer=MemorySaver() if memory else None)
+
+
+_apps: dict[tuple, tuple[Warmup, dict]] = {}
+_apps_lock = threading.Lock()
+
+
+def _app_slot(**kwargs) -> tuple[Warmup, dict]:
+    key = tuple(sorted(kwargs.items()))
+    with _apps_lock:
+        slot = _apps.get(key)
+        if slot is None:
+            box: dict = {}
+            slot = _apps[key] = (Warmup(lambda: box.update(app=build_app(**kwargs)), "orchestrator"), box)
+        return slot
+
+
+def prewarm_app(**kwargs) -> None:
+    """Compila en segundo plano (imports de langgraph incluidos) el grafo que pedirá `get_app(**kwargs)`."""
+    _app_slot(**kwargs)[0].start()
+
+
+def get_app(**kwargs):
+    """Grafo de `build_app(**kwargs)` compilado una vez por proceso; espera al pre-armado si está en curso."""
+    warmup, box = _app_slot(**kwargs)
+    warmup.wait()
+    return box["app"]
+
+
+def initial_state(query: str) -> State:
+    return {"query": query, "internet_text": "", "sufficient": False, "final_answer": "", "iteration": 0,
+            "speculated": False, "analysis_reason": "", "analysis_error": False, "search_path": "", "timings": None, "costs": None}
+
+
+# Coalescencia de consultas idénticas en vuelo (clave: consulta normalizada).
+QUERY_FLIGHT = SingleFlight(name="query")
+
+ANSWER_CACHE = make_cache(maxsize=int(os.getenv("A2A_ANSWER_CACHE_SIZE", "10000")), ttl=ANSWER_CACHE_TTL_SEC,
+                          path=ANSWER_CACHE_PATH, table="answers") if ANSWER_CACHE_ENABLED else None
+
+# Consultas cuya respuesta depende del momento: su clave lleva la franja horaria actual.
+_TIME_SENSITIVE_RX = re.compile(
+    r"\b(hoy|ahora|actual|actualmente|mañana|ayer|esta semana|este mes|este año|último|últimos|última|últimas|"
+    r"reciente|recientes|today|now|tomorrow|yesterday|latest|current)\b")
+
+
+def _answer_key(query: str, now: float | None = None) -> tuple[str, float]:
+    """(clave, ttl): con franja de ANSWER_CACHE_BUCKET_SEC si la consulta es sensible al tiempo."""
+    norm = normalize_text(query)
+    if ANSWER_CACHE_BUCKET_SEC > 0 and _TIME_SENSITIVE_RX.search(norm):
+        now = time.time() if now is None else now
+        bucket = int(now // ANSWER_CACHE_BUCKET_SEC)
+        left = (bucket + 1) * ANSWER_CACHE_BUCKET_SEC - now
+        return make_key("answer", norm, bucket), min(ANSWER_CACHE_TTL_SEC, left)
+    return make_key("answer", norm), ANSWER_CACHE_TTL_SEC
+
+
+def _cached_answer(query: str) -> State | None:
+    if ANSWER_CACHE is None:
+        return None
+    hit = ANSWER_CACHE.get(_answer_key(query)[0])
+    REGISTRY.inc("a2a_answer_cache_total", result="hit" if hit is not None else "miss")
+    if hit is None:
+        return None
+    return {**initial_state(query), **hit, "timings": [], "costs": []}
+
+
+def _store_answer(query: str, final: State) -> None:
+    """
+    Guarda la respuesta final. No se guardan respuestas vacías, el texto de fallo
+    ni las redactadas con contexto insuficiente (agotadas las iteraciones).
+    """
+    answer = (final.get("final_answer") or "").strip()
+    if ANSWER_CACHE is None or not answer or answer == NO_ANSWER:
+        return
+    if not final.get("sufficient"):
+        REGISTRY.inc("a2a_answer_cache_total", result="skip_insufficient")
+        return
+    key, ttl = _answer_key(query)
+    ANSWER_CACHE.set(key, {k: final.get(k) for k in ("final_answer", "internet_text", "sufficient", "iteration")},
+                     ttl=ttl)
+    REGISTRY.inc("a2a_answer_cache_total", result="store")
+
+
+def invalidate_answer(query: str) -> bool:
+    """Borra la respuesta cacheada de `query` (la de la franja actual si es sensible al tiempo)."""
+    return ANSWER_CACHE is not None and ANSWER_CACHE.delete(_answer_key(query)[0])
+
+
+def clear_answer_cache() -> None:
+    if ANSWER_CACHE is not None:
+        ANSWER_CACHE.clear()
+
+
+def answer_cache_stats() -> dict:
+    return ANSWER_CACHE.stats() if ANSWER_CACHE is not None else {"backend": "disabled"}
+
+
+REGISTRY.describe("a2a_answer_cache_total", "Consultas por resultado de la caché de respuestas (hit/miss/store)")
+
+
+def _shared_result(final: State, outcome: str) -> tuple[State, str]:
+    """
+    Los que se unieron a otra corrida reciben una copia propia del estado, sin
+    `costs` (ya los informa el leader) y marcada `coalesced`.
+    """
+    if outcome not in ("joined", "reused"):
+        return final, outcome
+    return {**copy.deepcopy(final), "costs": [], "coalesced": True}, outcome
+
+
+async def arun_query(app, query: str, config: RunnableConfig | None = None,
+                     coalesce: bool | None = None) -> tuple[State, str]:
+    """
+    Corre una consulta por el grafo async. Si la respuesta está en ANSWER_CACHE
+    se devuelve sin tocar a los agentes; si otra idéntica ya está en vuelo se une
+    a esa corrida y comparte su resultado. Devuelve (estado final, outcome:
+    cached/leader/joined/reused). La caché se lee y escribe en un hilo aparte
+    (SQLite bloquea) para no frenar el event loop.
+    """
+    cached = await asyncio.to_thread(_cached_answer, query)
+    if cached is not None:
+        return cached, "cached"
+    config = with_conversation(config or {"configurable": {"thread_id": f"query-{time.time_ns()}"}})
+
+    async def _run() -> State:
+        final = await app.ainvoke(initial_state(query), config=config)
+        await asyncio.to_thread(_store_answer, query, final)
+        return final
+
+    if not (SINGLEFLIGHT_ENABLED if coalesce is None else coalesce):
+        return await _run(), "leader"
+    return _shared_result(*await QUERY_FLIGHT.do(normalize_text(query), _run))
+
+
+def run_query(app, query: str, config: RunnableConfig | None = None,
+              coalesce: bool | None = None) -> tuple[State, str]:
+    """Variante síncrona de `arun_query` (grafo de `build_app()`), coalescida entre hilos."""
+    cached = _cached_answer(query)
+    if cached is not None:
+        return cached, "cached"
+    config = with_conversation(config or {"configurable": {"thread_id": f"query-{time.time_ns()}"}})
+
+    def _run() -> State:
+        final = app.invoke(initial_state(query), config=config)
+        _store_answer(query, final)
+        return final
+
+    if not (SINGLEFLIGHT_ENABLED if coalesce is None else coalesce):
+        return _run(), "leader"
+    return _shared_result(*QUERY_FLIGHT.do_sync(normalize_text(query), _run))
+
+
+def _iter_queries(stream: TextIO) -> Iterator[dict]:
+    """
+    Lee consultas en JSONL: {"id": ..., "query": ...}, un string JSON o texto plano
+    por línea. Las líneas vacías se ignoran; si falta `id` se usa el número de línea.
+    """
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except Exception:
+            obj = line
+        if isinstance(obj, dict):
+            yield {"id": obj.get("id", lineno), "query": str(obj.get("query") or "")}
+        else:
+            yield {"id": lineno, "query": str(obj)}
+
+
+async def _run_batch_item(app, item: dict) -> dict:
+    config: RunnableConfig = {"configurable": {"thread_id": f"batch-{item['id']}"}}
+    t0 = time.perf_counter()
+    try:
+        final, outcome = await arun_query(app, item["query"], config)
+        return {
+            "id": item["id"], "query": item["query"],
+            "final_answer": final.get("final_answer", ""),
+            "sufficient": bool(final.get("sufficient")),
+            "iterations": final.get("iteration", 0),
+            "timings": final.get("timings", []),
+            "costs": final.get("costs", []),
+            "coalesced": outcome in ("joined", "reused"),
+            "cached": outcome == "cached",
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+        }
+    except Exception as e:
+        return {
+            "id": item["id"], "query": item["query"],
+            "error": f"{type(e).__name__}: {e}",
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+        }
+
+
+async def run_batch(queries: Iterator[dict], out: TextIO, concurrency: int = BATCH_CONCURRENCY, app=None) -> dict:
+    """
+    Ejecuta muchas consultas por el grafo asíncrono con a lo sumo `concurrency`
+    en vuelo. Cada resultado se escribe en `out` como una línea JSON en orden de
+    término. Devuelve un resumen con totales y throughput.
+    """
+    app = app or get_app(async_mode=True, memory=False)
+    pending: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    summary = {"total": 0, "errors": 0, "cached": 0}
+    saved0 = QUERY_FLIGHT.stats()["saved"]
+    t0 = time.perf_counter()
+
+    async def _producer():
+        it = iter(queries)
+        while True:
+            item = await asyncio.to_thread(next, it, None)
+            if item is None:
+                break
+            await pending.put(item)
+        for _ in range(concurrency):
+            await pending.put(None)
+
+    async def _worker():
+        while (item := await pending.get()) is not None:
+            res = await _run_batch_item(app, item)
+            summary["total"] += 1
+            summary["errors"] += "error" in res
+            summary["cached"] += bool(res.get("cached"))
+            out.write(json.dumps(res, ensure_ascii=False) + "\n")
+            out.flush()
+
+    try:
+        await asyncio.gather(_producer(), *(_worker() for _ in range(concurrency)))
+    finally:
+        await aclose_clients()
+    elapsed = time.perf_counter() - t0
+    summary["elapsed_sec"] = round(elapsed, 3)
+    summary["qps"] = round(summary["total"] / elapsed, 3) if elapsed > 0 else 0.0
+    summary["coalesced"] = QUERY_FLIGHT.stats()["saved"] - saved0
+    return summary
+
+
+def _main_batch(args: argparse.Namespace) -> None:
+    out = sys.stdout if args.out == "-" else open(args.out, "a" if args.append else "w", encoding="utf-8")
+    src = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+    try:
+        # Los logs de los nodos van a stderr para no mezclarse con el JSONL de salida.
+        with contextlib.redirect_stdout(sys.stderr):
+            summary = asyncio.run(run_batch(_iter_queries(src), out, args.concurrency))
+    finally:
+        if src is not sys.stdin: src.close()
+        if out is not sys.stdout: out.close()
+    print(json.dumps(summary), file=sys.stderr)
+
+
+async def _demo_stream(init: State, config: RunnableConfig) -> State:
+    """Corre el grafo async imprimiendo los tokens de la respuesta final según llegan."""
+    app = build_app(async_mode=True, stream_response=True)
+    try:
+        async for mode, ev in app.astream(init, config=config, stream_mode=["updates", "custom"]):
+            if mode == "custom" and "final_answer_delta" in ev:
+                print(ev["final_answer_delta"], end="", flush=True)
+            else:
+                print(ev)
+        print()
+        return (await app.aget_state(config)).values
+    finally:
+        await aclose_clients()
+
 
 if __name__ == "__main__":
-    app = build_app()
-    config: RunnableConfig = {"configurable": {"thread_id": "thread-1"}}
-
-    init: State = {
-        "query": "Desde hoy, ¿cuantos días faltan para navidad? Considerando que hoy es 17 de Octubre 2025",
-        "internet_text": "",
-        "sufficient": False,
-        "final_answer": "",
-        "iteration": 0,
-    }
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    parser = argparse.ArgumentParser(description="Orquestador A2A (search -> analysis -> response)")
+    parser.add_argument("--batch", metavar="PATH",
+                        help="archivo JSONL de consultas ('-' para stdin); activa el modo batch")
+    parser.add_argument("--out", default="-", help="destino JSONL de resultados ('-' para stdout)")
+    parser.add_argument("--append", action="store_true", help="agrega a --out en vez de sobrescribirlo")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help="máximo de consultas en vuelo en modo batch")
+    parser.add_argument("--stream", action="store_true",
+                        help="grafo async con streaming de tokens de la respuesta final")
+    parser.add_argument("--invalidate", metavar="QUERY", action="append",
+                        help="borra la respuesta cacheada de QUERY (repetible) y termina")
+    parser.add_argument("--clear-answer-cache", action="store_true", help="vacía la caché de respuestas y termina")
+    args = parser.parse_args()
+    if args.invalidate or args.clear_answer_cache:
+        if args.clear_answer_cache:
+            clear_answer_cache()
+        for q in args.invalidate or []:
+            print(f"{q!r}: {'borrada' if invalidate_answer(q) else 'no estaba'}")
+        print(json.dumps(answer_cache_stats()))
+        sys.exit(0)
+    if args.batch:
+        prewarm_app(async_mode=True, memory=False)
+        _main_batch(args)
+        sys.exit(0)
+
+    if not args.stream:
+        prewarm_app()
+    config: RunnableConfig = with_conversation({"configurable": {"thread_id": "thread-1"}})
+
+    init: State = initial_state(
+        "Desde hoy, ¿cuantos días faltan para navidad? Considerando que hoy es 17 de Octubre 2025")
+
+    if args.stream:
+        print("=== STREAM (tokens) ===")
+        final = asyncio.run(_demo_stream(init, config))
+        print(f"\nRESPUESTA FINAL:{final.get('final_answer')}")
+        sys.exit(0)
+
+    app = get_app()
 
     print("=== STREAM ===")
     for ev in app.stream(init, config=config):
@@ -0,0 +1,283 @@
+"""
+Base de conocimiento filosófica para `philosophy_snippet`: entradas curadas en un
+archivo binario (PKB2) que se abre con mmap. El archivo trae también la tabla de
+alias ordenada y un autómata Aho-Corasick aplanado en arreglos u32, que se leen
+en sitio: los workers comparten esas páginas en vez de reconstruir el índice al
+cargar, y una sola pasada encuentra todas las entradas mencionadas en una consulta.
+
+    python philo_kb.py build corpus.jsonl filosofia.pkb   # {"name", "aliases", "text"} por línea
+    python philo_kb.py lookup filosofia.pkb "¿qué es el imperativo categórico?"
+"""
+from __future__ import annotations
+import os, re, sys, json, mmap, array, struct, unicodedata
+from collections import deque
+from typing import Iterable, Iterator, Optional
+
+PHILO_KB_PATH = os.getenv("PHILO_KB_PATH") or None
+
+_MAGIC = b"PKB2"
+# magic, entradas, alias, estados, transiciones, salidas, ids, bytes de alias, reservado
+_HEADER = struct.Struct("<4s8I")
+_SLOT = struct.Struct("<QI")        # offset (desde el inicio de los datos), largo
+_ALIAS_FIELDS = 5                   # offset y bytes del texto, largo en caracteres, primer id, cantidad de ids
+_LEGACY_HEADER = struct.Struct("<4sIII")  # PKB1: alias como texto, índice armado al cargar
+_WORD_RX = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sin tildes y con un único espacio entre palabras."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    plain = "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+    return _WORD_RX.sub(" ", plain).strip()
+
+
+class _Automaton:
+    """Aho-Corasick sobre los alias normalizados (se usa al serializar)."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.out: list[list[str]] = [[]]
+        for p in patterns:
+            node = 0
+            for ch in p:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append(p)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+
+def pack_u32(values: list[int]) -> bytes:
+    return struct.pack(f"<{len(values)}I", *values)
+
+
+def u32_view(buf, at: int, count: int):
+    """Arreglo u32 little-endian en `buf[at:]`; sobre mmap no copia (salvo en hosts big-endian)."""
+    if sys.byteorder == "little":
+        return memoryview(buf)[at:at + 4 * count].cast("I")
+    arr = array.array("I", bytes(buf[at:at + 4 * count]))
+    arr.byteswap()
+    return arr
+
+
+def encode(entries: Iterable[dict]) -> bytes:
+    """Serializa entradas `{"name", "aliases", "text"}` con su tabla de alias y autómata."""
+    slots, blobs, offset = [], [], 0
+    alias_ids: dict[str, list[int]] = {}
+    for i, e in enumerate(entries):
+        blob = f"{e['name']}\x00{e['text']}".encode("utf-8")
+        slots.append(_SLOT.pack(offset, len(blob)))
+        blobs.append(blob)
+        offset += len(blob)
+        for alias in {e["name"], *e.get("aliases", [])}:
+            key = normalize(alias)
+            if key and i not in alias_ids.get(key, ()):
+                alias_ids.setdefault(key, []).append(i)
+    # Ordenados por bytes UTF-8: `exact` busca por bisección sobre el archivo.
+    aliases = sorted(alias_ids, key=lambda a: a.encode("utf-8"))
+    pos = {a: k for k, a in enumerate(aliases)}
+    index, ids, texts, text_off = [], [], [], 0
+    for a in aliases:
+        raw = a.encode("utf-8")
+        index += [text_off, len(raw), len(a), len(ids), len(alias_ids[a])]
+        ids += alias_ids[a]
+        texts.append(raw)
+        text_off += len(raw)
+    ac = _Automaton(aliases)
+    trans_start, trans, out_start, out = [0], [], [0], []
+    for node, outs in zip(ac.goto, ac.out):
+        for ch in sorted(node, key=ord):
+            trans += [ord(ch), node[ch]]
+        trans_start.append(len(trans) // 2)
+        out += [pos[p] for p in outs]
+        out_start.append(len(out))
+    header = _HEADER.pack(_MAGIC, len(slots), len(aliases), len(ac.goto), len(trans) // 2, len(out), len(ids),
+                          text_off, 0)
+    return b"".join([header, *slots, *(pack_u32(a) for a in (index, ids, trans_start, trans, ac.fail,
+                                                             out_start, out)), *texts, *blobs])
+
+
+def _legacy_entries(buf) -> list[dict]:
+    """Entradas de un archivo PKB1 (alias en texto) para re-serializarlas en memoria."""
+    _, n, alias_len, _ = _LEGACY_HEADER.unpack_from(buf, 0)
+    alias_at = _LEGACY_HEADER.size + n * _SLOT.size
+    data_at = alias_at + alias_len
+    entries = []
+    for i in range(n):
+        off, length = _SLOT.unpack_from(buf, _LEGACY_HEADER.size + i * _SLOT.size)
+        name, _, text = bytes(buf[data_at + off:data_at + off + length]).decode("utf-8").partition("\x00")
+        entries.append({"name": name, "aliases": [], "text": text})
+    for line in bytes(buf[alias_at:data_at]).decode("utf-8").splitlines():
+        alias, idx = line.rsplit("\t", 1)
+        entries[int(idx)]["aliases"].append(alias)
+    return entries
+
+
+class PhiloKB:
+    """Lector del formato binario (sobre mmap o bytes): alias y autómata se consultan en sitio."""
+
+    def __init__(self, buf, source: str = "memoria"):
+        self.source = source
+        if bytes(buf[:4]) == b"PKB1":
+            # Formato anterior: se re-serializa en memoria (reconstruir con `build` para compartirlo).
+            buf = encode(_legacy_entries(buf))
+        magic, n, n_alias, n_states, n_trans, n_out, n_ids, text_len, _ = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{source}: no es una base PKB2")
+        self._buf = buf
+        self._n, self._n_alias, self._n_states = n, n_alias, n_states
+        self._slots_at = _HEADER.size
+        at = self._slots_at + n * _SLOT.size
+        arrays = []
+        for count in (n_alias * _ALIAS_FIELDS, n_ids, n_states + 1, 2 * n_trans, n_states, n_states + 1, n_out):
+            arrays.append(u32_view(buf, at, count))
+            at += 4 * count
+        (self._alias, self._ids, self._trans_start, self._trans, self._fail,
+         self._out_start, self._out) = arrays
+        self._text_at = at
+        self._data_at = at + text_len
+
+    @classmethod
+    def open(cls, path: str) -> "PhiloKB":
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), source=path)
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[dict]) -> "PhiloKB":
+        return cls(encode(entries))
+
+    def __len__(self) -> int:
+        return self._n
+
+    def entry(self, idx: int) -> tuple[str, str]:
+        offset, length = _SLOT.unpack_from(self._buf, self._slots_at + idx * _SLOT.size)
+        start = self._data_at + offset
+        name, _, text = bytes(self._buf[start:start + length]).decode("utf-8").partition("\x00")
+        return name, text
+
+    def _alias_text(self, k: int) -> bytes:
+        off, length = self._alias[k * _ALIAS_FIELDS], self._alias[k * _ALIAS_FIELDS + 1]
+        return bytes(self._buf[self._text_at + off:self._text_at + off + length])
+
+    def _alias_entries(self, k: int) -> list[int]:
+        first, count = self._alias[k * _ALIAS_FIELDS + 3], self._alias[k * _ALIAS_FIELDS + 4]
+        return list(self._ids[first:first + count])
+
+    def _step(self, node: int, code: int) -> int:
+        """Transición del autómata por bisección en las aristas del estado; -1 si no hay."""
+        lo, hi = self._trans_start[node], self._trans_start[node + 1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = self._trans[2 * mid]
+            if key < code:
+                lo = mid + 1
+            elif key > code:
+                hi = mid
+            else:
+                return self._trans[2 * mid + 1]
+        return -1
+
+    def _scan(self, text: str) -> Iterator[tuple[int, int]]:
+        """(fin, alias) por cada alias que aparece en `text`."""
+        node = 0
+        for i, ch in enumerate(text):
+            code = ord(ch)
+            nxt = self._step(node, code)
+            while nxt < 0 and node:
+                node = self._fail[node]
+                nxt = self._step(node, code)
+            node = max(nxt, 0)
+            for j in range(self._out_start[node], self._out_start[node + 1]):
+                yield i + 1, self._out[j]
+
+    def search(self, query: str, limit: int = 3) -> list[tuple[int, float]]:
+        """
+        Entradas mencionadas en `query`, ordenadas: gana la que cubre más texto
+        (alias más largos, varias menciones) y, a igualdad, la que aparece antes.
+        """
+        text = normalize(query)
+        if not text:
+            return []
+        scores: dict[int, list[float]] = {}
+        for end, k in self._scan(text):
+            size = self._alias[k * _ALIAS_FIELDS + 2]
+            start = end - size
+            if (start > 0 and text[start - 1] != " ") or (end < len(text) and text[end] != " "):
+                continue
+            for idx in self._alias_entries(k):
+                cov, first = scores.get(idx, [0.0, float(start)])
+                scores[idx] = [cov + size / len(text), min(first, start)]
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1][0], kv[1][1]))
+        return [(idx, round(cov, 4)) for idx, (cov, _) in ranked[:limit]]
+
+    def exact(self, topic: str) -> Optional[int]:
+        """Entrada cuyo alias es exactamente `topic` (normalizado), si es única."""
+        key = normalize(topic).encode("utf-8")
+        lo, hi = 0, self._n_alias
+        while lo < hi:
+            mid = (lo + hi) // 2
+            alias = self._alias_text(mid)
+            if alias < key:
+                lo = mid + 1
+            elif alias > key:
+                hi = mid
+            else:
+                ids = self._alias_entries(mid)
+                return ids[0] if len(ids) == 1 else None
+        return None
+
+    def stats(self) -> dict:
+        return {"entries": self._n, "aliases": self._n_alias, "states": self._n_states}
+
+
+def load_kb(seed: Iterable[dict], path: Optional[str] = PHILO_KB_PATH) -> PhiloKB:
+    """Abre `path` (PHILO_KB_PATH) si está definido; si no, arma la base en memoria desde `seed`."""
+    return PhiloKB.open(path) if path else PhiloKB.from_entries(seed)
+
+
+def _read_jsonl(path: str) -> Iterable[dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Base filosófica indexada (formato PKB2)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="JSONL {name, aliases, text} -> archivo .pkb")
+    b.add_argument("corpus")
+    b.add_argument("out")
+    q = sub.add_parser("lookup", help="busca una consulta en un .pkb")
+    q.add_argument("kb")
+    q.add_argument("query")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        data = encode(_read_jsonl(args.corpus))
+        tmp = args.out + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, args.out)
+        print(f"{args.out}: {PhiloKB.open(args.out).stats()}")
+    else:
+        kb = PhiloKB.open(args.kb)
+        for idx, score in kb.search(args.query):
+            name, text = kb.entry(idx)
+            print(f"{score:.3f}  {name}: {text}")
@@ -0,0 +1,212 @@
+"""
+Reproduce trazas grabadas con A2A_TRACE_PATH (ver a2a_trace.py) contra los
+agentes, para planificar capacidad por agente o reproducir regresiones de
+latencia sin el orquestador. Informa percentiles de latencia y tasa de error
+por agente, junto a los percentiles grabados originalmente.
+
+Modos:
+  timed   lazo abierto con los tiempos originales entre requests (`--speed 2` = el doble de rápido)
+  qps     lazo abierto a tasa fija (`--qps 50`, con `--poisson` llegadas exponenciales)
+  closed  lazo cerrado: `--concurrency N` clientes enviando sin pausa
+
+    python replay.py trace.jsonl --mode timed --speed 1
+    python replay.py trace.jsonl --mode qps --qps 40 --role search --target search=http://127.0.0.1:9001
+    python replay.py trace.jsonl --mode closed --concurrency 16 --stub --out replay.json
+"""
+from __future__ import annotations
+import json, time, random, asyncio, argparse
+from typing import Optional
+
+import httpx
+
+from a2a_trace import read_trace
+from benchmark import _percentiles
+
+
+def _body_error(body: object) -> Optional[str]:
+    """
+    Tipo de error informado dentro de una respuesta 200: contenido A2A de tipo
+    'error', `{"error": ...}` (en el cuerpo o en el texto), stage 'error' del
+    analyst o '[search_error]' del search. None si la respuesta es válida.
+
+    >>> _body_error({"content": {"type": "text", "text": '{"sufficient": true}'}}) is None
+    True
+    >>> _body_error({"content": {"type": "text", "text": '{"error": "boom", "trace": "..."}'}})
+    'agent_error'
+    >>> _body_error({"content": {"type": "error", "message": "boom"}})
+    'a2a_error'
+    >>> _body_error({"content": {"type": "text", "text": '{"internet_text": "[search_error] timeout"}'}})
+    'search_error'
+    """
+    if not isinstance(body, dict):
+        return "bad_body"
+    if "error" in body:
+        return "agent_error"
+    content = body.get("content") if isinstance(body.get("content"), dict) else {}
+    if content.get("type") == "error":
+        return "a2a_error"
+    text = content.get("text")
+    try:
+        parsed = json.loads(text) if isinstance(text, str) else None
+    except ValueError:
+        return None
+    if not isinstance(parsed, dict):
+        return None
+    if "error" in parsed or parsed.get("stage") == "error":
+        return "agent_error"
+    if str(parsed.get("internet_text") or "").startswith("[search_error]"):
+        return "search_error"
+    return None
+
+
+def parse_targets(specs: list[str]) -> dict[str, str]:
+    """`rol=url` por rol o una `url` sola para todos (clave '*')."""
+    out = {}
+    for spec in specs:
+        role, sep, url = spec.partition("=")
+        out[role if sep else "*"] = url if sep else spec
+    return out
+
+
+def schedule(records: list[dict], mode: str, speed: float = 1.0, qps: float = 10.0,
+             poisson: bool = False, seed: int = 0) -> list[float]:
+    """Segundos desde el inicio en que se envía cada traza (lazo abierto)."""
+    if mode == "timed":
+        t0 = records[0]["ts"] if records else 0.0
+        return [(r["ts"] - t0) / max(speed, 1e-9) for r in records]
+    rng = random.Random(seed)
+    offsets, t = [], 0.0
+    for _ in records:
+        offsets.append(t)
+        t += rng.expovariate(qps) if poisson else 1.0 / qps
+    return offsets
+
+
+class _Replayer:
+    def __init__(self, targets: dict[str, str], timeout: float, run_id: str):
+        self.targets, self.run_id = targets, run_id
+        self.client = httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=None))
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, dict[str, int]] = {}
+        self.inflight = self.max_inflight = 0
+
+    def url_for(self, rec: dict) -> str:
+        return self.targets.get(rec.get("role"), self.targets.get("*", rec["url"]))
+
+    async def send(self, rec: dict) -> None:
+        role = rec.get("role") or rec["url"]
+        body = {"role": "user", "content": {"type": "text", "text": rec.get("req", "")}}
+        if rec.get("conv"):
+            # Conversación propia de la corrida: no se mezcla con la memoria de la original.
+            body["conversation_id"] = f"{self.run_id}-{rec['conv']}"
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        t0 = time.perf_counter()
+        error = None
+        try:
+            r = await self.client.post(self.url_for(rec), json=body)
+            if r.status_code >= 400:
+                error = f"http_{r.status_code}"
+            else:
+                try:
+                    error = _body_error(r.json())
+                except ValueError:
+                    error = "bad_body"
+        except Exception as e:
+            error = type(e).__name__
+        finally:
+            self.inflight -= 1
+        self.samples.setdefault(role, []).append((time.perf_counter() - t0) * 1000)
+        if error:
+            kinds = self.errors.setdefault(role, {})
+            kinds[error] = kinds.get(error, 0) + 1
+
+
+async def replay(records: list[dict], mode: str = "timed", targets: Optional[dict[str, str]] = None,
+                 speed: float = 1.0, qps: float = 10.0, poisson: bool = False, concurrency: int = 8,
+                 timeout: float = 120.0) -> dict:
+    """Dispara `records` según `mode` y devuelve el reporte por agente."""
+    rp = _Replayer(targets or {}, timeout, run_id=f"replay-{time.time_ns()}")
+    max_lag = 0.0
+    t0 = time.perf_counter()
+    try:
+        if mode == "closed":
+            queue: asyncio.Queue = asyncio.Queue()
+            for rec in records:
+                queue.put_nowait(rec)
+
+            async def _worker():
+                while not queue.empty():
+                    await rp.send(queue.get_nowait())
+
+            await asyncio.gather(*(_worker() for _ in range(max(concurrency, 1))))
+        else:
+            tasks = []
+            for rec, at in zip(records, schedule(records, mode, speed, qps, poisson)):
+                delay = at - (time.perf_counter() - t0)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # Retraso del generador respecto del cronograma (si crece, el cliente es el cuello).
+                max_lag = max(max_lag, -delay if delay < 0 else 0.0)
+                tasks.append(asyncio.create_task(rp.send(rec)))
+            await asyncio.gather(*tasks)
+    finally:
+        await rp.client.aclose()
+    elapsed = time.perf_counter() - t0
+
+    recorded: dict[str, list[float]] = {}
+    for rec in records:
+        if "ms" in rec:
+            recorded.setdefault(rec.get("role") or rec["url"], []).append(rec["ms"])
+    agents = {}
+    for role, vals in sorted(rp.samples.items()):
+        n_err = sum(rp.errors.get(role, {}).values())
+        agents[role] = {**_percentiles(vals), "errors": n_err, "error_rate": round(n_err / len(vals), 4),
+                        "errors_by_kind": rp.errors.get(role, {}), "recorded_ms": _percentiles(recorded.get(role, []))}
+    return {"mode": mode, "requests": len(records), "elapsed_sec": round(elapsed, 3),
+            "achieved_qps": round(len(records) / elapsed, 2) if elapsed else 0.0,
+            "max_lag_ms": round(max_lag * 1000, 2), "max_inflight": rp.max_inflight, "agents": agents}
+
+
+def _print_report(report: dict) -> None:
+    print(f"{report['mode']}: {report['requests']} requests en {report['elapsed_sec']} s "
+          f"({report['achieved_qps']} qps, lag máx {report['max_lag_ms']} ms, en vuelo máx {report['max_inflight']})")
+    print(f"  {'agente':<12}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'err%':>7}   grabado p50/p95")
+    for role, a in report["agents"].items():
+        rec = a["recorded_ms"]
+        print(f"  {role:<12}{a['count']:>6}{a['p50']:>9}{a['p95']:>9}{a['p99']:>9}{a['max']:>9}"
+              f"{a['error_rate'] * 100:>6.1f}%   {rec.get('p50', '-')}/{rec.get('p95', '-')}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay de trazas A2A contra los agentes")
+    parser.add_argument("trace", help="archivo JSONL grabado con A2A_TRACE_PATH")
+    parser.add_argument("--mode", choices=("timed", "qps", "closed"), default="timed")
+    parser.add_argument("--speed", type=float, default=1.0, help="factor de aceleración en modo timed")
+    parser.add_argument("--qps", type=float, default=10.0, help="tasa de envío en modo qps")
+    parser.add_argument("--poisson", action="store_true", help="llegadas exponenciales en modo qps")
+    parser.add_argument("--concurrency", type=int, default=8, help="clientes en modo closed")
+    parser.add_argument("--role", action="append", help="sólo trazas de este rol (repetible)")
+    parser.add_argument("--target", action="append", default=[],
+                        help="rol=url o url para todos; por defecto la URL grabada")
+    parser.add_argument("--limit", type=int, help="máximo de trazas a enviar")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--stub", action="store_true",
+                        help="levanta los agentes con el LLM stub del benchmark y apunta a ellos")
+    parser.add_argument("--stub-latency-ms", type=float, default=50.0)
+    parser.add_argument("--stub-port", type=int, default=18101)
+    parser.add_argument("--out", help="escribe el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    targets = parse_targets(args.target)
+    if args.stub:
+        import benchmark
+        targets = {**benchmark._start_agents("127.0.0.1", args.stub_port, args.stub_latency_ms / 1000, 40), **targets}
+
+    records = read_trace(args.trace, set(args.role) if args.role else None, args.limit)
+    report = asyncio.run(replay(records, args.mode, targets, args.speed, args.qps, args.poisson,
+                                args.concurrency, args.timeout))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+    _print_report(report)
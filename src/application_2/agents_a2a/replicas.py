@@ -0,0 +1,161 @@
+from __future__ import annotations
+import os, time, asyncio, threading, contextlib, statistics
+from collections import deque
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+from metrics import REGISTRY
+
+A2A_HEDGE             = os.getenv("A2A_HEDGE", "0") == "1"
+A2A_HEDGE_MIN_SAMPLES = int(os.getenv("A2A_HEDGE_MIN_SAMPLES", "20"))
+A2A_EWMA_ALPHA        = float(os.getenv("A2A_EWMA_ALPHA", "0.2"))
+A2A_EJECT_FAILURES    = int(os.getenv("A2A_EJECT_FAILURES", "3"))
+A2A_EJECT_SLOW_FACTOR = float(os.getenv("A2A_EJECT_SLOW_FACTOR", "3"))
+A2A_EJECT_SEC         = float(os.getenv("A2A_EJECT_SEC", "30"))
+
+
+def parse_urls(value: str) -> list[str]:
+    """`A2A_*_URL` admite una URL o varias separadas por comas (una por réplica)."""
+    return [u.strip().rstrip("/") for u in (value or "").split(",") if u.strip()]
+
+
+class Replica:
+    __slots__ = ("url", "outstanding", "ewma_ms", "failures", "ejected_until", "samples")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.ewma_ms: Optional[float] = None
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.samples: deque[float] = deque(maxlen=256)
+
+
+class ReplicaPool:
+    """
+    Réplicas de un rol del pipeline. Elige la de menos requests en vuelo (desempata
+    por EWMA de latencia), expulsa por un tiempo las que fallan seguido o son
+    mucho más lentas que el resto, y opcionalmente cubre (hedge) una llamada lenta
+    enviando un duplicado a otra réplica tras el p95 observado.
+    """
+
+    def __init__(self, role: str, urls: list[str], hedge: bool = A2A_HEDGE):
+        if not urls:
+            raise ValueError(f"sin URLs para el rol '{role}'")
+        self.role = role
+        self.replicas = [Replica(u) for u in urls]
+        self.hedge = hedge and len(urls) > 1
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.ejections = 0
+        self._lock = threading.Lock()
+
+    def pick(self, exclude: tuple[str, ...] = ()) -> Optional[Replica]:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [r for r in self.replicas if r.url not in exclude]
+            healthy = [r for r in candidates if r.ejected_until <= now] or candidates
+            if not healthy:
+                return None
+            return min(healthy, key=lambda r: (r.outstanding, r.ewma_ms or 0.0))
+
+    def p95_ms(self) -> Optional[float]:
+        with self._lock:
+            vals = sorted(v for r in self.replicas for v in r.samples)
+        if len(vals) < A2A_HEDGE_MIN_SAMPLES:
+            return None
+        return vals[min(len(vals) - 1, int(0.95 * len(vals)))]
+
+    def _observe(self, rep: Replica, ms: float, ok: bool) -> None:
+        with self._lock:
+            rep.samples.append(ms)
+            rep.ewma_ms = ms if rep.ewma_ms is None else A2A_EWMA_ALPHA * ms + (1 - A2A_EWMA_ALPHA) * rep.ewma_ms
+            rep.failures = 0 if ok else rep.failures + 1
+            reason = "errors" if rep.failures >= A2A_EJECT_FAILURES else None
+            others = [r.ewma_ms for r in self.replicas if r is not rep and r.ewma_ms is not None]
+            if reason is None and others and len(rep.samples) >= 5:
+                typical = statistics.median(others)
+                if rep.ewma_ms > A2A_EJECT_SLOW_FACTOR * typical:
+                    reason = "slow"
+                    rep.ewma_ms = typical
+            if reason is None or rep.ejected_until > time.monotonic():
+                return
+            rep.failures = 0
+            rep.ejected_until = time.monotonic() + A2A_EJECT_SEC
+            self.ejections += 1
+        REGISTRY.inc("a2a_replica_ejections_total", role=self.role, url=rep.url, reason=reason)
+
+    @contextlib.contextmanager
+    def track(self, rep: Replica) -> Iterator[None]:
+        """Cuenta el request en vuelo en `rep` y registra su latencia/resultado al salir."""
+        with self._lock:
+            rep.outstanding += 1
+        t0 = time.perf_counter()
+        ok = True
+        try:
+            yield
+        except asyncio.CancelledError:
+            ok = None
+            raise
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            with self._lock:
+                rep.outstanding -= 1
+            if ok is not None:
+                self._observe(rep, (time.perf_counter() - t0) * 1000, ok)
+
+    def call(self, fn: Callable[[str], Any]) -> Any:
+        rep = self.pick()
+        with self.track(rep):
+            return fn(rep.url)
+
+    async def _arun(self, rep: Replica, afn: Callable[[str], Awaitable[Any]]) -> Any:
+        with self.track(rep):
+            return await afn(rep.url)
+
+    async def acall(self, afn: Callable[[str], Awaitable[Any]]) -> Any:
+        rep = self.pick()
+        delay = self.p95_ms() if self.hedge else None
+        if delay is None:
+            return await self._arun(rep, afn)
+
+        tasks = {asyncio.create_task(self._arun(rep, afn))}
+        primary = next(iter(tasks))
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay / 1000)
+            if not done:
+                backup = self.pick(exclude=(rep.url,))
+                if backup is not None:
+                    tasks.add(asyncio.create_task(self._arun(backup, afn)))
+                    self.hedged += 1
+                    REGISTRY.inc("a2a_hedged_requests_total", role=self.role)
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is None:
+                        if t is not primary:
+                            self.hedge_wins += 1
+                        return t.result()
+                    error = t.exception()
+            raise error
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "replicas": len(self.replicas),
+                "ejected": sum(1 for r in self.replicas if r.ejected_until > now),
+                "outstanding": sum(r.outstanding for r in self.replicas),
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "ejections": self.ejections,
+            }
+
+
+REGISTRY.describe("a2a_hedged_requests_total", "Requests duplicados a una segunda réplica tras el p95")
+REGISTRY.describe("a2a_replica_ejections_total", "Expulsiones temporales de réplicas por errores o lentitud")
@@ -0,0 +1,179 @@
+from __future__ import annotations
+import hashlib, json, os, re, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Optional, Union
+
+_MISSING = object()
+_WS_RX = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza una consulta para usarla como clave: minúsculas, espacios colapsados, sin puntuación en los bordes."""
+    return _WS_RX.sub(" ", (text or "").strip().lower()).strip(" ¿?¡!.,;:")
+
+
+def make_key(*parts: Any) -> str:
+    """Clave estable (sha256) a partir de partes serializables en JSON."""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LRUTTLCache:
+    """Caché en memoria con límite de tamaño (LRU), TTL por entrada y contadores."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._data.pop(key, _MISSING) is not _MISSING
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": "memory", "size": len(self), "maxsize": self.maxsize, "ttl": self.ttl,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "expirations": self.expirations, "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SQLiteTTLCache:
+    """
+    Misma interfaz que `LRUTTLCache`, persistida en SQLite (modo WAL) para que
+    las entradas sobrevivan reinicios y se compartan entre procesos. Los valores
+    se guardan como JSON. Los contadores son del proceso; `size` es global.
+    """
+
+    _EVICT_EVERY = 32
+
+    def __init__(self, path: str, maxsize: int = 10000, ttl: float = 3600.0, table: str = "cache"):
+        if not re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", table):
+            raise ValueError(f"nombre de tabla inválido: {table!r}")
+        self.path, self.maxsize, self.ttl, self.table = path, maxsize, ttl, table
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        d = os.path.dirname(os.path.abspath(path))
+        os.makedirs(d, exist_ok=True)
+        with self._conn() as c:
+            c.execute(f"CREATE TABLE IF NOT EXISTS {table} ("
+                      "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            c.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table}(accessed_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        c = self._conn()
+        row = c.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count(misses=1)
+            return default
+        value, expires_at = row
+        if expires_at <= now:
+            c.execute(f"DELETE FROM {self.table} WHERE key = ? AND expires_at <= ?", (key, now))
+            self._count(misses=1, expirations=1)
+            return default
+        c.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count(hits=1)
+        return json.loads(value)
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for name, n in deltas.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        c = self._conn()
+        c.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                  (key, json.dumps(value, ensure_ascii=False), expires_at, now))
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self._EVICT_EVERY == 0
+        if due:
+            self._evict(c, now)
+
+    def _evict(self, c: sqlite3.Connection, now: float) -> None:
+        expired = c.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,)).rowcount
+        size = c.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        over = size - self.maxsize
+        if over > 0:
+            c.execute(f"DELETE FROM {self.table} WHERE key IN "
+                      f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)", (over,))
+        self._count(expirations=max(expired, 0), evictions=max(over, 0))
+
+    def delete(self, key: str) -> bool:
+        return self._conn().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount > 0
+
+    def clear(self) -> None:
+        self._conn().execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": "sqlite", "path": self.path, "size": len(self), "maxsize": self.maxsize, "ttl": self.ttl,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "expirations": self.expirations, "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+Cache = Union[LRUTTLCache, SQLiteTTLCache]
+
+
+def make_cache(maxsize: int, ttl: float, path: Optional[str] = None, table: str = "cache") -> Optional[Cache]:
+    """Crea la caché configurada: None si maxsize <= 0, SQLite si hay `path`, memoria en otro caso."""
+    if maxsize <= 0:
+        return None
+    if path:
+        return SQLiteTTLCache(path, maxsize=maxsize, ttl=ttl, table=table)
+    return LRUTTLCache(maxsize=maxsize, ttl=ttl)
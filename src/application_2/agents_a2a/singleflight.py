@@ -0,0 +1,110 @@
+from __future__ import annotations
+import os, time, asyncio, threading, weakref
+from typing import Any, Awaitable, Callable, Optional
+
+from metrics import REGISTRY
+
+SINGLEFLIGHT_ENABLED   = os.getenv("A2A_SINGLEFLIGHT", "1") != "0"
+SINGLEFLIGHT_REUSE_SEC = float(os.getenv("A2A_SINGLEFLIGHT_REUSE_SEC", "0"))
+
+
+class SingleFlight:
+    """
+    Coalescencia de llamadas idénticas en vuelo: la primera con una clave ejecuta
+    (leader) y las concurrentes con la misma clave esperan su resultado (joined).
+    Con `reuse_sec > 0` un resultado recién terminado se reutiliza (reused) durante
+    esa ventana. Los errores se propagan a todos los que esperaban y no se guardan.
+    """
+
+    def __init__(self, reuse_sec: float = SINGLEFLIGHT_REUSE_SEC, name: str = "query"):
+        self.reuse_sec = reuse_sec
+        self.name = name
+        self._lock = threading.Lock()
+        # Las tasks quedan ligadas a su loop: lo en vuelo se indexa por loop.
+        self._tasks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Task]]" = \
+            weakref.WeakKeyDictionary()
+        self._threads: dict[str, tuple[threading.Event, dict]] = {}
+        self._recent: dict[str, tuple[float, Any]] = {}
+        self.counts = {"leader": 0, "joined": 0, "reused": 0}
+
+    def _count(self, outcome: str) -> str:
+        self.counts[outcome] += 1
+        REGISTRY.inc("a2a_singleflight_total", flight=self.name, outcome=outcome)
+        return outcome
+
+    def _reusable(self, key: str) -> Optional[tuple[Any]]:
+        hit = self._recent.get(key)
+        if hit is None:
+            return None
+        if hit[0] < time.monotonic():
+            del self._recent[key]
+            return None
+        return (hit[1],)
+
+    def _remember(self, key: str, result: Any) -> None:
+        if self.reuse_sec > 0:
+            now = time.monotonic()
+            self._recent = {k: v for k, v in self._recent.items() if v[0] >= now}
+            self._recent[key] = (now + self.reuse_sec, result)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, str]:
+        """Devuelve (resultado, outcome) con outcome en leader/joined/reused."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            reused = self._reusable(key)
+            if reused is not None:
+                return reused[0], self._count("reused")
+            tasks = self._tasks.setdefault(loop, {})
+            task = tasks.get(key)
+            outcome = self._count("joined" if task is not None else "leader")
+            if task is None:
+                task = tasks[key] = loop.create_task(fn())
+                task.add_done_callback(lambda t: self._finish(loop, key, t))
+        # shield: si un llamador se cancela, la corrida compartida sigue para los demás
+        return await asyncio.shield(task), outcome
+
+    def _finish(self, loop: asyncio.AbstractEventLoop, key: str, task: asyncio.Task) -> None:
+        with self._lock:
+            self._tasks.get(loop, {}).pop(key, None)
+            if not task.cancelled() and task.exception() is None:
+                self._remember(key, task.result())
+
+    def do_sync(self, key: str, fn: Callable[[], Any]) -> tuple[Any, str]:
+        """Variante para hilos (grafo síncrono)."""
+        with self._lock:
+            reused = self._reusable(key)
+            if reused is not None:
+                return reused[0], self._count("reused")
+            slot = self._threads.get(key)
+            if slot is None:
+                slot = self._threads[key] = (threading.Event(), {})
+                leader = True
+            else:
+                leader = False
+            outcome = self._count("leader" if leader else "joined")
+        done, box = slot
+        if not leader:
+            done.wait()
+            if "error" in box:
+                raise box["error"]
+            return box["result"], outcome
+        try:
+            box["result"] = fn()
+        except BaseException as e:
+            box["error"] = e
+            raise
+        finally:
+            with self._lock:
+                self._threads.pop(key, None)
+                if "result" in box:
+                    self._remember(key, box["result"])
+            done.set()
+        return box["result"], outcome
+
+    def stats(self) -> dict:
+        with self._lock:
+            inflight = sum(len(t) for t in self._tasks.values()) + len(self._threads)
+            return {**self.counts, "saved": self.counts["joined"] + self.counts["reused"], "inflight": inflight}
+
+
+REGISTRY.describe("a2a_singleflight_total", "Consultas por resultado de la coalescencia (leader/joined/reused)")
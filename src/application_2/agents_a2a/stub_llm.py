@@ -0,0 +1,76 @@
+from __future__ import annotations
+import asyncio, hashlib, json, re, time
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Chat model local y determinista para benchmarks sin OpenAI. Simula `latency`
+    segundos por llamada y responde `tokens` palabras derivadas del prompt.
+    A los prompts de suficiencia (si/no) responde "si", también en los lotes JSON
+    del micro-batcher del analista. Nunca llama tools, así que un agente ReAct
+    termina en una sola vuelta.
+    """
+
+    latency: float = 0.05
+    tokens: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "StubChatModel":
+        return self
+
+    def _reply(self, messages: list[BaseMessage]) -> str:
+        prompt = str(messages[-1].content if messages else "")
+        if 'exactamente "si" o "no"' in prompt or "exactamente 'si' o 'no'" in prompt:
+            return "si"
+        if '{"verdicts"' in prompt:
+            n = len(re.findall(r"^### \d+$", prompt, re.M))
+            return json.dumps({"verdicts": [{"id": i, "sufficient": "si"} for i in range(n)]})
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+        words = [f"dato{digest[i % len(digest)]}{i}" for i in range(max(self.tokens - 8, 0))]
+        return "Esta es una respuesta simulada que incluye información útil: " + " ".join(words)
+
+    def _result(self, text: str, messages: list[BaseMessage]) -> ChatResult:
+        n_in = sum(len(str(m.content).split()) for m in messages)
+        n_out = len(text.split())
+        msg = AIMessage(content=text, usage_metadata={"input_tokens": n_in, "output_tokens": n_out,
+                                                       "total_tokens": n_in + n_out})
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result(self._reply(messages), messages)
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result(self._reply(messages), messages)
+
+    def _stream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        words = self._reply(messages).split()
+        for w in words:
+            time.sleep(self.latency / max(len(words), 1))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=w + " "))
+
+    async def _astream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        words = self._reply(messages).split()
+        for w in words:
+            await asyncio.sleep(self.latency / max(len(words), 1))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=w + " "))
+
+
+def stub_chat_factory(latency: float = 0.05, tokens: int = 40) -> Callable[..., StubChatModel]:
+    """Reemplazo de `ChatOpenAI(...)`: ignora model/temperature/etc. y devuelve el stub."""
+    def _factory(*args: Any, **kwargs: Any) -> StubChatModel:
+        return StubChatModel(latency=latency, tokens=tokens)
+    return _factory
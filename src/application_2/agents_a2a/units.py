@@ -0,0 +1,101 @@
+from __future__ import annotations
+from collections import deque
+from typing import Iterable, Optional, Sequence, Union
+
+Affine = tuple[float, float]  # destino = origen * escala + desplazamiento
+
+# Aristas del grafo de unidades: (desde, hacia, escala, desplazamiento). Las
+# inversas se agregan solas; cualquier par de la misma dimensión se resuelve
+# componiendo el camino entre ambas unidades.
+_EDGES: list[tuple[str, str, float, float]] = [
+    # longitud
+    ("km", "m", 1000.0, 0.0), ("m", "cm", 100.0, 0.0), ("cm", "mm", 10.0, 0.0),
+    ("in", "cm", 2.54, 0.0), ("ft", "in", 12.0, 0.0), ("yd", "ft", 3.0, 0.0),
+    ("mi", "ft", 5280.0, 0.0), ("nmi", "m", 1852.0, 0.0),
+    # masa
+    ("kg", "g", 1000.0, 0.0), ("g", "mg", 1000.0, 0.0), ("t", "kg", 1000.0, 0.0),
+    ("lb", "kg", 0.45359237, 0.0), ("lb", "oz", 16.0, 0.0),
+    # temperatura
+    ("c", "k", 1.0, 273.15), ("c", "f", 9 / 5, 32.0),
+    # volumen
+    ("l", "ml", 1000.0, 0.0), ("m3", "l", 1000.0, 0.0), ("gal", "l", 3.785411784, 0.0),
+    # tiempo
+    ("min", "s", 60.0, 0.0), ("h", "min", 60.0, 0.0), ("d", "h", 24.0, 0.0),
+    # velocidad
+    ("mps", "kmh", 3.6, 0.0), ("mph", "kmh", 1.609344, 0.0), ("kn", "kmh", 1.852, 0.0),
+]
+
+_ALIASES = {
+    "kilometro": "km", "kilometros": "km", "kilómetro": "km", "kilómetros": "km",
+    "metro": "m", "metros": "m", "milla": "mi", "millas": "mi", "pulgada": "in", "pulgadas": "in",
+    "pie": "ft", "pies": "ft", "kilo": "kg", "kilos": "kg", "gramo": "g", "gramos": "g",
+    "libra": "lb", "libras": "lb", "onza": "oz", "onzas": "oz",
+    "°c": "c", "celsius": "c", "°f": "f", "fahrenheit": "f", "kelvin": "k",
+    "litro": "l", "litros": "l", "galon": "gal", "galón": "gal", "galones": "gal",
+    "seg": "s", "segundo": "s", "segundos": "s", "minuto": "min", "minutos": "min",
+    "hora": "h", "horas": "h", "dia": "d", "día": "d", "dias": "d", "días": "d",
+    "km/h": "kmh", "m/s": "mps", "nudos": "kn",
+}
+
+_LABELS = {"c": "°C", "f": "°F", "k": "K", "m3": "m³", "kmh": "km/h", "mps": "m/s"}
+
+
+def _build_table(edges: Iterable[tuple[str, str, float, float]]) -> dict[tuple[str, str], Affine]:
+    """BFS desde cada unidad componiendo transformaciones afines sobre el grafo."""
+    graph: dict[str, list[tuple[str, float, float]]] = {}
+    for a, b, s, o in edges:
+        graph.setdefault(a, []).append((b, s, o))
+        graph.setdefault(b, []).append((a, 1 / s, -o / s))
+    table: dict[tuple[str, str], Affine] = {}
+    for src in graph:
+        seen = {src: (1.0, 0.0)}
+        queue = deque([src])
+        while queue:
+            u = queue.popleft()
+            s1, o1 = seen[u]
+            for v, s2, o2 in graph[u]:
+                if v not in seen:
+                    seen[v] = (s1 * s2, o1 * s2 + o2)
+                    queue.append(v)
+        for dst, affine in seen.items():
+            table[(src, dst)] = affine
+    return table
+
+
+_TABLE = _build_table(_EDGES)
+UNITS = frozenset(u for pair in _TABLE for u in pair)
+
+
+def canonical(unit: str) -> Optional[str]:
+    u = (unit or "").strip().lower()
+    u = _ALIASES.get(u, u)
+    return u if u in UNITS else None
+
+
+def label(unit: str) -> str:
+    return _LABELS.get(unit, unit)
+
+
+def factor(from_unit: str, to_unit: str) -> Optional[Affine]:
+    fu, tu = canonical(from_unit), canonical(to_unit)
+    if fu is None or tu is None:
+        return None
+    return _TABLE.get((fu, tu))
+
+
+def convert(values: Union[float, Sequence[float]], from_unit: str, to_unit: str) -> Union[float, list[float]]:
+    """
+    Convierte un valor o una lista de valores en una sola pasada (vectorizada con
+    numpy si está disponible). Lanza ValueError si el par no es convertible.
+    """
+    affine = factor(from_unit, to_unit)
+    if affine is None:
+        raise ValueError(f"conversión no soportada: {from_unit} -> {to_unit}")
+    s, o = affine
+    if isinstance(values, (int, float)):
+        return float(values) * s + o
+    try:
+        import numpy as np  # diferido y opcional: sin numpy se cae a listas de Python
+    except ImportError:
+        return [float(v) * s + o for v in values]
+    return (np.asarray(values, dtype=float) * s + o).tolist()